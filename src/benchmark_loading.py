@@ -0,0 +1,90 @@
+"""Script comparing the speed of the old and the new way of loading the data.
+
+The old way reads every .dat file one after the other with np.loadtxt. The new
+way spreads the session folders and test files over a pool of processes, and
+parses the files with a faster whitespace separated float parser.
+
+Usage: python benchmark_loading.py [<path_to_data_folder>] [<num_workers>]
+"""
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+import data
+
+
+def _legacy_load_train(train_data_folder):
+    """Loads the train data one np.loadtxt call at a time."""
+    activities = data._load_activities(train_data_folder)
+    sessions = []
+    for session_folder in data._get_all_session_folders(train_data_folder):
+        data_files = sorted(glob.glob(os.path.join(
+            session_folder, data.INTERVAL_FILE_TEMPLATE)))
+        raw_data = [np.loadtxt(data_file) for data_file in data_files]
+        sessions.append(data._load_session(session_folder, activities, raw_data))
+    return sessions
+
+
+def _legacy_load_test(test_data_folder):
+    """Loads the test data one np.loadtxt call at a time."""
+    all_fnames = sorted(data._get_all_test_filenames(test_data_folder))
+    return [
+        data._load_test_interval(fname, np.loadtxt(fname))
+        for fname in all_fnames]
+
+
+def _time(function, *args):
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+def _assert_equal_intervals(old_intervals, new_intervals):
+    assert len(old_intervals) == len(new_intervals)
+    for old, new in zip(old_intervals, new_intervals):
+        assert old.id == new.id and old.time == new.time
+        assert old.data.shape == new.data.shape
+        np.testing.assert_array_equal(old.data, new.data)
+
+
+def main(data_folder, num_workers=None):
+    train_folder = os.path.join(data_folder, 'Train')
+    test_folder = os.path.join(data_folder, 'Test')
+
+    old_train, old_train_time = _time(_legacy_load_train, train_folder)
+    new_train, new_train_time = _time(data.load_train, train_folder, num_workers)
+    assert [s.id for s in old_train] == [s.id for s in new_train]
+    for old_session, new_session in zip(old_train, new_train):
+        assert old_session[:4] == new_session[:4]
+        _assert_equal_intervals(old_session.intervals, new_session.intervals)
+
+    old_test, old_test_time = _time(_legacy_load_test, test_folder)
+    new_test, new_test_time = _time(data.load_test, test_folder, num_workers)
+    _assert_equal_intervals(old_test, new_test)
+
+    nr_files = sum(len(s.intervals) for s in new_train) + len(new_test)
+    print 'Loaded %d .dat files, results are identical' % nr_files
+    print '%-6s %12s %12s %9s' % ('', 'old (s)', 'new (s)', 'speedup')
+    for name, old_time, new_time in [('train', old_train_time, new_train_time),
+                                     ('test', old_test_time, new_test_time)]:
+        print '%-6s %12.3f %12.3f %8.1fx' % (
+            name, old_time, new_time, old_time / max(new_time, 1e-9))
+
+
+def _parse_args(args):
+    if len(args) > 3:
+        print ('Usage: python benchmark_loading.py [<path_to_data_folder>] '
+               '[<num_workers>]')
+        return
+    data_folder = args[1] if len(args) > 1 else data.DEFAULT_DATA_LOCATION
+    num_workers = int(args[2]) if len(args) > 2 else None
+    return data_folder, num_workers
+
+
+if __name__ == '__main__':
+    arguments = _parse_args(sys.argv)
+    if arguments:
+        main(*arguments)
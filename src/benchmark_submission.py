@@ -0,0 +1,71 @@
+"""Script comparing the speed of the old and the new submission writer.
+
+The old writer formats every probability separately and writes the rows one
+by one through csv.writer. The new writer formats blocks of rows at once.
+
+Usage: python benchmark_submission.py [<nr_rows>]
+"""
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import create_submission
+import utils
+
+
+def _legacy_write_predictions_to_csv(predictions, out_path):
+    with open(out_path, 'wb') as outfile:
+        csvwriter = csv.writer(
+            outfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+        csvwriter.writerow(
+            ['Id'] + ['subject_{}'.format(s) for s in create_submission._SUBJECT_IDS])
+        for idx, prediction in enumerate(predictions):
+            assert len(prediction) == len(create_submission._SUBJECT_IDS)
+            csvwriter.writerow(
+                [str(idx)] +
+                ["%.18f" % p for p in prediction])
+
+
+def _time(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def main(nr_rows=100000):
+    temp_folder = tempfile.mkdtemp()
+    try:
+        predictions = np.random.dirichlet(
+            np.ones(len(create_submission._SUBJECT_IDS)), size=nr_rows)
+        in_path = os.path.join(temp_folder, 'predictions.npy')
+        utils.dump_npy(predictions, in_path)
+        predictions = utils.load_npy(in_path, mmap_mode='r')
+
+        old_path = os.path.join(temp_folder, 'old.csv')
+        new_path = os.path.join(temp_folder, 'new.csv')
+        old_time = _time(_legacy_write_predictions_to_csv, predictions, old_path)
+        new_time = _time(
+            create_submission.write_predictions_to_csv, predictions, new_path)
+        gzip_time = _time(
+            create_submission.write_predictions_to_csv, predictions,
+            new_path + '.gz')
+        with open(old_path, 'rb') as old_file, open(new_path, 'rb') as new_file:
+            assert old_file.read() == new_file.read()
+
+        print 'Wrote %d rows, the old and new csv files are identical' % nr_rows
+        print '%-10s %10s %9s' % ('', 'time (s)', 'speedup')
+        for name, run_time in [('old', old_time), ('new', new_time),
+                               ('new, gzip', gzip_time)]:
+            print '%-10s %10.3f %8.1fx' % (
+                name, run_time, old_time / max(run_time, 1e-9))
+    finally:
+        shutil.rmtree(temp_folder)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
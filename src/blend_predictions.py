@@ -0,0 +1,195 @@
+"""Script blending multiple prediction files into a single prediction file.
+
+The prediction files are memory-mapped, and blended in bounded-size chunks of
+rows, so any number of them can be combined without loading them. The blend
+is a weighted arithmetic or geometric mean. The weights are either given, or
+fitted to minimize the log-loss of the blend on held-out predictions, with
+multiple restarts in parallel.
+
+Usage: python blend_predictions.py <predictions.npy> [<predictions.npy> ...]
+           [--geometric] [--weights <w> ...]
+           [--heldout <heldout_predictions.npy> ... --labels <labels.npy>]
+           [--out <path_to_output.npy>]
+The held-out prediction files should be given in the same order as the
+prediction files, and the labels hold the subject of every held-out row.
+"""
+import argparse
+import multiprocessing
+import os
+
+import numpy as np
+from scipy import optimize
+
+import metrics
+import utils
+
+BLEND_PREDICTIONS_BASENAME = os.path.join('Predictions', 'blend')
+# Number of rows blended at once
+DEFAULT_CHUNK_SIZE = 100000
+
+# Held-out data shared with the weight fitting worker processes, which
+# inherit it when they are forked instead of receiving a pickled copy
+_fit_data = None
+
+
+def open_predictions(paths):
+    """Memory-maps the prediction files, checking their shapes match."""
+    all_predictions = [utils.load_npy(path, mmap_mode='r') for path in paths]
+    shapes = set(predictions.shape for predictions in all_predictions)
+    if len(shapes) != 1:
+        raise ValueError(
+            'All prediction files should have the same shape, but got %s' %
+            sorted(shapes))
+    return all_predictions
+
+
+def _blend_chunk(chunks, weights, geometric=False):
+    """Blends the same rows of every prediction file."""
+    if geometric:
+        log_blend = sum(
+            weight * np.log(np.clip(chunk, metrics.EPSILON, 1))
+            for weight, chunk in zip(weights, chunks))
+        blend = np.exp(log_blend - log_blend.max(axis=1)[:, np.newaxis])
+    else:
+        blend = sum(weight * chunk for weight, chunk in zip(weights, chunks))
+    return blend / blend.sum(axis=1)[:, np.newaxis]
+
+
+def _normalize_weights(weights, nr_predictions):
+    if weights is None:
+        weights = np.ones(nr_predictions)
+    weights = np.asarray(weights, dtype=float)
+    if len(weights) != nr_predictions or (weights < 0).any() or not weights.sum():
+        raise ValueError(
+            'Expected %d non-negative weights, but got %s' % (
+                nr_predictions, weights))
+    return weights / weights.sum()
+
+
+def blend(all_predictions, weights=None, geometric=False, out_path=None,
+          chunk_size=DEFAULT_CHUNK_SIZE):
+    """Blends the predictions, in chunks of rows.
+
+    Args:
+      all_predictions: list of (memory-mapped) prediction arrays.
+      weights: the weight of each of the predictions, defaults to equal
+          weights. They are normalized to sum to one.
+      geometric: flag indicating whether a weighted geometric mean should be
+          taken instead of a weighted arithmetic mean.
+      out_path: optional .npy path. When given, the blend is written to it
+          chunk by chunk and returned memory-mapped.
+      chunk_size: number of rows blended at once.
+
+    Returns:
+      The blended predictions, normalized to sum to one for every row.
+    """
+    weights = _normalize_weights(weights, len(all_predictions))
+    shape = all_predictions[0].shape
+    if out_path is None:
+        blended = np.empty(shape)
+    else:
+        utils._make_dir(out_path)
+        blended = np.lib.format.open_memmap(
+            out_path, mode='w+', dtype=float, shape=shape)
+    for start in xrange(0, shape[0], chunk_size):
+        chunks = [predictions[start:start + chunk_size]
+                  for predictions in all_predictions]
+        blended[start:start + chunk_size] = _blend_chunk(
+            chunks, weights, geometric)
+    if out_path is not None:
+        blended.flush()
+    return blended
+
+
+def _blend_loss(parameters):
+    """Log-loss of the blend with the softmax of the parameters as weights."""
+    all_predictions, labels, geometric = _fit_data
+    weights = np.exp(parameters - parameters.max())
+    return metrics.log_loss(
+        _blend_chunk(all_predictions, weights / weights.sum(), geometric),
+        labels)
+
+
+def _fit_from(parameters):
+    result = optimize.minimize(_blend_loss, parameters, method='L-BFGS-B')
+    return result.fun, result.x
+
+
+def fit_weights(heldout_paths, labels, geometric=False, nr_restarts=8,
+                num_workers=None, random_state=None):
+    """Fits the blend weights minimizing the log-loss on held-out predictions.
+
+    The weights are the softmax of free parameters, optimized with L-BFGS-B
+    from multiple random starting points, which run in parallel.
+
+    Args:
+      heldout_paths: the held-out prediction file of each of the predictors.
+      labels: the subject of every held-out row.
+      geometric: flag indicating whether to fit a weighted geometric mean.
+      nr_restarts: number of starting points, the first being equal weights.
+      num_workers: number of worker processes. Defaults to the number of cores.
+      random_state: seed of the random starting points.
+
+    Returns:
+      The weight of each predictor, summing to one, and its held-out log-loss.
+    """
+    global _fit_data
+    all_predictions = [np.asarray(predictions)
+                       for predictions in open_predictions(heldout_paths)]
+    random_state = np.random.RandomState(random_state)
+    starts = [np.zeros(len(all_predictions))] + [
+        random_state.randn(len(all_predictions))
+        for _ in range(nr_restarts - 1)]
+
+    _fit_data = all_predictions, np.asarray(labels), geometric
+    try:
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        if min(num_workers, len(starts)) <= 1:
+            results = map(_fit_from, starts)
+        else:
+            pool = multiprocessing.Pool(min(num_workers, len(starts)))
+            try:
+                results = pool.map(_fit_from, starts, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _fit_data = None
+
+    loss, parameters = min(results, key=lambda result: result[0])
+    weights = np.exp(parameters - parameters.max())
+    return weights / weights.sum(), loss
+
+
+def main(prediction_paths, weights=None, geometric=False, heldout_paths=None,
+         labels_path=None, out_path=None):
+    if heldout_paths:
+        if len(heldout_paths) != len(prediction_paths) or not labels_path:
+            raise ValueError(
+                'Give one held-out file per prediction file, and the labels')
+        weights, loss = fit_weights(
+            heldout_paths, utils.load_npy(labels_path), geometric)
+        print 'Fitted weights %s, held-out log-loss %.5f' % (
+            np.round(weights, 4).tolist(), loss)
+    if out_path is None:
+        out_path = utils.generate_unqiue_file_name(
+            BLEND_PREDICTIONS_BASENAME, 'npy')
+    blend(open_predictions(prediction_paths), weights, geometric, out_path)
+    print 'Dumped blended predictions to %s' % out_path
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Blends multiple prediction files into one.')
+    parser.add_argument('prediction_paths', nargs='+')
+    parser.add_argument('--weights', nargs='+', type=float)
+    parser.add_argument('--geometric', action='store_true')
+    parser.add_argument('--heldout', nargs='+', dest='heldout_paths')
+    parser.add_argument('--labels', dest='labels_path')
+    parser.add_argument('--out', dest='out_path')
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main(**_parse_args())
@@ -0,0 +1,167 @@
+"""Module computing and merging per-channel statistics of raw samples.
+
+For every channel, the statistics hold the number of finite values, their sum,
+sum of squares, minimum and maximum, the number of NaN and Inf values, and a
+quantile sketch. The sketch stores the values of the channel at a fixed grid
+of probabilities, which is denser towards both tails, so extreme percentiles
+such as the outlier bounds are still resolved well.
+
+Statistics of disjoint sets of samples are merged without the samples: the
+counts and sums add up, the extremes are combined, and the sketches are merged
+by averaging their cumulative distributions, weighted by their counts. So the
+statistics of every session can be computed once, while loading the data, and
+merged into the statistics of the whole train data whenever sessions change.
+
+Example:
+  stats = channel_stats.merge([channel_stats.compute(session.signal)
+                               for session in sessions])
+  bounds = channel_stats.percentiles(stats, (0.1, 99.9))
+"""
+import collections
+
+import numpy as np
+
+# Number of values stored per channel in a quantile sketch
+NR_QUANTILES = 257
+# The probabilities of the sketch values, from 0 (the minimum) to 1 (the
+# maximum), spaced like Chebyshev nodes to be dense near both tails
+QUANTILE_GRID = (1 - np.cos(np.pi * np.arange(NR_QUANTILES) /
+                            (NR_QUANTILES - 1))) / 2
+
+ChannelStats = collections.namedtuple(
+    'ChannelStats',
+    [
+        'nr_rows',  # The number of samples
+        'count',  # The number of finite values of every channel
+        'nan_count',  # The number of NaN values of every channel
+        'inf_count',  # The number of positive or negative infinities
+        'sum',  # The sum of the finite values of every channel
+        'sum_squares',  # The sum of their squares
+        'min',  # The smallest finite value, NaN when there is none
+        'max',  # The largest finite value, NaN when there is none
+        'quantiles',  # The values at QUANTILE_GRID, one column per channel
+    ])
+
+
+def compute(samples):
+    """Computes the statistics of every channel in one pass over samples.
+
+    Args:
+      samples: array with one row per sample and one column per channel. A
+          1-D array is taken to be a single sample.
+
+    Returns:
+      The ChannelStats, all accumulated in float64.
+    """
+    values = np.asarray(samples, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[np.newaxis]
+    nan = np.isnan(values)
+    inf = np.isinf(values)
+    finite = ~(nan | inf)
+    count = finite.sum(axis=0)
+    finite_values = np.where(finite, values, 0.)
+
+    # Sorting puts the non finite values, replaced by NaN, last
+    ordered = np.sort(np.where(finite, values, np.nan), axis=0)
+    quantiles = np.full((NR_QUANTILES, values.shape[1]), np.nan)
+    if len(values):
+        positions = QUANTILE_GRID[:, np.newaxis] * np.maximum(count - 1, 0)
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.minimum(lower + 1, np.maximum(count - 1, 0))
+        fractions = positions - lower
+        quantiles = ((1 - fractions) * np.take_along_axis(ordered, lower, 0) +
+                     fractions * np.take_along_axis(ordered, upper, 0))
+
+    return ChannelStats(
+        len(values), count, nan.sum(axis=0), inf.sum(axis=0),
+        finite_values.sum(axis=0), np.square(finite_values).sum(axis=0),
+        quantiles[0].copy(), quantiles[-1].copy(), quantiles)
+
+
+def _merge_sketches(quantiles, count, other_quantiles, other_count):
+    """Merges two quantile sketches, weighting them by their counts."""
+    merged = np.empty_like(quantiles)
+    for channel in range(quantiles.shape[1]):
+        if not other_count[channel]:
+            merged[:, channel] = quantiles[:, channel]
+        elif not count[channel]:
+            merged[:, channel] = other_quantiles[:, channel]
+        else:
+            values = np.sort(np.concatenate(
+                [quantiles[:, channel], other_quantiles[:, channel]]))
+            probabilities = (
+                count[channel] *
+                np.interp(values, quantiles[:, channel], QUANTILE_GRID) +
+                other_count[channel] *
+                np.interp(values, other_quantiles[:, channel], QUANTILE_GRID)
+            ) / float(count[channel] + other_count[channel])
+            merged[:, channel] = np.interp(QUANTILE_GRID, probabilities, values)
+    return merged
+
+
+def _merge_two(stats, other_stats):
+    return ChannelStats(
+        stats.nr_rows + other_stats.nr_rows,
+        stats.count + other_stats.count,
+        stats.nan_count + other_stats.nan_count,
+        stats.inf_count + other_stats.inf_count,
+        stats.sum + other_stats.sum,
+        stats.sum_squares + other_stats.sum_squares,
+        np.fmin(stats.min, other_stats.min),
+        np.fmax(stats.max, other_stats.max),
+        _merge_sketches(stats.quantiles, stats.count,
+                        other_stats.quantiles, other_stats.count))
+
+
+def merge(all_stats):
+    """Merges the statistics of disjoint sets of samples of the same channels.
+
+    The statistics are merged pairwise, in a balanced tree, which keeps the
+    error of the merged sketch small when merging many of them.
+
+    Args:
+      all_stats: iterable of ChannelStats.
+
+    Returns:
+      The merged ChannelStats, or None when there are none.
+    """
+    all_stats = list(all_stats)
+    if not all_stats:
+        return None
+    while len(all_stats) > 1:
+        merged = [_merge_two(stats, other_stats) for stats, other_stats in
+                  zip(all_stats[::2], all_stats[1::2])]
+        if len(all_stats) % 2:
+            merged.append(all_stats[-1])
+        all_stats = merged
+    return all_stats[0]
+
+
+def mean(stats):
+    """The mean of the finite values of every channel, NaN when there are none."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return stats.sum / stats.count
+
+
+def variance(stats):
+    """The population variance of the finite values of every channel."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.maximum(stats.sum_squares / stats.count - mean(stats) ** 2, 0)
+
+
+def percentiles(stats, percentiles_to_compute):
+    """Approximates percentiles of every channel from the sketch.
+
+    Args:
+      stats: the ChannelStats.
+      percentiles_to_compute: sequence of percentiles between 0 and 100.
+
+    Returns:
+      Array with one row per percentile and one column per channel, like
+      np.percentile(samples, percentiles_to_compute, axis=0).
+    """
+    probabilities = np.asarray(percentiles_to_compute, dtype=float) / 100
+    return np.array([
+        np.interp(probabilities, QUANTILE_GRID, stats.quantiles[:, channel])
+        for channel in range(stats.quantiles.shape[1])]).T
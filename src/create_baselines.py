@@ -8,7 +8,7 @@ import utils
 import pandas
 from sklearn import linear_model
 
-NR_SUBJECTS = 8
+NR_SUBJECTS = data.NR_SUBJECTS
 
 UNIFORM_PREDICTIONS_BASENAME = os.path.join('Predictions', 'uniform')
 AVG_PREDICTIONS_BASENAME = os.path.join('Predictions', 'average')
@@ -1,36 +1,66 @@
 """Simple script for generating Kaggle compatible test set predictions.
 
 Usage: python create_submission.py <path_to_predictions.npy> [path_to_output.csv]
+Output paths ending with .gz are gzip compressed.
 """
-import csv
-import os
+import gzip
 import sys
 
+import numpy as np
+
 import utils
 
 _SUBJECT_IDS = range(1, 9)
+# Line terminator of the csv module, which was used to write the files before
+_LINE_TERMINATOR = '\r\n'
+# Number of rows formatted at once
+DEFAULT_CHUNK_SIZE = 10000
 
 
-def write_predictions_to_csv(predictions, out_path):
+def write_predictions_to_csv(predictions, out_path, precision=18,
+                             chunk_size=DEFAULT_CHUNK_SIZE, compress=None):
     """Writes the predictions to a csv file.
     Assumes the predictions are ordered by test interval id.
+
+    The rows are formatted in blocks of chunk_size rows with a single string
+    formatting operation per block, and streamed to disk block by block, so
+    memory-mapped predictions are never loaded fully.
+
+    Args:
+      predictions: 2D array-like with the predictions for each test interval.
+      out_path: path of the csv file.
+      precision: number of digits written after the decimal point.
+      chunk_size: number of rows formatted at once.
+      compress: flag indicating whether the output should be gzip compressed.
+          Defaults to compressing when out_path ends with .gz.
     """
-    with open(out_path, 'wb') as outfile:
-        # Initialise the writer
-        csvwriter = csv.writer(
-            outfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
+    predictions = np.asarray(predictions)
+    if predictions.ndim != 2 or predictions.shape[1] != len(_SUBJECT_IDS):
+        raise ValueError(
+            'Expected predictions of shape (n, %d), but got %s instead' % (
+                len(_SUBJECT_IDS), predictions.shape))
+    if compress is None:
+        compress = out_path.endswith('.gz')
+    row_format = ','.join(
+        ['%d'] + ['%%.%df' % precision] * len(_SUBJECT_IDS)) + _LINE_TERMINATOR
+
+    # A fast compression level, as the default of 9 dominates the run time
+    outfile = (gzip.open(out_path, 'wb', 1) if compress
+               else open(out_path, 'wb'))
+    with outfile:
         # Write the header
-        csvwriter.writerow(['Id'] + ['subject_{}'.format(s) for s in _SUBJECT_IDS])
-        # Write the rows using 18 digit precision
-        for idx, prediction in enumerate(predictions):
-            assert len(prediction) == len(_SUBJECT_IDS)
-            csvwriter.writerow(
-                [str(idx)] +
-                ["%.18f" % p for p in prediction])
+        outfile.write(','.join(
+            ['Id'] + ['subject_{}'.format(s) for s in _SUBJECT_IDS]) + _LINE_TERMINATOR)
+        for start in xrange(0, len(predictions), chunk_size):
+            block = np.asarray(predictions[start:start + chunk_size], dtype=float)
+            ids = np.arange(start, start + len(block))
+            # Interleave the ids with the predictions, row by row
+            values = np.column_stack((ids, block)).ravel().tolist()
+            outfile.write((row_format * len(block)) % tuple(values))
 
 
 def main(in_path, out_path):
-    predictions = utils.load_npy(in_path)
+    predictions = utils.load_npy(in_path, mmap_mode='r')
     write_predictions_to_csv(predictions, out_path)
     print 'Generated predictions file %s' % out_path
 
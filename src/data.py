@@ -1,6 +1,6 @@
 """Module for loading the train and test data.
 
-This module supports loading the data in two seperate ways.
+This module supports loading the data in three seperate ways.
 The first, which is done by calling the load_train and load_test functions,
 opens and parses the .dat files one by one, storing the content in numpy
 Arrays. This way of loading the data can be slow.
@@ -8,16 +8,32 @@ The second way of loading the data is by opening a pickle file containing the
 results of the load_train and load_test functions. To create this pickle file,
 call the create_data_pickle function once. Afterwards, you will be able to
 quickly load the data using the load_data_pickle function.
+The third way stores all the data in one memory-mapped sample matrix, next to
+a few small index arrays. Create it once by calling create_columnar_data, and
+afterwards load_columnar_data opens it near instantly, sharing the memory
+between all the processes using it.
+For work that needs a single pass over the data, iter_train_sessions and
+iter_test_intervals read the .dat files one session or interval at a time,
+so the memory stays the same however much data there is.
 """
 import collections
 import csv
+import functools
 import glob
+import hashlib
+import itertools
+import multiprocessing
 import os
+import Queue
 import re
+import StringIO
+import threading
 import warnings
 
 import numpy as np
 
+import channel_stats
+import instrumentation
 import utils
 
 ## Default data folder names ##
@@ -35,10 +51,40 @@ INTERVAL_FILE_TEMPLATE = _digit*5 + '_' + _digit*3 + '.dat'
 TEST_FILE_TEMPLATE = _digit*6 + '.dat'
 # Metadata files
 ACTIVITIES_FILE_NAME = 'activities.csv'
+# Duration of every interval in seconds, consecutive intervals overlap
+INTERVAL_DURATION = 2.
+# Number of subjects, with ids 1 to NR_SUBJECTS
+NR_SUBJECTS = 8
+# Type of the loaded samples. Loading them as np.float32 halves the memory,
+# and every later step keeps that type
+DEFAULT_DTYPE = np.float64
+
+# Number of sessions and test intervals read ahead while iterating over them
+DEFAULT_SESSION_PREFETCH = 2
+DEFAULT_INTERVAL_PREFETCH = 64
 # Data pickle file location
 DEFAULT_PICKLE_PATH = os.path.join(DEFAULT_DATA_LOCATION, 'data.pkl')
 PARSED_PICKLE_PATH = os.path.join(DEFAULT_DATA_LOCATION, 'parsed_data.pkl')
 PROCESSED_PICKLE_PATH = os.path.join(DEFAULT_DATA_LOCATION, 'processed_data.pkl')
+SPECTRAL_PICKLE_PATH = os.path.join(DEFAULT_DATA_LOCATION, 'spectral_data.pkl')
+# Memory-mapped columnar data folder location
+DEFAULT_COLUMNAR_PATH = os.path.join(DEFAULT_DATA_LOCATION, 'columnar')
+# Per-channel statistics stored in a columnar data folder
+CHANNEL_STATS_FILE_NAME = 'channel_stats.pkl'
+# Number of test intervals whose statistics are computed at once
+_STATS_CHUNK_SIZE = 1024
+# Names of the arrays stored in the columnar data folder
+_COLUMNAR_ARRAYS = [
+    'samples',  # All the raw data of all the intervals, stacked row-wise
+    'row_offsets',  # Row offset of each interval in samples, plus the total
+    'interval_ids',  # The name of the file containing the interval data
+    'interval_times',  # Start time of each interval, nan for test intervals
+    'interval_sessions',  # Index of the session of each interval, -1 for test
+    'session_ids',  # The name of the folder containing the session data
+    'session_numbers',  # The session number for that subject
+    'session_subjects',  # The id of the subject
+    'session_activities',  # The activity, empty when there is none
+]
 
 
 ## Classes to store the parsed data in. ##
@@ -52,7 +98,11 @@ Session = collections.namedtuple(
         'subject',  # The id of the subject
         'activity',  # The activity the subject is performing
         'intervals',  # Sorted list of 2s intervals of recorded data
+        'signal',  # Deduplicated recording of the whole session, or None
+        'offsets',  # Start and stop row in the signal of every interval
     ])
+# Sessions pickled before the signal was kept have none
+Session.__new__.__defaults__ = (None, None)
 Interval = collections.namedtuple(
     'Interval',
     [
@@ -88,8 +138,191 @@ def _get_all_session_folders(train_data_folder):
         SESSION_FOLDER_TEMPLATE))
 
 
-def _load_session(session_folder_name, activities_map=None):
-    """Loads all the data for a particular session"""
+def _line_lengths(content):
+    """The number of whitespace separated fields of every non-blank line."""
+    characters = np.frombuffer(content, dtype=np.uint8)
+    newlines = characters == ord('\n')
+    spaces = (newlines | (characters == ord(' ')) | (characters == ord('\t')) |
+              (characters == ord('\r')))
+    # A field starts at every non-space character following a space
+    field_starts = ~spaces
+    field_starts[1:] &= spaces[:-1]
+    lines = np.cumsum(newlines)[field_starts]
+    lengths = np.bincount(lines) if len(lines) else lines
+    return lengths[lengths > 0]
+
+
+def parse_dat_text(content, dtype=DEFAULT_DTYPE):
+    """Parses the whitespace separated content of a .dat file into a numpy Array.
+
+    Parses the whole content with a single call to np.fromstring, which is a
+    lot faster than np.loadtxt. Falls back on np.loadtxt whenever the content
+    is not a rectangular block of numbers (e.g. when it contains comments, or
+    lines of different lengths), so the result is always identical to what
+    np.loadtxt would return.
+    """
+    line_lengths = _line_lengths(content)
+    if not len(line_lengths) or (line_lengths != line_lengths[0]).any():
+        return np.loadtxt(StringIO.StringIO(content), dtype=dtype)
+    nr_rows, nr_columns = len(line_lengths), line_lengths[0]
+    values = np.fromstring(content, dtype=dtype, sep=' ')
+    if values.size != nr_rows * nr_columns:
+        return np.loadtxt(StringIO.StringIO(content), dtype=dtype)
+    # np.loadtxt squeezes single row and single column files
+    if nr_rows == 1 and nr_columns == 1:
+        return values.reshape(())
+    if nr_rows == 1 or nr_columns == 1:
+        return values
+    return values.reshape(nr_rows, nr_columns)
+
+
+def _read_dat_file(data_file, dtype=DEFAULT_DTYPE):
+    """Reads a whitespace separated .dat file into a numpy Array."""
+    with open(data_file, 'rb') as dat_file:
+        return parse_dat_text(dat_file.read(), dtype)
+
+
+def _get_session_data_files(session_folder_name):
+    """Retrieves all .dat file names of a session, sorted by time."""
+    # By sorting them by name, they are automatically sorted by time.
+    return sorted(glob.glob(os.path.join(
+        session_folder_name, INTERVAL_FILE_TEMPLATE)))
+
+
+def _read_session_data(session_folder_name, dtype=DEFAULT_DTYPE):
+    """Reads the raw data of all the intervals in a session, sorted by time."""
+    return [
+        _read_dat_file(data_file, dtype)
+        for data_file in _get_session_data_files(session_folder_name)]
+
+
+def _equal_rows(rows, other_rows):
+    """Checks whether two blocks of rows are equal, counting NaN equal to NaN."""
+    return bool(((rows == other_rows) |
+                 (np.isnan(rows) & np.isnan(other_rows))).all())
+
+
+def _nr_columns(all_data):
+    """The number of columns of raw interval data, from its first 2D block.
+
+    np.loadtxt squeezes single row and single column files into 1D arrays, so
+    a 1D block alone does not tell its shape. When no block is 2D, every block
+    is taken to be a single column.
+    """
+    for interval_data in all_data:
+        if np.ndim(interval_data) == 2:
+            return np.shape(interval_data)[1]
+    return 1
+
+
+def _as_rows(interval_data, nr_columns):
+    """Reshapes raw interval data, squeezed or not, into a 2D block of rows."""
+    return np.reshape(interval_data, (-1, nr_columns))
+
+
+def _build_session_signal(interval_times, raw_data):
+    """Merges the overlapping intervals of a session into one signal.
+
+    Consecutive intervals are expected to overlap by the number of rows
+    corresponding to the difference of their start times. Every overlap is
+    verified by comparing the data, and only stored once.
+
+    Args:
+      interval_times: the start time of every interval, sorted.
+      raw_data: the raw data of every interval.
+
+    Returns:
+      The deduplicated signal, and an array with the start and stop row of
+      every interval in it. When the intervals do not form one continuous
+      recording, the signal is None and the intervals keep their own data.
+    """
+    if not raw_data or any(
+            np.ndim(interval_data) != 2 or
+            np.shape(interval_data)[1] != np.shape(raw_data[0])[1]
+            for interval_data in raw_data):
+        return None, None
+    offsets = np.zeros((len(raw_data), 2), dtype=np.int64)
+    offsets[0] = 0, len(raw_data[0])
+    parts = [raw_data[0]]
+    for index in range(1, len(raw_data)):
+        previous_data, interval_data = raw_data[index - 1], raw_data[index]
+        step = int(round((interval_times[index] - interval_times[index - 1]) *
+                         len(previous_data) / INTERVAL_DURATION))
+        overlap = len(previous_data) - step
+        if (overlap < 0 or overlap > len(interval_data) or
+                not _equal_rows(previous_data[step:],
+                                interval_data[:overlap])):
+            return None, None
+        parts.append(interval_data[overlap:])
+        start = offsets[index - 1, 0] + step
+        offsets[index] = start, start + len(interval_data)
+    return np.concatenate(parts), offsets
+
+
+def _strip_interval_data(session):
+    """Copies a session without the data of its intervals, for pickling.
+
+    The interval data are views on the signal, which would otherwise each be
+    pickled as a copy.
+    """
+    if session.signal is None:
+        return session
+    new_session = session._replace(intervals=[])
+    new_session.intervals.extend(
+        interval._replace(session=new_session, data=None)
+        for interval in session.intervals)
+    return new_session
+
+
+def _attach_interval_data(session):
+    """Points the data of every interval of a session to its signal."""
+    if getattr(session, 'signal', None) is None:
+        return session
+    for index, (start, stop) in enumerate(session.offsets):
+        session.intervals[index] = session.intervals[index]._replace(
+            data=session.signal[start:stop])
+    return session
+
+
+def session_window(session, start_time, end_time):
+    """Slices the rows recorded between two times out of a session.
+
+    This takes constant time, as the signal of a session is one continuous
+    recording.
+
+    Args:
+      session: a Session with a signal.
+      start_time: time in seconds of the first row, relative to the start of
+          the session, like the time of its intervals.
+      end_time: time in seconds up to which rows are sliced.
+
+    Returns:
+      A view on the signal of the session.
+    """
+    if session.signal is None:
+        raise ValueError(
+            'Session %s is not stored as one continuous signal' % session.id)
+    first_start, first_stop = session.offsets[0]
+    rows_per_second = (first_stop - first_start) / INTERVAL_DURATION
+    first_time = session.intervals[0].time
+
+    def row(time):
+        return min(max(int(round((time - first_time) * rows_per_second)), 0),
+                   len(session.signal))
+    return session.signal[row(start_time):row(end_time)]
+
+
+def _load_session(session_folder_name, activities_map=None, raw_data=None,
+                  dtype=DEFAULT_DTYPE):
+    """Loads all the data for a particular session.
+
+    Args:
+      session_folder_name: path to the session folder.
+      activities_map: dict mapping session ids on activity ids.
+      raw_data: optional list with the already read raw data of each interval,
+          sorted by time. When not given, the .dat files are read here.
+      dtype: type of the samples read from the .dat files.
+    """
     # Extract the session id and subject id from the folder name
     session_id = os.path.basename(session_folder_name)
     session_nr = int(session_id[-3:])
@@ -97,20 +330,29 @@ def _load_session(session_folder_name, activities_map=None):
     # Create the Session object
     session_activity = activities_map[session_id] if activities_map else None
     session = Session(session_id, session_nr, subject_id, session_activity, [])
-    # Load each of the .dat files in the session, and sort them
-    # by sorting them by name, they are automatically sorted by time.
-    all_session_data_files = sorted(glob.glob(os.path.join(
-        session_folder_name, INTERVAL_FILE_TEMPLATE)))
-    for data_file in all_session_data_files:
-        # Extract id and time from the filename
-        interval_id = os.path.basename(data_file)
-        interval_start_time = float(interval_id[:-len('.dat')].replace('_', '.'))
-        raw_data = np.loadtxt(data_file)
+    # Load each of the .dat files in the session, sorted by time
+    all_session_data_files = _get_session_data_files(session_folder_name)
+    if raw_data is None:
+        raw_data = [
+            _read_dat_file(data_file, dtype)
+            for data_file in all_session_data_files]
+    # Extract ids and times from the filenames
+    interval_ids = [
+        os.path.basename(data_file) for data_file in all_session_data_files]
+    interval_times = [
+        float(interval_id[:-len('.dat')].replace('_', '.'))
+        for interval_id in interval_ids]
+    # Store the overlapping intervals as one signal, if they form one
+    signal, offsets = _build_session_signal(interval_times, raw_data)
+    session = session._replace(signal=signal, offsets=offsets)
+    for interval_id, interval_start_time, interval_data in zip(
+            interval_ids, interval_times, raw_data):
         # Construct Interval object
-        interval = Interval(interval_id, interval_start_time, session, raw_data)
+        interval = Interval(
+            interval_id, interval_start_time, session, interval_data)
         # Add the object to the list of intervals
         session.intervals.append(interval)
-    return session
+    return _attach_interval_data(session)
 
 
 def _get_all_test_filenames(test_data_folder):
@@ -118,22 +360,76 @@ def _get_all_test_filenames(test_data_folder):
     return glob.glob(os.path.join(test_data_folder, TEST_FILE_TEMPLATE))
 
 
-def _load_test_interval(test_fname):
+def _load_test_interval(test_fname, raw_data=None, dtype=DEFAULT_DTYPE):
     interval_id = os.path.basename(test_fname)
-    raw_data = np.loadtxt(test_fname)
+    if raw_data is None:
+        raw_data = _read_dat_file(test_fname, dtype)
     interval = Interval(interval_id, None, None, raw_data)
     return interval
 
 
+def _parallel_map(function, arguments, num_workers=None):
+    """Maps a function over a list of arguments using a pool of processes.
+
+    The results are returned in the order of the arguments. Only the raw numpy
+    Arrays travel between the processes; the Session and Interval objects are
+    always constructed in the calling process.
+
+    Args:
+      function: module level function to apply on each of the arguments, or
+          a functools.partial of one.
+      arguments: list of arguments.
+      num_workers: number of worker processes. Defaults to the number of cores.
+          With a single worker, everything is done in the calling process.
+    """
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    num_workers = min(num_workers, len(arguments))
+    if num_workers <= 1:
+        return [function(argument) for argument in arguments]
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        # Small chunks keep the load balanced over sessions of unequal length
+        return pool.map(function, arguments, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _load_sessions(session_folders, activities_map=None, num_workers=None,
+                   dtype=DEFAULT_DTYPE):
+    """Loads the sessions in the given folders, in parallel."""
+    all_raw_data = _parallel_map(
+        functools.partial(_read_session_data, dtype=dtype), session_folders,
+        num_workers)
+    return [
+        _load_session(session_folder, activities_map, raw_data)
+        for session_folder, raw_data in zip(session_folders, all_raw_data)]
+
+
+def _load_test_intervals(test_fnames, num_workers=None, dtype=DEFAULT_DTYPE):
+    """Loads the test intervals in the given files, in parallel."""
+    all_raw_data = _parallel_map(
+        functools.partial(_read_dat_file, dtype=dtype), test_fnames,
+        num_workers)
+    return [
+        _load_test_interval(fname, raw_data)
+        for fname, raw_data in zip(test_fnames, all_raw_data)]
+
+
 ## Functions for loading and parsing all of the data ##
 # =================================================== #
 
-def load_train(train_data_folder=DEFAULT_TRAIN_DATA_LOCATION):
+def load_train(train_data_folder=DEFAULT_TRAIN_DATA_LOCATION, num_workers=None,
+               dtype=DEFAULT_DTYPE):
     """Loads and parses the train data.
 
     Args:
       train_data_folder: string containing the path to the folder containing the
           training data.
+      num_workers: number of processes reading the session folders in
+          parallel. Defaults to the number of cores.
+      dtype: type of the samples, e.g. np.float32 to halve the memory.
 
     Returns:
       A list of all the session objects, each session containing a list of its
@@ -144,28 +440,368 @@ def load_train(train_data_folder=DEFAULT_TRAIN_DATA_LOCATION):
 
     # Second, load all the data, for each of the sessions, for all the subjects
     all_session_folders = _get_all_session_folders(train_data_folder)
-    sessions = [
-        _load_session(session_folder, activities)
-        for session_folder in all_session_folders]
+    sessions = _load_sessions(
+        all_session_folders, activities, num_workers, dtype)
 
     return sessions
 
 
-def load_test(test_data_folder=DEFAULT_TEST_DATA_LOCATION):
+def load_test(test_data_folder=DEFAULT_TEST_DATA_LOCATION, num_workers=None,
+              dtype=DEFAULT_DTYPE):
     """Loads and parses the test data.
 
     Args:
       test_data_folder: string containing the path to the folder containing the]
           test data.
+      num_workers: number of processes reading the test files in parallel.
+          Defaults to the number of cores.
+      dtype: type of the samples, e.g. np.float32 to halve the memory.
 
     Returns:
       A list of all the test intervals, sorted by their id.
     """
     all_fnames = sorted(_get_all_test_filenames(test_data_folder))
-    all_intervals = [_load_test_interval(fname) for fname in all_fnames]
+    all_intervals = _load_test_intervals(all_fnames, num_workers, dtype)
     return all_intervals
 
 
+## Functions for streaming the data ##
+# ==================================== #
+
+def _prefetch(function, arguments, prefetch):
+    """Maps a function over arguments in a background thread, lazily.
+
+    The thread fills a queue of prefetch results ahead of the consumer, so no
+    more than prefetch + 2 results are alive at any time, however many
+    arguments there are: the full queue, one result waiting to be queued, and
+    the one held by the consumer. Results are yielded in the order of the
+    arguments, and an exception raised by the function is raised again by the
+    generator.
+    """
+    results = Queue.Queue(maxsize=max(prefetch, 1))
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        # Gives up once the consumer stopped iterating, instead of blocking
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for argument in arguments:
+                if not put((True, function(argument))):
+                    return
+        except Exception as error:
+            put((False, error))
+            return
+        put((True, done))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            succeeded, result = results.get()
+            if not succeeded:
+                raise result
+            if result is done:
+                return
+            yield result
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def iter_train_sessions(train_data_folder=DEFAULT_TRAIN_DATA_LOCATION,
+                        prefetch=DEFAULT_SESSION_PREFETCH,
+                        dtype=DEFAULT_DTYPE):
+    """Iterates over the train sessions, reading them one at a time.
+
+    Unlike load_train, only the sessions being prefetched are in memory, so
+    the memory does not grow with the number of sessions. A background thread
+    reads the next sessions while the current one is processed.
+
+    Args:
+      train_data_folder: string containing the path to the folder containing the
+          training data.
+      prefetch: number of sessions read ahead.
+      dtype: type of the samples, e.g. np.float32 to halve the memory.
+
+    Yields:
+      The session objects, sorted by their id.
+    """
+    activities = _load_activities(train_data_folder)
+    session_folders = sorted(
+        _get_all_session_folders(train_data_folder), key=os.path.basename)
+    return _prefetch(
+        functools.partial(_load_session, activities_map=activities,
+                          dtype=dtype),
+        session_folders, prefetch)
+
+
+def iter_test_intervals(test_data_folder=DEFAULT_TEST_DATA_LOCATION,
+                        prefetch=DEFAULT_INTERVAL_PREFETCH,
+                        dtype=DEFAULT_DTYPE):
+    """Iterates over the test intervals, reading them one at a time.
+
+    The intervals come in the same order as load_test returns them, so the
+    i-th interval still corresponds to the i-th row of the predictions.
+
+    Args:
+      test_data_folder: string containing the path to the folder containing the
+          test data.
+      prefetch: number of intervals read ahead.
+      dtype: type of the samples, e.g. np.float32 to halve the memory.
+
+    Yields:
+      The test intervals, sorted by their id.
+    """
+    return _prefetch(
+        functools.partial(_load_test_interval, dtype=dtype),
+        sorted(_get_all_test_filenames(test_data_folder)), prefetch)
+
+
+## Functions for keeping track of the files in the data folders. ##
+# ================================================================ #
+
+def _file_signature(path, use_hash=False):
+    """Returns a signature that changes whenever the file changes.
+
+    By default, this is the size and modification time of the file. With
+    use_hash, the content hash is used instead of the modification time, which
+    is slower, but robust to files being copied or touched.
+    """
+    file_stat = os.stat(path)
+    if not use_hash:
+        return file_stat.st_size, file_stat.st_mtime
+    with open(path, 'rb') as data_file:
+        return file_stat.st_size, hashlib.sha1(data_file.read()).hexdigest()
+
+
+def _manifest_path(pickled_data_file_path):
+    """Location of the manifest belonging to a data pickle file."""
+    return os.path.splitext(pickled_data_file_path)[0] + '_manifest.pkl'
+
+
+def _build_manifest(train_data_folder, test_data_folder, use_hash=False,
+                    dtype=DEFAULT_DTYPE):
+    """Records the signature of every file in the train and test folders.
+
+    Returns:
+      A dict with the signature of the activities file, a dict mapping every
+      session folder on the signatures of its .dat files, and a dict mapping
+      every test file on its signature.
+    """
+    sessions = {}
+    for session_folder in _get_all_session_folders(train_data_folder):
+        sessions[session_folder] = dict(
+            (os.path.basename(data_file), _file_signature(data_file, use_hash))
+            for data_file in _get_session_data_files(session_folder))
+    test = dict(
+        (fname, _file_signature(fname, use_hash))
+        for fname in _get_all_test_filenames(test_data_folder))
+    activities = _file_signature(
+        os.path.join(train_data_folder, ACTIVITIES_FILE_NAME), use_hash)
+    return dict(
+        activities=activities, sessions=sessions, test=test, use_hash=use_hash,
+        dtype=np.dtype(dtype).str)
+
+
+def _rebind_session(session, activity):
+    """Copies a session with a new activity, pointing its intervals to it."""
+    new_session = session._replace(activity=activity, intervals=[])
+    new_session.intervals.extend(
+        interval._replace(session=new_session) for interval in session.intervals)
+    return new_session
+
+
+def _update_data(old_data, old_manifest, new_manifest,
+                 train_data_folder, num_workers=None, dtype=DEFAULT_DTYPE):
+    """Merges the old data with the files that changed since the old manifest.
+
+    Only the session folders and test files that were added or changed are
+    loaded, removed ones are dropped and all others are taken from old_data.
+    """
+    activities = _load_activities(train_data_folder)
+    activities_changed = (
+        old_manifest['activities'] != new_manifest['activities'])
+    old_sessions = dict((session.id, session) for session in old_data['train'])
+
+    all_session_folders = _get_all_session_folders(train_data_folder)
+    changed_folders = [
+        session_folder for session_folder in all_session_folders
+        if os.path.basename(session_folder) not in old_sessions or
+        old_manifest['sessions'].get(session_folder) !=
+        new_manifest['sessions'][session_folder]]
+    changed_sessions = dict(
+        (session.id, session)
+        for session in _load_sessions(
+            changed_folders, activities, num_workers, dtype))
+    sessions = []
+    for session_folder in all_session_folders:
+        session_id = os.path.basename(session_folder)
+        if session_id in changed_sessions:
+            sessions.append(changed_sessions[session_id])
+        elif activities_changed:
+            sessions.append(_rebind_session(
+                old_sessions[session_id], activities.get(session_id)))
+        else:
+            sessions.append(old_sessions[session_id])
+
+    old_test = dict((interval.id, interval) for interval in old_data['test'])
+    all_fnames = sorted(new_manifest['test'])
+    changed_fnames = [
+        fname for fname in all_fnames
+        if os.path.basename(fname) not in old_test or
+        old_manifest['test'].get(fname) != new_manifest['test'][fname]]
+    changed_test = dict(
+        (interval.id, interval)
+        for interval in _load_test_intervals(
+            changed_fnames, num_workers, dtype))
+    test_data = [
+        changed_test.get(os.path.basename(fname)) or
+        old_test[os.path.basename(fname)]
+        for fname in all_fnames]
+
+    print "Reloaded %d of %d sessions and %d of %d test files" % (
+        len(changed_folders), len(all_session_folders),
+        len(changed_fnames), len(all_fnames))
+    return dict(train=sessions, test=test_data)
+
+
+## Functions for the per-channel statistics of the data. ##
+# ======================================================== #
+
+def _session_samples(session, nr_columns):
+    """All the samples of a session, without the overlaps when possible."""
+    if session.signal is not None:
+        return session.signal
+    return np.concatenate(
+        [_as_rows(interval.data, nr_columns) for interval in session.intervals])
+
+
+def _build_channel_stats(dataset, manifest=None, old_stats=None):
+    """Computes the per-channel statistics of every session and of all data.
+
+    Args:
+      dataset: dict with the 'train' sessions and the 'test' intervals.
+      manifest: optional manifest of the files the dataset was loaded from.
+      old_stats: optional statistics built with an older manifest. The
+          statistics of the sessions, and of the test data, whose files did
+          not change since are taken from them instead of being recomputed.
+
+    Returns:
+      A dict with the ChannelStats of every session by its id, the merged
+      ChannelStats of all the 'train' and all the 'test' data, and the
+      signatures of the files they were computed from.
+    """
+    dtype = manifest['dtype'] if manifest else None
+    if old_stats is not None and old_stats.get('dtype') != dtype:
+        old_stats = None
+    signatures = {}
+    if manifest is not None:
+        signatures = dict(
+            (os.path.basename(session_folder), signature)
+            for session_folder, signature in manifest['sessions'].iteritems())
+
+    nr_columns = _nr_columns(itertools.chain(
+        (interval.data for session in dataset['train']
+         for interval in session.intervals),
+        (interval.data for interval in dataset['test'])))
+    sessions = {}
+    nr_computed = 0
+    for session in dataset['train']:
+        signature = signatures.get(session.id)
+        if (old_stats is not None and signature is not None and
+                old_stats['signatures'].get(session.id) == signature):
+            sessions[session.id] = old_stats['sessions'][session.id]
+        elif session.intervals:
+            sessions[session.id] = channel_stats.compute(
+                _session_samples(session, nr_columns))
+            nr_computed += 1
+
+    test_signature = manifest['test'] if manifest else None
+    if (old_stats is not None and test_signature is not None and
+            old_stats['test_signature'] == test_signature):
+        test = old_stats['test']
+    else:
+        test = channel_stats.merge(
+            channel_stats.compute(np.concatenate(
+                [_as_rows(interval.data, nr_columns) for interval in chunk]))
+            for chunk in utils.batches(dataset['test'], _STATS_CHUNK_SIZE))
+
+    print "Computed the statistics of %d of %d sessions" % (
+        nr_computed, len(sessions))
+    return dict(
+        sessions=sessions,
+        train=channel_stats.merge(
+            sessions[session_id] for session_id in sorted(sessions)),
+        test=test,
+        signatures=dict((session_id, signatures.get(session_id))
+                        for session_id in sessions),
+        test_signature=test_signature,
+        dtype=dtype)
+
+
+def merge_session_stats(stats, session_ids):
+    """Merges the per-channel statistics of some of the train sessions.
+
+    Args:
+      stats: the statistics, as returned by load_channel_stats.
+      session_ids: the ids of the sessions to merge, e.g. the train sessions
+          of a fold or of a held-out split.
+
+    Returns:
+      The merged channel_stats.ChannelStats, which is stats['train'] when
+      session_ids are all the sessions.
+    """
+    session_ids = sorted(set(session_ids))
+    missing = [session_id for session_id in session_ids
+               if session_id not in stats['sessions']]
+    if missing:
+        raise ValueError(
+            'There are no statistics of %d sessions, e.g. %s. Recreate the '
+            'data with these sessions to compute them.' % (
+                len(missing), missing[0]))
+    if session_ids == sorted(stats['sessions']):
+        return stats['train']
+    return channel_stats.merge(
+        stats['sessions'][session_id] for session_id in session_ids)
+
+
+def channel_stats_path(dataset_path=DEFAULT_PICKLE_PATH):
+    """Location of the statistics of a data pickle file or columnar folder."""
+    if os.path.isdir(dataset_path):
+        return os.path.join(dataset_path, CHANNEL_STATS_FILE_NAME)
+    return os.path.splitext(dataset_path)[0] + '_stats.pkl'
+
+
+def load_channel_stats(dataset_path=DEFAULT_PICKLE_PATH):
+    """Loads the per-channel statistics stored next to the data.
+
+    The statistics are computed while creating the data pickle file or the
+    columnar data folder, see channel_stats for how to use them.
+
+    Args:
+      dataset_path: location of the data pickle file or columnar data folder.
+
+    Returns:
+      A dict with the channel_stats.ChannelStats of every session by its id
+      ('sessions'), and of all the train and test data ('train' and 'test'),
+      or None when there are no statistics.
+    """
+    stats_path = channel_stats_path(dataset_path)
+    if not os.path.exists(stats_path):
+        return None
+    return utils.load_pickle(stats_path)
+
+
 ## Functions for loading the data from a pickle file. ##
 # ==================================================== #
 
@@ -173,11 +809,19 @@ def load_test(test_data_folder=DEFAULT_TEST_DATA_LOCATION):
 def create_pickled_data(train_data_folder=DEFAULT_TRAIN_DATA_LOCATION,
                         test_data_folder=DEFAULT_TEST_DATA_LOCATION,
                         pickled_data_file_path=DEFAULT_PICKLE_PATH,
-                        overwrite_old=True):
+                        overwrite_old=True,
+                        num_workers=None,
+                        incremental=True,
+                        use_hash=False,
+                        dtype=DEFAULT_DTYPE):
     """Creates the data pickle file.
 
     Loads and parses the train and test data, and then writes it to a single
-    pickle file.
+    pickle file. Next to the pickle file, a manifest is stored recording the
+    signature of every file that was loaded, and the per-channel statistics of
+    the data, see load_channel_stats. When the pickle file is created again,
+    only the sessions and test files that changed since are reloaded, and only
+    their statistics are recomputed.
 
     Args:
       train_data_folder: path to the train data folder.
@@ -186,27 +830,210 @@ def create_pickled_data(train_data_folder=DEFAULT_TRAIN_DATA_LOCATION,
           be stored.
       overwrite_old: flag indicating whether the old pickle file should be
           overwritten
+      num_workers: number of processes used to read the .dat files. Defaults
+          to the number of cores.
+      incremental: flag indicating whether an old pickle file, and its
+          manifest, can be updated instead of recreated from scratch.
+      use_hash: flag indicating whether files are compared by content hash
+          instead of modification time.
+      dtype: type of the samples. A pickle file of another type is recreated
+          from scratch.
     """
+    if os.path.exists(pickled_data_file_path) and not overwrite_old:
+        return
+    manifest_path = _manifest_path(pickled_data_file_path)
+    new_manifest = _build_manifest(
+        train_data_folder, test_data_folder, use_hash, dtype)
+    old_manifest = None
     if os.path.exists(pickled_data_file_path):
-        if not overwrite_old:
-            return
-        warnings.warn(
-            "There already exists a data pickle file, which will be overwritten.")
+        if incremental and os.path.exists(manifest_path):
+            old_manifest = utils.load_pickle(manifest_path)
+            # Manifests without a type were written for float64 samples
+            if (old_manifest.get('use_hash') != use_hash or
+                    old_manifest.get('dtype', np.dtype(np.float64).str) !=
+                    new_manifest['dtype']):
+                old_manifest = None
+        if old_manifest is None:
+            warnings.warn(
+                "There already exists a data pickle file, which will be "
+                "overwritten.")
 
-    print "about to load train"
-    train_data = load_train(train_data_folder)
-    print "about to load test"
-    test_data = load_test(test_data_folder)
-    print "finished load test, dumping pickle"
-    utils.dump_pickle(
-        dict(train=train_data, test=test_data), pickled_data_file_path)
+    if old_manifest is not None:
+        with instrumentation.stage("Updating data pickle"):
+            old_data = load_pickled_data(pickled_data_file_path)
+            dataset = _update_data(old_data, old_manifest, new_manifest,
+                                   train_data_folder, num_workers, dtype)
+    else:
+        with instrumentation.stage("Loading train data") as load_stage:
+            train_data = load_train(train_data_folder, num_workers, dtype)
+            load_stage.count(intervals=sum(
+                len(session.intervals) for session in train_data))
+        with instrumentation.stage("Loading test data") as load_stage:
+            test_data = load_test(test_data_folder, num_workers, dtype)
+            load_stage.count(intervals=len(test_data))
+        dataset = dict(train=train_data, test=test_data)
+    with instrumentation.stage("Computing channel statistics"):
+        stats_path = channel_stats_path(pickled_data_file_path)
+        old_stats = None
+        if old_manifest is not None and os.path.exists(stats_path):
+            old_stats = utils.load_pickle(stats_path)
+        stats = _build_channel_stats(dataset, new_manifest, old_stats)
+    with instrumentation.stage("Dumping data pickle"):
+        dataset['train'] = [
+            _strip_interval_data(session) for session in dataset['train']]
+        utils.dump_pickle(dataset, pickled_data_file_path)
+        utils.dump_pickle(new_manifest, manifest_path)
+        utils.dump_pickle(stats, stats_path)
 
 
 def load_pickled_data(pickled_data_file_path=DEFAULT_PICKLE_PATH):
     """Loads the train and test data from a pickle file.
 
+    The data of the intervals of every session stored as one signal are
+    restored as views on that signal.
+
     Args:
       pickled_data_file_path: location of the data pickle file.
     """
-    return utils.load_pickle(pickled_data_file_path)
+    dataset = utils.load_pickle(pickled_data_file_path)
+    if isinstance(dataset, dict):
+        for session in dataset.get('train', []):
+            _attach_interval_data(session)
+    return dataset
+
+
+
+## Functions for the memory-mapped columnar data format. ##
+# ======================================================= #
+
+def _columnar_array_path(columnar_data_folder, name):
+    return os.path.join(columnar_data_folder, name + '.npy')
+
+
+def create_columnar_data(train_data_folder=DEFAULT_TRAIN_DATA_LOCATION,
+                         test_data_folder=DEFAULT_TEST_DATA_LOCATION,
+                         columnar_data_folder=DEFAULT_COLUMNAR_PATH,
+                         overwrite_old=True,
+                         num_workers=None,
+                         dataset=None,
+                         dtype=DEFAULT_DTYPE):
+    """Creates the memory-mapped columnar data folder.
+
+    The raw data of all the train intervals, followed by all the test
+    intervals, is written to one contiguous samples matrix. Compact index
+    arrays store where each interval starts, and to which session it belongs. The
+    per-channel statistics of the data are stored in the same folder.
+
+    Args:
+      train_data_folder: path to the train data folder.
+      test_data_folder: path to the test data folder.
+      columnar_data_folder: folder where the resulting .npy files are stored.
+      overwrite_old: flag indicating whether old columnar data should be
+          overwritten
+      num_workers: number of processes used to read the .dat files. Defaults
+          to the number of cores.
+      dataset: optional dict with the already loaded 'train' and 'test' data,
+          as returned by load_pickled_data. When given, no .dat files are read.
+      dtype: type of the samples read from the .dat files.
+    """
+    samples_path = _columnar_array_path(columnar_data_folder, 'samples')
+    if os.path.exists(samples_path):
+        if not overwrite_old:
+            return
+        warnings.warn(
+            "There already exists columnar data, which will be overwritten.")
+
+    if dataset is None:
+        dataset = dict(train=load_train(train_data_folder, num_workers, dtype),
+                       test=load_test(test_data_folder, num_workers, dtype))
+    sessions = dataset['train']
+    all_intervals = [
+        interval for session in sessions for interval in session.intervals]
+    all_intervals.extend(dataset['test'])
+
+    # Every interval is stored as a 2D block of rows
+    nr_columns = (_nr_columns(interval.data for interval in all_intervals)
+                  if all_intervals else 0)
+    all_data = [_as_rows(interval.data, nr_columns)
+                for interval in all_intervals]
+    nr_rows = [interval_data.shape[0] for interval_data in all_data]
+    row_offsets = np.zeros(len(all_data) + 1, dtype=np.int64)
+    np.cumsum(nr_rows, out=row_offsets[1:])
+    dtype = all_data[0].dtype if all_data else float
+
+    session_index = dict((session.id, idx) for idx, session in enumerate(sessions))
+    arrays = dict(
+        row_offsets=row_offsets,
+        interval_ids=np.array([interval.id for interval in all_intervals]),
+        interval_times=np.array([
+            np.nan if interval.time is None else interval.time
+            for interval in all_intervals]),
+        interval_sessions=np.array([
+            -1 if interval.session is None else session_index[interval.session.id]
+            for interval in all_intervals], dtype=np.int32),
+        session_ids=np.array([session.id for session in sessions]),
+        session_numbers=np.array(
+            [session.number for session in sessions], dtype=np.int32),
+        session_subjects=np.array(
+            [session.subject for session in sessions], dtype=np.int32),
+        session_activities=np.array(
+            [session.activity or '' for session in sessions]),
+    )
+    for name, array in arrays.iteritems():
+        utils.dump_npy(array, _columnar_array_path(columnar_data_folder, name))
+    with instrumentation.stage("Computing channel statistics"):
+        utils.dump_pickle(_build_channel_stats(dataset),
+                          channel_stats_path(columnar_data_folder))
+
+    # Fill the samples matrix interval by interval, so it never needs to be
+    # concatenated in memory
+    samples = np.lib.format.open_memmap(
+        samples_path, mode='w+', dtype=dtype, shape=(row_offsets[-1], nr_columns))
+    for idx, interval_data in enumerate(all_data):
+        samples[row_offsets[idx]:row_offsets[idx + 1]] = interval_data
+    samples.flush()
+    del samples
+
+
+def load_columnar_data(columnar_data_folder=DEFAULT_COLUMNAR_PATH):
+    """Loads the train and test data from a columnar data folder.
+
+    The samples matrix is memory-mapped read-only, and the data of every
+    Interval is a view on it, so nothing is copied until it is used.
+
+    Args:
+      columnar_data_folder: location of the columnar data folder.
+
+    Returns:
+      A dict with the same 'train' and 'test' entries as load_pickled_data.
+    """
+    arrays = dict(
+        (name, utils.load_npy(_columnar_array_path(columnar_data_folder, name),
+                              mmap_mode='r' if name == 'samples' else None))
+        for name in _COLUMNAR_ARRAYS)
+    samples = arrays['samples']
+    row_offsets = arrays['row_offsets'].tolist()
+
+    sessions = [
+        Session(str(session_id), number, subject, activity or None, [])
+        for session_id, number, subject, activity in zip(
+            arrays['session_ids'],
+            arrays['session_numbers'].tolist(),
+            arrays['session_subjects'].tolist(),
+            [str(activity) for activity in arrays['session_activities']])]
+
+    test_data = []
+    for idx, (interval_id, interval_time, session_idx) in enumerate(zip(
+            arrays['interval_ids'],
+            arrays['interval_times'].tolist(),
+            arrays['interval_sessions'].tolist())):
+        interval_data = samples[row_offsets[idx]:row_offsets[idx + 1]]
+        if session_idx < 0:
+            test_data.append(
+                Interval(str(interval_id), None, None, interval_data))
+        else:
+            session = sessions[session_idx]
+            session.intervals.append(Interval(
+                str(interval_id), interval_time, session, interval_data))
 
+    return dict(train=sessions, test=test_data)
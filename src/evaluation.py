@@ -0,0 +1,339 @@
+"""Script scoring predictions locally, on a held-out split of the train data.
+
+A fraction of the sessions of every subject is held out from the train data,
+so no session contributes intervals to both sides of the split. The subject
+and index of every held-out interval are cached as .npy files once per split,
+in a folder named after the data pickle, the held-out fraction and the seed.
+Scoring a prediction file then only memory-maps it next to the cached labels,
+without loading the data at all. The multiclass log-loss, the accuracy and the
+confusion matrix of the subjects, see metrics, are all vectorized, and many
+prediction files, or predictors trained on the rest of the sessions, are
+scored in parallel.
+
+Usage: python evaluation.py [<heldout_predictions.npy> ...]
+           [--fraction <f>] [--seed <seed>] [--data <data.pkl>]
+           [--jobs <number_of_processes>]
+Without prediction files, the baseline predictors are trained on the split,
+and their held-out predictions are written to the split folder and scored.
+Prediction files should hold one row per held-out interval, in the order of
+the cached index.
+"""
+import argparse
+import collections
+import functools
+import hashlib
+import os
+
+import numpy as np
+
+import create_baselines
+import data
+import instrumentation
+import metrics
+import utils
+
+DEFAULT_EVALUATION_LOCATION = 'Evaluations'
+DEFAULT_HELDOUT_FRACTION = 0.2
+
+# Cached arrays of a split, stored as <name>.npy in its folder
+_SPLIT_ARRAYS = [
+    'labels',  # The subject of every held-out interval
+    'row_sessions',  # The session id of every held-out interval
+    'row_intervals',  # The interval id of every held-out interval
+    'heldout_sessions',  # The ids of the held-out sessions
+]
+
+## Classes to store the split and the scores in. ##
+# =============================================== #
+
+Split = collections.namedtuple(
+    'Split',
+    [
+        'folder',  # The folder caching the arrays of the split
+        'labels',  # The subject of every held-out interval
+        'row_sessions',  # The session id of every held-out interval
+        'row_intervals',  # The interval id of every held-out interval
+        'heldout_sessions',  # The ids of the held-out sessions
+    ])
+Scores = collections.namedtuple(
+    'Scores',
+    [
+        'name',  # The prediction file or predictor that was scored
+        'log_loss',  # The multiclass log-loss
+        'accuracy',  # The fraction of intervals with the right argmax
+        'confusion',  # Counts of the true (rows) and predicted subjects
+    ])
+
+# Train sessions and held-out intervals shared with the predictor worker
+# processes, which inherit them when they are forked
+_evaluation_data = None
+
+
+## Scores ##
+# ======== #
+
+def score_predictions(predictions, labels, name=None):
+    """Computes all the metrics of predictions of the held-out intervals."""
+    predictions = np.asarray(predictions, dtype=float)
+    if predictions.shape != (len(labels), data.NR_SUBJECTS):
+        raise ValueError(
+            'Expected predictions of shape %s, but got %s' % (
+                (len(labels), data.NR_SUBJECTS), predictions.shape))
+    return Scores(name, metrics.log_loss(predictions, labels),
+                  metrics.accuracy(predictions, labels),
+                  metrics.confusion_matrix(predictions, labels))
+
+
+## Held-out split ##
+# ================ #
+
+def split_folder(pickled_data_file_path=data.DEFAULT_PICKLE_PATH,
+                 heldout_fraction=DEFAULT_HELDOUT_FRACTION, random_state=0,
+                 evaluation_folder=DEFAULT_EVALUATION_LOCATION):
+    """The folder caching a split, which changes whenever the data does."""
+    key = repr((data._file_signature(pickled_data_file_path),
+                float(heldout_fraction), random_state))
+    return os.path.join(evaluation_folder, 'split_%s_%s' % (
+        os.path.splitext(os.path.basename(pickled_data_file_path))[0],
+        hashlib.sha1(key).hexdigest()[:12]))
+
+
+def choose_heldout_sessions(train_data, heldout_fraction, random_state=0):
+    """Picks the held-out sessions, the same fraction of every subject.
+
+    Every subject with multiple sessions keeps at least one session on both
+    sides of the split. The choice only depends on the session ids and the
+    seed, not on the order of train_data.
+
+    Returns:
+      Sorted list of the ids of the held-out sessions.
+    """
+    random_state = np.random.RandomState(random_state)
+    sessions_by_subject = collections.defaultdict(list)
+    for session in train_data:
+        sessions_by_subject[session.subject].append(session.id)
+    heldout_sessions = []
+    for subject in sorted(sessions_by_subject):
+        session_ids = sorted(sessions_by_subject[subject])
+        nr_heldout = int(round(heldout_fraction * len(session_ids)))
+        if len(session_ids) > 1:
+            nr_heldout = min(max(nr_heldout, 1), len(session_ids) - 1)
+        else:
+            nr_heldout = 0
+        heldout_sessions.extend(
+            random_state.permutation(session_ids)[:nr_heldout])
+    return sorted(heldout_sessions)
+
+
+def _build_split(train_data, heldout_sessions, folder):
+    heldout_sessions = set(heldout_sessions)
+    rows = [(session, interval)
+            for session in sorted(train_data, key=lambda session: session.id)
+            if session.id in heldout_sessions
+            for interval in session.intervals]
+    return Split(
+        folder,
+        np.array([session.subject for session, _ in rows], dtype=np.int64),
+        np.array([session.id for session, _ in rows]),
+        np.array([interval.id for _, interval in rows]),
+        np.array(sorted(heldout_sessions)))
+
+
+def load_split(pickled_data_file_path=data.DEFAULT_PICKLE_PATH,
+               heldout_fraction=DEFAULT_HELDOUT_FRACTION, random_state=0,
+               evaluation_folder=DEFAULT_EVALUATION_LOCATION,
+               train_data=None):
+    """Loads the cached held-out split of the data, creating it when needed.
+
+    Args:
+      pickled_data_file_path: the data pickle the split is made of.
+      heldout_fraction: the fraction of the sessions of every subject to hold
+          out.
+      random_state: seed of the choice of the held-out sessions.
+      evaluation_folder: folder containing the folders of all the splits.
+      train_data: the train sessions of the data pickle, if they are loaded
+          already. Only needed when the split is not cached yet.
+
+    Returns:
+      The Split, with its arrays memory-mapped.
+    """
+    folder = split_folder(pickled_data_file_path, heldout_fraction,
+                          random_state, evaluation_folder)
+    paths = [os.path.join(folder, name + '.npy') for name in _SPLIT_ARRAYS]
+    if not all(os.path.exists(path) for path in paths):
+        with instrumentation.stage('Creating held-out split %s' % folder):
+            if train_data is None:
+                train_data = data.load_pickled_data(
+                    pickled_data_file_path)['train']
+            split = _build_split(train_data, choose_heldout_sessions(
+                train_data, heldout_fraction, random_state), folder)
+            for name, path in zip(_SPLIT_ARRAYS, paths):
+                utils.dump_npy(getattr(split, name), path)
+    return Split(folder, *[utils.load_npy(path, mmap_mode='r')
+                           for path in paths])
+
+
+def split_data(train_data, split):
+    """Splits the train sessions the way the split does.
+
+    Returns:
+      The sessions that are not held out, and the held-out intervals in the
+      order of the split, as raw test intervals without session.
+    """
+    heldout_sessions = set(split.heldout_sessions)
+    sessions = dict((session.id, session) for session in train_data)
+    intervals = dict(((session.id, interval.id), interval)
+                     for session in train_data
+                     for interval in session.intervals)
+    missing = heldout_sessions - set(sessions)
+    if missing:
+        raise ValueError('The train data misses held-out sessions %s' %
+                         sorted(missing))
+    train_sessions = [session for session in train_data
+                      if session.id not in heldout_sessions]
+    heldout_intervals = [
+        data.Interval(interval_id, None, None,
+                      intervals[session_id, interval_id].data)
+        for session_id, interval_id in zip(split.row_sessions,
+                                           split.row_intervals)]
+    return train_sessions, heldout_intervals
+
+
+## Parallel scoring ##
+# ================== #
+
+def _score_file(path, labels_path):
+    labels = utils.load_npy(labels_path, mmap_mode='r')
+    return score_predictions(utils.load_npy(path, mmap_mode='r'), labels,
+                             name=path)
+
+
+def score_files(paths, split, num_workers=None):
+    """Scores prediction files of the held-out intervals, in parallel.
+
+    Every worker memory-maps its prediction file and the cached labels, so
+    only the file names and the small scores travel between the processes.
+
+    Args:
+      paths: the .npy prediction files.
+      split: the Split, as returned by load_split.
+      num_workers: number of worker processes. Defaults to the number of cores.
+
+    Returns:
+      List with the Scores of each of the files.
+    """
+    return data._parallel_map(
+        functools.partial(_score_file,
+                          labels_path=os.path.join(split.folder, 'labels.npy')),
+        list(paths), num_workers)
+
+
+def _run_predictor(predictor):
+    name, predict = predictor
+    train_sessions, heldout_intervals, labels = _evaluation_data
+    predictions = np.asarray(predict(train_sessions, heldout_intervals),
+                             dtype=float)
+    return predictions, score_predictions(predictions, labels, name=name)
+
+
+def score_predictors(predictors, train_data, split, num_workers=None):
+    """Trains predictors on the rest of the sessions, and scores them.
+
+    Args:
+      predictors: list of (name, function) pairs. Every function is a module
+          level function, mapping the train sessions and a list of raw test
+          intervals on their predictions.
+      train_data: the train sessions of the data pickle of the split.
+      split: the Split, as returned by load_split.
+      num_workers: number of worker processes. Defaults to the number of cores.
+
+    Returns:
+      List with the held-out predictions of each of the predictors, and list
+      with their Scores.
+    """
+    global _evaluation_data
+    train_sessions, heldout_intervals = split_data(train_data, split)
+    _evaluation_data = train_sessions, heldout_intervals, np.asarray(
+        split.labels)
+    try:
+        results = data._parallel_map(_run_predictor, list(predictors),
+                                     num_workers)
+    finally:
+        _evaluation_data = None
+    return [result[0] for result in results], [result[1] for result in results]
+
+
+## Baselines ##
+# =========== #
+
+def predict_uniform(train_data, test_data):
+    return create_baselines.predict_uniform(test_data)
+
+
+def predict_average(train_data, test_data):
+    return create_baselines.predict_average(train_data, test_data)
+
+
+BASELINE_PREDICTORS = [
+    ('uniform', predict_uniform),
+    ('average', predict_average),
+]
+
+
+def print_scores(all_scores):
+    """Prints the scores, best log-loss first, and the confusion matrix of the best."""
+    all_scores = sorted(all_scores, key=lambda scores: scores.log_loss)
+    print '%-40s %10s %10s' % ('predictions', 'log-loss', 'accuracy')
+    for scores in all_scores:
+        print '%-40s %10.5f %9.2f%%' % (
+            scores.name, scores.log_loss, scores.accuracy * 100)
+    if all_scores:
+        print 'Confusion matrix of %s (rows true, columns predicted subject):' % (
+            all_scores[0].name)
+        for subject, counts in enumerate(all_scores[0].confusion, 1):
+            print '%3d %s' % (subject, ' '.join('%6d' % count for count in counts))
+
+
+def main(prediction_paths, pickled_data_file_path=data.DEFAULT_PICKLE_PATH,
+         heldout_fraction=DEFAULT_HELDOUT_FRACTION, random_state=0,
+         num_workers=None):
+    train_data = None
+    split_path = split_folder(pickled_data_file_path, heldout_fraction,
+                              random_state)
+    if not prediction_paths or not os.path.exists(split_path):
+        train_data = data.load_pickled_data(pickled_data_file_path)['train']
+    split = load_split(pickled_data_file_path, heldout_fraction, random_state,
+                       train_data=train_data)
+    print 'Held out %d intervals of %d sessions, labels in %s' % (
+        len(split.labels), len(split.heldout_sessions),
+        os.path.join(split.folder, 'labels.npy'))
+
+    if prediction_paths:
+        all_scores = score_files(prediction_paths, split, num_workers)
+    else:
+        all_predictions, all_scores = score_predictors(
+            BASELINE_PREDICTORS, train_data, split, num_workers)
+        for (name, _), predictions in zip(BASELINE_PREDICTORS,
+                                          all_predictions):
+            utils.dump_npy(predictions, os.path.join(
+                split.folder, 'predictions', name + '.npy'))
+        print 'Dumped held-out predictions to %s' % os.path.join(
+            split.folder, 'predictions')
+    print_scores(all_scores)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Scores predictions on a held-out split of the train data.')
+    parser.add_argument('prediction_paths', nargs='*')
+    parser.add_argument('--data', dest='pickled_data_file_path',
+                        default=data.DEFAULT_PICKLE_PATH)
+    parser.add_argument('--fraction', dest='heldout_fraction', type=float,
+                        default=DEFAULT_HELDOUT_FRACTION)
+    parser.add_argument('--seed', dest='random_state', type=int, default=0)
+    parser.add_argument('--jobs', dest='num_workers', type=int)
+    return vars(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main(**_parse_args())
@@ -0,0 +1,256 @@
+"""Module for measuring where a run of the pipeline spends its time.
+
+Every stage of the pipeline is wrapped in a stage context manager, which
+prints the name of the stage, just like the print statements it replaces, and
+records its wall time, CPU time, peak memory and throughput. At the end of a
+run, print_report prints a summary and write_report emits all the records as
+a JSON file. One chosen stage can also be profiled with a sampling profiler,
+which periodically records the Python stack of the running stage.
+
+Example:
+  with instrumentation.stage('Parsing train data') as parse_stage:
+      ...
+      parse_stage.count(rows=nr_rows, intervals=nr_intervals)
+"""
+import collections
+import json
+import os
+import resource
+import signal
+import time
+
+import utils
+
+DEFAULT_REPORT_BASENAME = os.path.join('Reports', 'run')
+# Environment variable naming a stage to profile, see profile_stage
+PROFILE_STAGE_VARIABLE = 'PIPELINE_PROFILE_STAGE'
+DEFAULT_PROFILE_INTERVAL = 0.005
+# Number of innermost frames recorded for every profiler sample
+_PROFILE_DEPTH = 8
+
+StageRecord = collections.namedtuple(
+    'StageRecord',
+    [
+        'name',  # The name of the stage
+        'depth',  # The number of stages it is nested in
+        'wall_time',  # Seconds elapsed
+        'cpu_time',  # Seconds of CPU time used by this process
+        'peak_rss_mb',  # Peak resident set size during the stage, in MB
+        'rows',  # Number of samples processed, if counted
+        'intervals',  # Number of intervals processed, if counted
+    ])
+
+_records = []
+_active_stages = []
+_settings = dict(enabled=True)
+_profiler = dict(stage=os.environ.get(PROFILE_STAGE_VARIABLE),
+                 interval=DEFAULT_PROFILE_INTERVAL,
+                 samples=collections.Counter())
+
+
+## Memory measurement ##
+# ==================== #
+
+def reset_peak_rss():
+    """Resets the peak resident set size of this process, where supported."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except IOError:
+        pass
+
+
+def peak_rss_mb():
+    """The peak resident set size of this process, in MB."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.
+    except IOError:
+        pass
+    # ru_maxrss is in kB on Linux, and can not be reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+## Settings ##
+# =========== #
+
+def set_enabled(enabled):
+    """Turns the instrumentation on or off.
+
+    Long-running processes, like the scoring service, turn it off, so stages
+    run many times neither print nor pile up records.
+    """
+    _settings['enabled'] = enabled
+
+
+## Sampling profiler ##
+# ================== #
+
+def profile_stage(name, interval=DEFAULT_PROFILE_INTERVAL):
+    """Profiles every run of the stage with the given name.
+
+    Args:
+      name: name of the stage, or None to stop profiling.
+      interval: seconds of CPU time between two samples.
+    """
+    _profiler['stage'] = name
+    _profiler['interval'] = interval
+
+
+def _take_sample(signal_number, frame):
+    stack = []
+    while frame is not None and len(stack) < _PROFILE_DEPTH:
+        code = frame.f_code
+        stack.append('%s:%d(%s)' % (
+            os.path.basename(code.co_filename), frame.f_lineno, code.co_name))
+        frame = frame.f_back
+    _profiler['samples'][tuple(stack)] += 1
+
+
+def _start_profiler():
+    signal.signal(signal.SIGPROF, _take_sample)
+    # Restart system calls interrupted by a sample, instead of failing them
+    # with EINTR
+    signal.siginterrupt(signal.SIGPROF, False)
+    signal.setitimer(
+        signal.ITIMER_PROF, _profiler['interval'], _profiler['interval'])
+
+
+def _stop_profiler():
+    signal.setitimer(signal.ITIMER_PROF, 0)
+    signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+
+def _profile_summary(nr_entries=30):
+    """The most sampled stacks, and the functions sampled most often."""
+    samples = _profiler['samples']
+    functions = collections.Counter()
+    for stack, count in samples.iteritems():
+        functions[stack[0]] += count
+    return dict(
+        stage=_profiler['stage'],
+        interval=_profiler['interval'],
+        nr_samples=sum(samples.values()),
+        top_functions=functions.most_common(nr_entries),
+        top_stacks=[(list(stack), count)
+                    for stack, count in samples.most_common(nr_entries)])
+
+
+## Stage instrumentation ##
+# ====================== #
+
+class stage(object):
+    """Context manager measuring a stage of the pipeline.
+
+    Stages can be nested. The peak memory of an outer stage includes the peaks
+    of the stages nested in it.
+    """
+
+    def __init__(self, name, rows=None, intervals=None):
+        self.name = name
+        self.rows = rows
+        self.intervals = intervals
+        self.peak_rss_mb = 0
+
+    def count(self, rows=None, intervals=None):
+        """Sets the number of rows and intervals processed by the stage."""
+        if rows is not None:
+            self.rows = rows
+        if intervals is not None:
+            self.intervals = intervals
+
+    def __enter__(self):
+        self._recording = _settings['enabled']
+        if not self._recording:
+            return self
+        print self.name
+        if _active_stages:
+            parent = _active_stages[-1]
+            parent.peak_rss_mb = max(parent.peak_rss_mb, peak_rss_mb())
+        _active_stages.append(self)
+        self._profiling = self.name == _profiler['stage']
+        if self._profiling:
+            _start_profiler()
+        reset_peak_rss()
+        self._start_wall = time.time()
+        self._start_cpu = sum(os.times()[:2])
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if not self._recording:
+            return False
+        wall_time = time.time() - self._start_wall
+        cpu_time = sum(os.times()[:2]) - self._start_cpu
+        if self._profiling:
+            _stop_profiler()
+        self.peak_rss_mb = max(self.peak_rss_mb, peak_rss_mb())
+        _active_stages.pop()
+        if _active_stages:
+            parent = _active_stages[-1]
+            parent.peak_rss_mb = max(parent.peak_rss_mb, self.peak_rss_mb)
+        _records.append(StageRecord(
+            self.name, len(_active_stages), wall_time, cpu_time,
+            self.peak_rss_mb, self.rows, self.intervals))
+        return False
+
+
+def records():
+    """All stage records of this run, in the order the stages finished."""
+    return list(_records)
+
+
+def clear():
+    """Forgets all stage records and profiler samples."""
+    del _records[:]
+    _profiler['samples'].clear()
+
+
+def _per_second(count, seconds):
+    if count is None:
+        return None
+    return count / max(seconds, 1e-9)
+
+
+def print_report():
+    """Prints a summary of all stage records of this run."""
+    print '%-40s %9s %9s %9s %12s %12s' % (
+        'stage', 'wall (s)', 'cpu (s)', 'peak (MB)', 'rows/s', 'intervals/s')
+    for record in _records:
+        rows_per_second = _per_second(record.rows, record.wall_time)
+        intervals_per_second = _per_second(record.intervals, record.wall_time)
+        print '%-40s %9.3f %9.3f %9.1f %12s %12s' % (
+            '  ' * record.depth + record.name, record.wall_time,
+            record.cpu_time, record.peak_rss_mb,
+            '-' if rows_per_second is None else '%.0f' % rows_per_second,
+            '-' if intervals_per_second is None else
+            '%.0f' % intervals_per_second)
+
+
+def write_report(path=None):
+    """Writes all stage records, and the profile if any, to a JSON file.
+
+    Args:
+      path: location of the report, defaults to a unique file name in Reports.
+
+    Returns:
+      The location of the report.
+    """
+    if path is None:
+        path = utils.generate_unqiue_file_name(DEFAULT_REPORT_BASENAME, 'json')
+    stages = []
+    for record in _records:
+        stage_report = record._asdict()
+        stage_report['rows_per_second'] = _per_second(
+            record.rows, record.wall_time)
+        stage_report['intervals_per_second'] = _per_second(
+            record.intervals, record.wall_time)
+        stages.append(stage_report)
+    report = dict(timestamp=utils.timestamp(), stages=stages)
+    if _profiler['samples']:
+        report['profile'] = _profile_summary()
+    utils._make_dir(path)
+    with open(path, 'wb') as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+    return path
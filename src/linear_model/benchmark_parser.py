@@ -0,0 +1,64 @@
+"""Script timing the old, per scalar, parser against the vectorized parser.
+
+Usage: python benchmark_parser.py [<path_to_data_pickle>]
+"""
+import sys
+import time
+
+import numpy as np
+
+from individual.src import data
+import data_parser as parser
+
+
+def _legacy_parse_sample(raw_sample):
+    return [np.nan if np.isnan(value) or np.isinf(value) else value for value in raw_sample]
+
+
+def _legacy_parse_interval_data(raw_interval_data):
+    return [_legacy_parse_sample(raw_sample) for raw_sample in raw_interval_data]
+
+
+def _legacy_parse_train_data(raw_data):
+    return [
+        parser.Interval(session.subject, int(session.activity),
+                        np.array(_legacy_parse_interval_data(interval.data[len(interval.data) / 2:])))
+        for session in raw_data
+        for interval in session.intervals]
+
+
+def _legacy_parse_test_data(raw_data):
+    return [_legacy_parse_interval_data(interval.data) for interval in raw_data]
+
+
+def _time(function, *args):
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+def main(pickled_data_file_path=data.DEFAULT_PICKLE_PATH):
+    data_set = data.load_pickled_data(pickled_data_file_path)
+    train_set = data_set['train']
+    test_set = data_set['test']
+
+    old_train, old_train_time = _time(_legacy_parse_train_data, train_set)
+    new_train, new_train_time = _time(parser.parse_train_data, train_set)
+    old_test, old_test_time = _time(_legacy_parse_test_data, test_set)
+    new_test, new_test_time = _time(parser.parse_test_data, test_set)
+
+    for old, new in zip(old_train, new_train):
+        assert old.subject == new.subject and old.activity == new.activity
+        np.testing.assert_array_equal(old.samples, new.samples)
+    for old, new in zip(old_test, new_test):
+        np.testing.assert_array_equal(np.array(old), new)
+
+    print "Parsed %d train and %d test intervals, results are identical" % (len(new_train), len(new_test))
+    print "%-6s %12s %12s %9s" % ('', 'old (s)', 'new (s)', 'speedup')
+    for name, old_time, new_time in [('train', old_train_time, new_train_time),
+                                     ('test', old_test_time, new_test_time)]:
+        print "%-6s %12.3f %12.3f %8.1fx" % (name, old_time, new_time, old_time / max(new_time, 1e-9))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,176 @@
+"""End-to-end benchmark of the whole pipeline on synthetic data sets.
+
+For every scale, a synthetic data set is generated, and every step of the
+pipeline is run on it in a fresh process, recording its wall time, CPU time
+and peak memory with the instrumentation module, along with the records of the
+stages nested in it. The results are written to a JSON file, which can be compared
+to the results of an earlier run to spot regressions.
+
+With --dtype float32, the data is loaded as np.float32 and kept in that type
+by every step, and the accuracy on the synthetic test labels shows what that
+costs.
+
+Usage: python benchmark_pipeline.py [<scale> ...] [--dtype float32]
+           [--compare <old_results.json>]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import Queue
+import shutil
+import tempfile
+import traceback
+
+import numpy as np
+
+from individual.src import utils, data, synthetic_data, create_submission, instrumentation
+import data_parser as parser
+import data_preprocessing
+import feature_extraction
+import linear_model
+
+BENCHMARK_RESULTS_BASENAME = os.path.join('Benchmarks', 'pipeline')
+# Seconds between checks whether the process benchmarking a scale still runs
+_POLL_INTERVAL = 1.
+
+
+def _measure(results, name, function, *args, **kwargs):
+    """Runs a step, recording its time and peak memory in results."""
+    with instrumentation.stage(name) as step:
+        output = function(*args, **kwargs)
+    record = instrumentation.records()[-1]
+    results[name] = dict(
+        wall_time=record.wall_time,
+        cpu_time=record.cpu_time,
+        peak_rss_mb=step.peak_rss_mb)
+    print "%-26s %8.3f s %10.1f MB" % (name, results[name]['wall_time'], results[name]['peak_rss_mb'])
+    return output
+
+
+def _run_steps(data_folder, dtype=data.DEFAULT_DTYPE):
+    """Runs and measures all the steps of the pipeline on a data set."""
+    results = {}
+    train_folder = os.path.join(data_folder, 'Train')
+    test_folder = os.path.join(data_folder, 'Test')
+
+    raw_train = _measure(results, 'load_train', data.load_train, train_folder, dtype=dtype)
+    raw_test = _measure(results, 'load_test', data.load_test, test_folder, dtype=dtype)
+    _measure(results, 'create_pickled_data', data.create_pickled_data, train_folder, test_folder,
+             os.path.join(data_folder, 'data.pkl'), dtype=dtype)
+
+    def parse():
+        return parser.parse_train_data(raw_train), parser.parse_test_data(raw_test)
+    train_data, test_data = _measure(results, 'parse_data', parse)
+    train_data, test_data = _measure(results, 'pre_process_data', data_preprocessing.pre_process_data,
+                                     train_data, test_data)
+    train_data, test_data = _measure(results, 'extract_scaled_features', feature_extraction.extract_scaled_features,
+                                     train_data, test_data)
+    model = _measure(results, 'train_model', linear_model.train_model, train_data)
+    predictions = _measure(results, 'predict', linear_model.predict, model, test_data)
+    _measure(results, 'write_predictions_to_csv', create_submission.write_predictions_to_csv,
+             predictions, os.path.join(data_folder, 'predictions.csv'))
+
+    nr_rows = sum(len(interval.samples) for interval in train_data) + sum(len(interval) for interval in test_data)
+    test_labels = utils.load_npy(os.path.join(data_folder, synthetic_data.TEST_LABELS_FILE_NAME))
+    accuracy = np.mean(np.argmax(predictions, axis=1) + 1 == test_labels)
+    print "Accuracy on the synthetic test labels: %.2f %%" % (accuracy * 100)
+    return dict(steps=results, nr_train_intervals=len(train_data), nr_test_intervals=len(test_data),
+                nr_rows=nr_rows, accuracy=accuracy, feature_dtype=str(test_data[0].dtype),
+                stages=[record._asdict() for record in instrumentation.records()])
+
+
+def _benchmark_scale(scale, queue, dtype=data.DEFAULT_DTYPE):
+    """
+   Generates a data set of a scale, and benchmarks all steps on it.
+   Puts (True, results) on the queue, or (False, traceback) when a step fails.
+   """
+    data_folder = tempfile.mkdtemp()
+    try:
+        synthetic_data.create_synthetic_data(data_folder, **synthetic_data.SCALES[scale])
+        queue.put((True, _run_steps(data_folder, dtype)))
+    except Exception:
+        queue.put((False, traceback.format_exc()))
+    finally:
+        shutil.rmtree(data_folder)
+
+
+def _wait_for_result(process, queue):
+    """Waits for the result of a benchmark process, failing when it dies without one"""
+    while True:
+        try:
+            return queue.get(timeout=_POLL_INTERVAL)
+        except Queue.Empty:
+            if process.is_alive():
+                continue
+        # The result may have been put just before the process exited
+        try:
+            return queue.get(timeout=_POLL_INTERVAL)
+        except Queue.Empty:
+            raise RuntimeError('The benchmark process exited with code %s without results' % process.exitcode)
+
+
+def benchmark(scales, dtype=data.DEFAULT_DTYPE):
+    """
+   Benchmarks the pipeline at every scale, each in a fresh process, so the
+   peak memory of one scale does not carry over to the next.
+   :param scales: names of synthetic_data.SCALES
+   :param dtype: type the data is loaded as
+
+   :return: dict with the results of every scale
+   """
+    results = dict(timestamp=utils.timestamp(), dtype=np.dtype(dtype).name, scales={})
+    for scale in scales:
+        print "Benchmarking %s scale" % scale
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_benchmark_scale, args=(scale, queue, dtype))
+        process.start()
+        try:
+            succeeded, scale_results = _wait_for_result(process, queue)
+        finally:
+            process.join()
+        if not succeeded:
+            raise RuntimeError('Benchmarking the %s scale failed:\n%s' % (scale, scale_results))
+        scale_results['config'] = synthetic_data.SCALES[scale]
+        results['scales'][scale] = scale_results
+    return results
+
+
+def compare(old_results, new_results):
+    """Prints the ratio of the new to the old wall time and memory of every step, and the accuracy change"""
+    print "%-8s %-26s %12s %12s" % ('scale', 'step', 'time ratio', 'memory ratio')
+    for scale, scale_results in sorted(new_results['scales'].items()):
+        old_scale_results = old_results['scales'].get(scale, {})
+        if 'accuracy' in old_scale_results:
+            print "%-8s %-26s %+11.2f%%" % (
+                scale, 'accuracy delta', (scale_results['accuracy'] - old_scale_results['accuracy']) * 100)
+        old_steps = old_scale_results.get('steps', {})
+        for step, measures in sorted(scale_results['steps'].items()):
+            if step not in old_steps:
+                continue
+            print "%-8s %-26s %11.2fx %11.2fx" % (
+                scale, step,
+                measures['wall_time'] / max(old_steps[step]['wall_time'], 1e-9),
+                measures['peak_rss_mb'] / max(old_steps[step]['peak_rss_mb'], 1e-9))
+
+
+def main(scales, compare_path=None, dtype=data.DEFAULT_DTYPE):
+    results = benchmark(scales or ['small', 'medium'], dtype)
+    results_path = utils.generate_unqiue_file_name(BENCHMARK_RESULTS_BASENAME, 'json')
+    utils._make_dir(results_path)
+    with open(results_path, 'wb') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+    print "Saved results to %s" % results_path
+
+    if compare_path:
+        with open(compare_path, 'rb') as old_results_file:
+            compare(json.load(old_results_file), results)
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description='Benchmarks the pipeline on synthetic data.')
+    argument_parser.add_argument('scales', nargs='*', choices=sorted(synthetic_data.SCALES))
+    argument_parser.add_argument('--compare', dest='compare_path')
+    argument_parser.add_argument('--dtype', default=np.dtype(data.DEFAULT_DTYPE).name, choices=['float32', 'float64'])
+    arguments = argument_parser.parse_args()
+    main(arguments.scales, arguments.compare_path, np.dtype(arguments.dtype).type)
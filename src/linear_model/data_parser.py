@@ -1,6 +1,7 @@
 import numpy as np
 import collections
 
+from individual.src import instrumentation
 from data_preprocessing import pre_process_data
 Interval = collections.namedtuple(
     'Interval',
@@ -8,7 +9,10 @@ Interval = collections.namedtuple(
         'subject',  # The id of the subject
         'activity',  # The id of the activity
         'samples',  # All the interval samples
+        'session',  # The id of the session, used to keep folds apart
     ])
+# Intervals parsed before sessions were recorded have no session
+Interval.__new__.__defaults__ = (None,)
 
 
 def parse_sample(raw_sample):
@@ -20,62 +24,98 @@ def parse_sample(raw_sample):
    :return: the parsed sample
    """
 
-    return [np.nan if np.isnan(value) or np.isinf(value) else value for value in raw_sample]
+    return parse_interval_data(raw_sample)
 
 
-def parse_interval_data(raw_interval_data):
+def parse_interval_data(raw_interval_data, dtype=None):
     """
-   Parse one interval of data
+   Parse one interval of data, replacing all infinities by nans at once.
    :param raw_interval_data: raw interval of data to be parsed.
+   :param dtype: type of the parsed data, defaults to the floating point type
+      of the raw data, so np.float32 data is not upcast
 
-   :return: the parsed interval data
+   :return: a cleaned copy of the interval data
    """
 
-    return [parse_sample(raw_sample) for raw_sample in raw_interval_data]
+    parsed_data = np.array(raw_interval_data, dtype=dtype)
+    if parsed_data.dtype.kind != 'f':
+        parsed_data = parsed_data.astype(float)
+    np.copyto(parsed_data, np.nan, where=np.isinf(parsed_data))
+    return parsed_data
 
 
-def parse_train_data(raw_data, remove_overlap=True):
+def parse_intervals_data(raw_intervals_data, dtype=None):
+    """
+   Parse many intervals of data at once.
+   When all intervals have the same shape, they are stacked into one 3-D batch
+   which is cleaned with a single masking operation.
+   :param raw_intervals_data: list of raw intervals of data to be parsed.
+   :param dtype: type of the parsed data, see parse_interval_data
+
+   :return: list with the parsed data of each interval, views on the batch
+   """
+
+    if not raw_intervals_data:
+        return []
+    shapes = set(np.shape(raw_interval_data) for raw_interval_data in raw_intervals_data)
+    if len(shapes) > 1:
+        return [parse_interval_data(raw_interval_data, dtype) for raw_interval_data in raw_intervals_data]
+
+    parsed_batch = parse_interval_data(raw_intervals_data, dtype)
+    return list(parsed_batch)
+
+
+def parse_train_data(raw_data, remove_overlap=True, dtype=None):
     """
    Parse a raw train data set.
    :param raw_data: data to be parsed
    :param remove_overlap: true if should remove overlap
+   :param dtype: type of the parsed samples, defaults to the type of the raw data
 
    :return: array with parsed intervals
    """
 
-    print "Parsing train data"
+    all_intervals = [(session, interval) for session in raw_data for interval in session.intervals]
     if remove_overlap:
-        parsed_intervals = [
-            Interval(session.subject, int(session.activity), np.array(parse_interval_data(interval.data[len(interval.data) / 2:])))
-            for session in raw_data
-            for interval in session.intervals]
+        # Only keep the second half of each interval, slicing it as a view
+        raw_intervals_data = [interval.data[len(interval.data) // 2:] for _, interval in all_intervals]
     else:
-        parsed_intervals = [
-            Interval(session.subject, int(session.activity), np.array(parse_test_data(interval.data)))
-            for session in raw_data
-            for interval in session.intervals]
+        raw_intervals_data = [interval.data for _, interval in all_intervals]
+
+    parsed_intervals = [
+        Interval(session.subject, int(session.activity), parsed_data, session.id)
+        for (session, _), parsed_data in zip(all_intervals, parse_intervals_data(raw_intervals_data, dtype))]
 
     return parsed_intervals
 
 
-def parse_test_data(raw_data):
+def parse_test_data(raw_data, dtype=None):
     """
    Parse a raw test data set.
    :param raw_data: data to be parsed
+   :param dtype: type of the parsed samples, defaults to the type of the raw data
    :return: array with parsed intervals
    """
 
-    print "Parsing test data"
-    parsed_data = [parse_interval_data(interval.data) for interval in raw_data]
-    return parsed_data
-
+    return parse_intervals_data([interval.data for interval in raw_data], dtype)
 
-def parse_data(raw_train_data, raw_test_data):
-    """Does the parsing and pre-processing of the raw data"""
-    print "Parsing data..."
-    train_data = parse_train_data(raw_train_data, True)
-    test_data = parse_test_data(raw_test_data)
 
-    train_data, test_data = pre_process_data(train_data, test_data)
+def parse_data(raw_train_data, raw_test_data, dtype=None, train_stats=None):
+    """
+   Does the parsing and pre-processing of the raw data.
+   :param train_stats: optional channel statistics of all the raw train data,
+      the 'train' entry of data.load_channel_stats, from which the outlier
+      bounds are taken
+   """
+    with instrumentation.stage("Parsing data"):
+        with instrumentation.stage("Parsing train data") as parse_stage:
+            train_data = parse_train_data(raw_train_data, True, dtype)
+            parse_stage.count(rows=sum(len(interval.samples) for interval in train_data),
+                              intervals=len(train_data))
+        with instrumentation.stage("Parsing test data") as parse_stage:
+            test_data = parse_test_data(raw_test_data, dtype)
+            parse_stage.count(rows=sum(len(interval) for interval in test_data), intervals=len(test_data))
+
+        train_data, test_data = pre_process_data(train_data, test_data, train_stats=train_stats)
 
     return train_data, test_data
@@ -1,4 +1,4 @@
-from individual.src import utils, data
+from individual.src import utils, data, instrumentation
 import data_parser as parser
 
 
@@ -11,7 +11,12 @@ def main():
     train_set = data_set['train']
     test_set = data_set['test']
 
-    train_data, test_data = parser.parse_data(train_set, test_set)
+    # The outlier bounds are taken from the channel statistics stored with
+    # the pickle file when they exist, sparing a pass over all the samples
+    stats = data.load_channel_stats(data.DEFAULT_PICKLE_PATH)
+    train_stats = stats['train'] if stats is not None else None
+
+    train_data, test_data = parser.parse_data(train_set, test_set, train_stats=train_stats)
 
     print len(train_data)
     print len(test_data)
@@ -22,6 +27,9 @@ def main():
 
     print "Saved to %s" % data.PARSED_PICKLE_PATH
 
+    instrumentation.print_report()
+    print "Saved run report to %s" % instrumentation.write_report()
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
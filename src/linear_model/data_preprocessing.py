@@ -1,29 +1,192 @@
-import sklearn.preprocessing as preprocessing
+import numpy as np
 
+from individual.src import channel_stats, instrumentation
 
-def pre_process_data(train_data, test_data):
-    print "Pre processing..."
-    data_imputer = preprocessing.Imputer()
+# Percentiles of each channel in the train data, outside of which samples are clipped
+DEFAULT_OUTLIER_PERCENTILES = (0.1, 99.9)
 
-    print "Imputing train data"
-    train_data = [interval._replace(samples=data_imputer.fit_transform(interval.samples)) for interval in train_data]
 
-    print "Imputing test data"
-    test_data = [data_imputer.fit_transform(interval) for interval in test_data]
+def pre_process_data(train_data, test_data, outlier_percentiles=DEFAULT_OUTLIER_PERCENTILES, train_stats=None):
+    with instrumentation.stage("Pre-processing data"):
 
-    train_data, test_data = handle_outliers(train_data, test_data)
+        with instrumentation.stage("Imputing train data", intervals=len(train_data)):
+            column_means = fit_column_means(interval.samples for interval in train_data)
+            train_data = impute_train_data(train_data, column_means)
+
+        with instrumentation.stage("Imputing test data", intervals=len(test_data)):
+            test_data = impute_test_data(test_data, column_means)
+
+        train_data, test_data = handle_outliers(train_data, test_data, outlier_percentiles, train_stats)
 
     return train_data, test_data
 
 
-def handle_outliers(train_data, test_data):
+def _stack(samples):
+    """Concatenates a list of sample arrays, returning it and its row offsets"""
+    lengths = [len(interval_samples) for interval_samples in samples]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    return np.concatenate(samples), offsets
 
-    return train_data, test_data
 
-    print "Handling train outliers"
-    for index, session in enumerate(train_data):
-        return
+def _split(stacked, offsets):
+    """Splits a concatenated sample array back into views for each interval"""
+    return np.split(stacked, offsets[1:-1])
+
+
+def fit_column_means(train_samples):
+    """
+   Computes the mean of every channel over all train samples, ignoring the
+   missing values, in one pass. Channels missing in a whole interval are
+   imputed with these means, so the imputation of an interval never depends
+   on the other intervals it is imputed with.
+   :param train_samples: iterable over the samples of each train interval
+
+   :return: array with the mean of each channel, zero for a channel that is
+      missing everywhere, or None when there are no samples
+   """
+    sums = None
+    for samples in train_samples:
+        missing = np.isnan(samples)
+        if sums is None:
+            sums = np.zeros(samples.shape[1])
+            counts = np.zeros(samples.shape[1], dtype=np.int64)
+        sums += np.where(missing, 0, samples).sum(axis=0, dtype=np.float64)
+        counts += (~missing).sum(axis=0)
+    if sums is None:
+        return None
+    return sums / np.maximum(counts, 1)
+
+
+def impute_samples(samples, column_means):
+    """
+   Replaces the missing values of each interval by the mean of its column
+   within that interval, for all intervals at once. The column sums and counts
+   of every interval are masked reductions over one stacked batch. Columns
+   missing entirely in an interval get the fitted mean of the column instead.
+   Where no column is missing entirely, this is what a preprocessing.Imputer
+   fitted on every interval on its own does.
+   :param samples: list with the samples of each interval
+   :param column_means: the mean of every column, see fit_column_means
+
+   :return: list with the imputed samples of each interval, views on one batch
+   """
+    if not samples:
+        return []
+    stacked, offsets = _stack(samples)
+    return _split(impute_stacked(stacked, offsets, column_means), offsets)
+
+
+def impute_stacked(stacked, offsets, column_means):
+    """
+   Imputes the missing values of stacked intervals in place, see impute_samples.
+   :param stacked: the concatenated samples of all intervals
+   :param offsets: the first row of each interval, followed by the number of rows
+   :param column_means: the mean of every column, see fit_column_means
+
+   :return: the stacked array
+   """
+    missing = np.isnan(stacked)
+    if not missing.any():
+        return stacked
+
+    lengths = np.diff(offsets)
+    non_empty = lengths > 0
+    starts = offsets[:-1][non_empty]
+    # The sums are accumulated in float64, also for float32 samples
+    sums = np.add.reduceat(np.where(missing, 0, stacked), starts, dtype=np.float64)
+    counts = np.add.reduceat(~missing, starts)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, column_means)
+
+    fill_values = np.repeat(means.astype(stacked.dtype), lengths[non_empty], axis=0)
+    np.copyto(stacked, fill_values, where=missing)
+    return stacked
+
+
+def impute_train_data(train_data, column_means=None):
+    """
+   Imputes the missing values of each train interval with its column means.
+   :param column_means: the fallback means of every column, defaults to the
+      means over train_data, see fit_column_means
+   """
+    if column_means is None:
+        column_means = fit_column_means(interval.samples for interval in train_data)
+    imputed_samples = impute_samples([interval.samples for interval in train_data], column_means)
+    return [interval._replace(samples=samples) for interval, samples in zip(train_data, imputed_samples)]
+
+
+def impute_test_data(test_data, column_means):
+    """
+   Imputes the missing values of each test interval with its column means.
+   :param column_means: the fallback means of every column, fitted on the
+      train data, see fit_column_means
+   """
+    return impute_samples(list(test_data), column_means)
+
+
+def fit_outlier_bounds(train_samples, outlier_percentiles=DEFAULT_OUTLIER_PERCENTILES):
+    """
+   Computes the per channel clipping bounds once over all train samples.
+   :param train_samples: list with the imputed samples of each train interval
+   :param outlier_percentiles: the lower and upper percentile to clip at
+
+   :return: array with the lower and the upper bound of each channel
+   """
+    stacked, _ = _stack(train_samples)
+    return np.percentile(stacked, outlier_percentiles, axis=0).astype(stacked.dtype)
+
+
+def outlier_bounds_from_stats(stats, outlier_percentiles=DEFAULT_OUTLIER_PERCENTILES):
+    """
+   Approximates the per channel clipping bounds from precomputed statistics,
+   without a pass over the samples.
+   :param stats: channel_stats.ChannelStats of the raw train samples, e.g. the
+      'train' entry of data.load_channel_stats
+   :param outlier_percentiles: the lower and upper percentile to clip at
+
+   :return: array with the lower and the upper bound of each channel
+   """
+    return channel_stats.percentiles(stats, outlier_percentiles)
+
+
+def clip_outliers(samples, bounds):
+    """
+   Clips the samples of all intervals to the bounds in one operation.
+   :param samples: list with the samples of each interval
+   :param bounds: array with the lower and the upper bound of each channel
+
+   :return: list with the clipped samples of each interval, views on one batch
+   """
+    if not samples:
+        return []
+    stacked, offsets = _stack(samples)
+    np.clip(stacked, bounds[0], bounds[1], out=stacked)
+    return _split(stacked, offsets)
+
+
+def handle_outliers(train_data, test_data, outlier_percentiles=DEFAULT_OUTLIER_PERCENTILES, train_stats=None):
+    """
+   Clips the outliers of each channel to percentiles of the train data.
+   :param train_stats: optional channel_stats.ChannelStats of the raw train
+      samples, from which the percentiles are approximated instead of computed
+      by a pass over the train data
+
+   :return: the clipped train intervals and test samples
+   """
+    if outlier_percentiles is None:
+        return train_data, test_data
+
+    if train_stats is not None:
+        bounds = outlier_bounds_from_stats(train_stats, outlier_percentiles)
+    else:
+        bounds = fit_outlier_bounds([interval.samples for interval in train_data], outlier_percentiles)
+
+    with instrumentation.stage("Handling train outliers", intervals=len(train_data)):
+        clipped_samples = clip_outliers([interval.samples for interval in train_data], bounds)
+        train_data = [interval._replace(samples=samples) for interval, samples in zip(train_data, clipped_samples)]
 
-    print "Handling test outliers"
+    with instrumentation.stage("Handling test outliers", intervals=len(test_data)):
+        test_data = clip_outliers(list(test_data), bounds)
 
     return train_data, test_data
@@ -1,49 +1,184 @@
-from individual.src import utils, data
+import numpy as np
+from individual.src import utils, data, instrumentation
 from sklearn import decomposition
 from sklearn.preprocessing import StandardScaler
 
+# Minimum number of rows passed to a single partial_fit call
+DEFAULT_CHUNK_ROWS = 10000
 
-def extract_scaled_features(train_data, test_data):
 
-    selected_train_features, selected_test_features = extract_features(train_data, test_data)
-    scaled_train_features, scaled_test_features = scale_features(selected_train_features, selected_test_features)
+def extract_scaled_features(train_data, test_data, max_fit_rows=None):
+
+    selected_train_features, selected_test_features = extract_features(train_data, test_data, max_fit_rows=max_fit_rows)
+    scaled_train_features, scaled_test_features = scale_features(selected_train_features, selected_test_features,
+                                                                 incremental=max_fit_rows is not None)
 
     return scaled_train_features, scaled_test_features
 
 
-def extract_features(train_data, test_data, number_components=5):
-    all_samples = []
-    for session in train_data:
-        all_samples.extend(session.samples)
+def iter_sample_chunks(samples, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+   Groups a stream of sample arrays into arrays of at least chunk_rows rows,
+   except for the last one. Only one chunk is held in memory at a time.
+   :param samples: iterable over 2-D sample arrays, e.g. of each interval
+   :param chunk_rows: minimum number of rows in a chunk
+   """
+    buffered = []
+    nr_rows = 0
+    for interval_samples in samples:
+        buffered.append(interval_samples)
+        nr_rows += len(interval_samples)
+        if nr_rows >= chunk_rows:
+            yield np.concatenate(buffered)
+            buffered = []
+            nr_rows = 0
+    if buffered:
+        yield np.concatenate(buffered)
+
+
+def reservoir_sample(sample_chunks, max_rows, random_state=None):
+    """
+   Uniformly samples at most max_rows rows out of a stream of sample chunks,
+   without ever holding more than max_rows rows and one chunk in memory.
+   Every chunk is handled with one vectorized step of reservoir sampling.
+   :param sample_chunks: iterable over 2-D sample arrays
+   :param max_rows: maximum number of rows to keep
+   :param random_state: seed or RandomState
+
+   :return: array with the sampled rows
+   """
+    random_state = np.random.RandomState(random_state) if not isinstance(random_state, np.random.RandomState) \
+        else random_state
+    reservoir = None
+    nr_seen = 0
+    for chunk in sample_chunks:
+        if reservoir is None:
+            reservoir = np.empty((max_rows, chunk.shape[1]), dtype=chunk.dtype)
+        # Rows are copied directly while the reservoir is not full
+        nr_free = max(0, min(max_rows - nr_seen, len(chunk)))
+        reservoir[nr_seen:nr_seen + nr_free] = chunk[:nr_free]
+        # Every later row replaces a random slot with probability max_rows / seen
+        positions = nr_seen + np.arange(nr_free, len(chunk))
+        slots = (random_state.random_sample(len(positions)) * (positions + 1)).astype(np.int64)
+        replace = slots < max_rows
+        reservoir[slots[replace]] = chunk[nr_free:][replace]
+        nr_seen += len(chunk)
+    if reservoir is None:
+        raise ValueError('Can not sample from an empty stream of samples')
+    return reservoir[:min(nr_seen, max_rows)]
+
+
+class IncrementalICA(object):
+    """
+   FastICA fitted out-of-core. The whitening is estimated incrementally over all
+   the samples with IncrementalPCA, while the unmixing is fitted by FastICA on a
+   reservoir sampled subset of at most max_fit_rows whitened rows.
+   """
+
+    def __init__(self, n_components=5, max_fit_rows=100000, chunk_rows=DEFAULT_CHUNK_ROWS, random_state=None):
+        self.n_components = n_components
+        self.max_fit_rows = max_fit_rows
+        self.chunk_rows = chunk_rows
+        self.random_state = random_state
+        self.whitener = None
+        self.unmixer = None
+
+    def fit(self, samples):
+        """
+       Fits the decomposer in a single pass over the samples.
+       :param samples: iterable over 2-D sample arrays, e.g. of each interval
+
+       :return: the fitted decomposer
+       """
+        self.whitener = decomposition.IncrementalPCA(n_components=self.n_components, whiten=True)
+        random_state = np.random.RandomState(self.random_state)
+
+        def fitted_chunks():
+            for chunk in iter_sample_chunks(samples, max(self.chunk_rows, self.n_components)):
+                if len(chunk) >= self.n_components:
+                    self.whitener.partial_fit(chunk)
+                yield chunk
+
+        # Whitening is an affine map, so the sampled rows can be whitened once
+        # the whitener has seen all the samples
+        subset = reservoir_sample(fitted_chunks(), self.max_fit_rows, random_state)
+        self.unmixer = decomposition.FastICA(n_components=self.n_components, whiten=False, random_state=random_state)
+        self.unmixer.fit(self.whitener.transform(subset))
+        return self
+
+    def transform(self, samples):
+        return self.unmixer.transform(self.whitener.transform(samples))
+
+
+def transform_samples(transformer, samples):
+    """
+   Transforms samples, keeping their type. The fitted transformers compute in
+   float64, which would otherwise silently upcast np.float32 samples.
+   :param transformer: the fitted decomposer or scaler
+   :param samples: 2-D sample array
+
+   :return: the transformed samples, of the same type
+   """
+    return transformer.transform(samples).astype(samples.dtype, copy=False)
+
+
+def fit_decomposer(train_samples, number_components=5, max_fit_rows=None, random_state=None):
+    """
+   Fits the ICA decomposer on the train samples.
+   :param train_samples: iterable over the samples of each train interval
+   :param number_components: number of independent components
+   :param max_fit_rows: when given, the decomposer is fitted out-of-core, with
+      FastICA seeing at most this many rows. Otherwise on all samples at once.
+   :param random_state: seed of the decomposer
+
+   :return: the fitted decomposer
+   """
+    if max_fit_rows is None:
+        decomposer = decomposition.FastICA(n_components=number_components, random_state=random_state)
+        return decomposer.fit(np.concatenate(list(train_samples)))
+
+    decomposer = IncrementalICA(number_components, max_fit_rows, random_state=random_state)
+    return decomposer.fit(train_samples)
+
+
+def fit_scaler(train_samples, incremental=False):
+    """
+   Fits the scaler on the train samples.
+   :param train_samples: iterable over the samples of each train interval
+   :param incremental: fit the scaler chunk by chunk with partial_fit, instead
+      of on all samples at once
+   """
+    scaler = StandardScaler()
+    if not incremental:
+        return scaler.fit(np.concatenate(list(train_samples)))
+
+    for chunk in iter_sample_chunks(train_samples):
+        scaler.partial_fit(chunk)
+    return scaler
 
-    decomposer = decomposition.FastICA(n_components=number_components)
 
-    print "Decomposing train data"
-    decomposer.fit(all_samples)
+def extract_features(train_data, test_data, number_components=5, max_fit_rows=None):
+    with instrumentation.stage("Decomposing train data", intervals=len(train_data)):
+        decomposer = fit_decomposer((interval.samples for interval in train_data), number_components, max_fit_rows)
 
-    train_data = [interval._replace(samples=decomposer.transform(interval.samples)) for interval in train_data]
+        train_data = [interval._replace(samples=transform_samples(decomposer, interval.samples))
+                      for interval in train_data]
 
-    print "Decomposing test data"
-    test_data = [decomposer.transform(interval) for interval in test_data]
+    with instrumentation.stage("Decomposing test data", intervals=len(test_data)):
+        test_data = [transform_samples(decomposer, interval) for interval in test_data]
 
     return train_data, test_data
 
 
-def scale_features(train_data, test_data):
+def scale_features(train_data, test_data, incremental=False):
     """Scales the features to a normalized curve"""
 
-    all_samples = []
-    for session in train_data:
-        all_samples.extend(session.samples)
+    with instrumentation.stage("Scaling train data", intervals=len(train_data)):
+        scaler = fit_scaler((interval.samples for interval in train_data), incremental)
+        train_data = [interval._replace(samples=transform_samples(scaler, interval.samples)) for interval in train_data]
 
-    scaler = StandardScaler()
-    scaler.fit(all_samples)
-
-    print "Scaling train data"
-    train_data = [interval._replace(samples=scaler.transform(interval.samples)) for interval in train_data]
-
-    print "Scaling test data"
-    test_data = [scaler.transform(interval) for interval in test_data]
+    with instrumentation.stage("Scaling test data", intervals=len(test_data)):
+        test_data = [transform_samples(scaler, interval) for interval in test_data]
 
     return train_data, test_data
 
@@ -62,6 +197,9 @@ def main():
 
     print "Saved to %s" % data.PROCESSED_PICKLE_PATH
 
+    instrumentation.print_report()
+    print "Saved run report to %s" % instrumentation.write_report()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,257 @@
+"""Fitted pipeline stored as a versioned, memory-mappable artifact.
+
+Scoring new test data should never refit anything. After imputation and
+clipping, every stage of the pipeline maps each sample affinely: the ICA
+decomposition, the scaler and the decision function of the linear model. So
+all of them are composed into a single weight matrix and offset, which are
+stored as .npy files next to the fitted channel means of the imputation, the
+clipping bounds and a meta.json file with the format version. Scoring is then one pass over all stacked test samples:
+replacing infinities, imputing, clipping, one matrix product and counting the
+votes of every interval, exactly like the pipeline does.
+
+Usage: python fitted_artifact.py [--pipeline <pipeline.pkl>] [--artifact <folder>]
+           [--score <test_data_folder>] [--batch-size <n>]
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from individual.src import utils, data
+import data_preprocessing
+import linear_model
+import pipeline as pipeline_module
+import stage_cache
+
+ARTIFACT_FORMAT_VERSION = 2
+DEFAULT_ARTIFACT_FOLDER = os.path.join('Models', 'artifact')
+ARTIFACT_PREDICTIONS_BASENAME = os.path.join('Predictions', 'artifact')
+# Number of test intervals streamed from disk and scored at once
+DEFAULT_SCORE_BATCH_SIZE = 1024
+_META_FILE_NAME = 'meta.json'
+_ARRAYS = ['column_means', 'bounds', 'weights', 'offset', 'classes']
+
+# Stages that do not need to be exported, because they fit no parameters of the samples
+_STATELESS_STAGES = (pipeline_module.ParseStage,)
+# Stages mapping every sample affinely, which are composed into one matrix
+_AFFINE_STAGES = (pipeline_module.DecompositionStage, pipeline_module.ScaleStage)
+
+
+def _affine_map(transform, nr_inputs, random_state=0):
+    """
+   Recovers the weights and offset of an affine map of rows, by transforming
+   the origin and the unit vectors. The result is checked on random rows.
+   :param transform: function mapping a 2-D array of rows to a 2-D array of rows
+   :param nr_inputs: number of columns of the input rows
+
+   :return: the weights and offset, such that transform(x) == x.dot(weights) + offset
+   """
+    outputs = transform(np.vstack([np.zeros(nr_inputs), np.eye(nr_inputs)]))
+    offset = outputs[0]
+    weights = outputs[1:] - offset
+
+    check = np.random.RandomState(random_state).randn(16, nr_inputs)
+    expected = transform(check)
+    if not np.allclose(check.dot(weights) + offset, expected, rtol=1e-6, atol=1e-8 * np.abs(expected).max()):
+        raise ValueError('The stages after clipping are not an affine map of the samples')
+    return weights, offset
+
+
+def _interval_rows(interval_data, nr_channels):
+    """
+   The raw data of an interval as rows of nr_channels, undoing the squeezing of
+   single row and single column files by np.loadtxt.
+   :raises ValueError: when the data does not have nr_channels channels
+   """
+    interval_data = np.asarray(interval_data)
+    if interval_data.ndim == 1 and (nr_channels == 1 or len(interval_data) == nr_channels):
+        interval_data = interval_data.reshape(-1, nr_channels)
+    if interval_data.ndim != 2 or interval_data.shape[1] != nr_channels:
+        raise ValueError('Expected intervals of %d channels, but got data of shape %s' % (
+            nr_channels, interval_data.shape))
+    return interval_data
+
+
+class FittedArtifact(object):
+    """All fitted parameters needed to score raw test intervals."""
+
+    def __init__(self, column_means, bounds, weights, offset, classes, meta=None):
+        """
+       :param column_means: the mean of every channel in the train data, which
+          imputes the channels missing in a whole interval
+       :param bounds: array with the lower and upper clipping bound of every
+          channel, or None when the samples are not clipped
+       :param weights: the composed weights, one column per class
+       :param offset: the composed offset of every class
+       :param classes: the subject of every class
+       :param meta: dict describing how the artifact was made
+       """
+        self.column_means = column_means
+        self.bounds = bounds
+        self.weights = weights
+        self.offset = offset
+        self.classes = classes
+        self.meta = meta or {}
+
+    @property
+    def nr_channels(self):
+        """The number of channels of the raw data"""
+        return self.weights.shape[0]
+
+    def decision_function(self, samples):
+        """The decision value of every class for imputed and clipped samples"""
+        return np.dot(samples, self.weights) + self.offset
+
+    def predict(self, test_intervals):
+        """
+       Scores raw test intervals, as returned by data.load_test, in a single
+       vectorized pass over all their samples.
+       :param test_intervals: list of raw test intervals, or of their data
+
+       :return: array with, for each interval, the fraction of its samples
+          predicted to belong to each of the subjects
+       :raises ValueError: when an interval does not have nr_channels channels
+       """
+        raw_data = [
+            _interval_rows(interval if isinstance(interval, np.ndarray) else interval.data, self.nr_channels)
+            for interval in test_intervals]
+        if not raw_data:
+            return np.zeros((0, linear_model.NR_SUBJECTS))
+        stacked, offsets = data_preprocessing._stack(raw_data)
+        if stacked.dtype.kind != 'f':
+            stacked = stacked.astype(float)
+        np.copyto(stacked, np.nan, where=np.isinf(stacked))
+        data_preprocessing.impute_stacked(stacked, offsets, self.column_means)
+        if self.bounds is not None:
+            np.clip(stacked, self.bounds[0], self.bounds[1], out=stacked)
+
+        subjects = self.classes[np.argmax(self.decision_function(stacked), axis=1)].astype(np.int64)
+        lengths = np.diff(offsets)
+        return linear_model.count_votes(subjects, lengths) / np.maximum(lengths, 1)[:, np.newaxis].astype(float)
+
+    def save(self, folder=DEFAULT_ARTIFACT_FOLDER):
+        """Writes the arrays as .npy files, and the meta data as meta.json, to folder"""
+        for name in _ARRAYS:
+            array = getattr(self, name)
+            path = os.path.join(folder, name + '.npy')
+            if array is not None:
+                utils.dump_npy(np.asarray(array), path)
+            elif os.path.exists(path):
+                os.remove(path)
+        meta = dict(self.meta, format_version=ARTIFACT_FORMAT_VERSION)
+        utils._make_dir(os.path.join(folder, _META_FILE_NAME))
+        with open(os.path.join(folder, _META_FILE_NAME), 'wb') as meta_file:
+            json.dump(meta, meta_file, indent=2, sort_keys=True)
+
+
+def from_pipeline(fitted_pipeline, nr_channels=None):
+    """
+   Exports the fitted parameters of a pipeline.
+   :param fitted_pipeline: a fitted pipeline.Pipeline
+   :param nr_channels: number of channels of the raw data, defaults to the
+      number recorded by the impute stage, or else the number of clipping bounds
+
+   :return: the FittedArtifact
+   """
+    column_means = None
+    bounds = None
+    affine_stages = []
+    model = None
+    for stage in fitted_pipeline.stages:
+        if isinstance(stage, _STATELESS_STAGES):
+            continue
+        elif isinstance(stage, pipeline_module.ImputeStage):
+            column_means = stage.column_means
+            if nr_channels is None:
+                nr_channels = stage.nr_channels
+        elif isinstance(stage, pipeline_module.OutlierStage):
+            bounds = stage.bounds
+        elif isinstance(stage, _AFFINE_STAGES):
+            affine_stages.append(stage)
+        elif isinstance(stage, pipeline_module.ModelStage):
+            model = stage.model
+        else:
+            raise ValueError('Can not export stage %s' % stage.name)
+    if model is None:
+        raise ValueError('The pipeline has no fitted model')
+    if column_means is None:
+        raise ValueError('The pipeline has no fitted impute stage')
+    if nr_channels is None:
+        if bounds is None:
+            raise ValueError('The number of channels is required when the pipeline did not record it, '
+                             'and the samples are not clipped')
+        nr_channels = bounds.shape[1]
+
+    def transform(samples):
+        for stage in affine_stages:
+            samples = stage.transform_test([samples])[0]
+        return model.decision_function(samples)
+
+    weights, offset = _affine_map(transform, nr_channels)
+    meta = dict(
+        created=utils.timestamp(),
+        nr_channels=nr_channels,
+        stages=[stage.name for stage in fitted_pipeline.stages],
+        code_versions=dict((stage.name, stage_cache.code_version(stage)) for stage in fitted_pipeline.stages))
+    return FittedArtifact(column_means, bounds, weights, offset, np.asarray(model.classes_), meta)
+
+
+def load_artifact(folder=DEFAULT_ARTIFACT_FOLDER, mmap_mode='r'):
+    """
+   Loads an artifact written by FittedArtifact.save.
+   :param folder: folder of the artifact
+   :param mmap_mode: how the arrays are memory-mapped, None to read them
+
+   :return: the FittedArtifact
+   """
+    with open(os.path.join(folder, _META_FILE_NAME), 'rb') as meta_file:
+        meta = json.load(meta_file)
+    if meta.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        raise ValueError('Expected an artifact of format version %d, but got %s' % (
+            ARTIFACT_FORMAT_VERSION, meta.get('format_version')))
+    arrays = {}
+    for name in _ARRAYS:
+        path = os.path.join(folder, name + '.npy')
+        arrays[name] = utils.load_npy(path, mmap_mode=mmap_mode) if os.path.exists(path) else None
+    return FittedArtifact(meta=meta, **arrays)
+
+
+def predict_stream(artifact, test_intervals, batch_size=DEFAULT_SCORE_BATCH_SIZE):
+    """
+   Scores an iterable of raw test intervals in batches, so only one batch of
+   raw data is in memory at a time.
+   :param artifact: the FittedArtifact
+   :param test_intervals: iterable of raw test intervals, e.g. data.iter_test_intervals
+
+   :return: the predictions of all the intervals, in their order
+   """
+    all_predictions = [artifact.predict(batch) for batch in utils.batches(test_intervals, batch_size)]
+    if not all_predictions:
+        return np.zeros((0, linear_model.NR_SUBJECTS))
+    return np.concatenate(all_predictions)
+
+
+def main(pipeline_path=pipeline_module.FITTED_PIPELINE_PATH, artifact_folder=DEFAULT_ARTIFACT_FOLDER,
+         test_data_folder=None, batch_size=DEFAULT_SCORE_BATCH_SIZE):
+    if test_data_folder is None:
+        print "Exporting the fitted pipeline %s" % pipeline_path
+        from_pipeline(pipeline_module.load_pipeline(pipeline_path)).save(artifact_folder)
+        print "Saved the artifact to %s" % artifact_folder
+        return
+
+    artifact = load_artifact(artifact_folder)
+    predictions = predict_stream(artifact, data.iter_test_intervals(test_data_folder), batch_size)
+    pred_file_name = utils.generate_unqiue_file_name(ARTIFACT_PREDICTIONS_BASENAME, 'npy')
+    utils.dump_npy(predictions, pred_file_name)
+    print 'Dumped predictions to %s' % pred_file_name
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description='Exports a fitted pipeline, or scores test data with it.')
+    argument_parser.add_argument('--pipeline', dest='pipeline_path', default=pipeline_module.FITTED_PIPELINE_PATH)
+    argument_parser.add_argument('--artifact', dest='artifact_folder', default=DEFAULT_ARTIFACT_FOLDER)
+    argument_parser.add_argument('--score', dest='test_data_folder')
+    argument_parser.add_argument('--batch-size', dest='batch_size', type=int, default=DEFAULT_SCORE_BATCH_SIZE)
+    arguments = argument_parser.parse_args()
+    main(**vars(arguments))
@@ -1,106 +1,317 @@
+import collections
+import multiprocessing
 import os
+import time
 import numpy as np
 import individual.src.utils as utils
+import individual.src.instrumentation as instrumentation
+from sklearn import base
 from sklearn import linear_model
-from sklearn import svm
 
 import individual.src.data as data
+import streaming_ridge
 
-NR_SUBJECTS = 8
+NR_SUBJECTS = data.NR_SUBJECTS
 LINEAR_PREDICTIONS_BASENAME = os.path.join('Predictions', 'linear')
 
+FoldResult = collections.namedtuple(
+    'FoldResult',
+    [
+        'fold',  # The index of the fold
+        'score',  # The score of the model on the fold
+        'nr_train',  # The number of train samples
+        'nr_test',  # The number of test samples
+        'fit_time',  # Seconds spent fitting the model
+        'score_time',  # Seconds spent scoring the model
+    ])
+
+# Data shared with the cross validation worker processes, which inherit it
+# when they are forked instead of receiving a pickled copy
+_cv_data = None
+# Buffer holding the train samples of a fold, allocated once per process and
+# reused by all the folds it runs, see fold_train_set
+_fold_buffer = None
+
 
 def predict_linear_model(train_data, test_data):
     """Do the magic"""
-    print("training")
-
-    model = train_model(train_data)
-
-    dataset, users = build_sets(train_data)
+    with instrumentation.stage("training", intervals=len(train_data)) as train_stage:
+        dataset, users = build_sets(train_data)
+        model = train_model(train_data, sets=(dataset, users))
+        train_stage.count(rows=len(users))
 
     score = model.score(dataset, users)
     print("Accuracy on full set: {:.2f} %".format(score * 100))
 
     #k=20
     #print "Running k = {} cross valdiation".format(k)
-    #k_fold_cv(model, dataset, users, k)
+    #k_fold_cv(model, dataset, users, k, groups=build_groups(train_data))
 
 
-    print("predicting")
-    return predict(model, test_data)
+    with instrumentation.stage("predicting", intervals=len(test_data)) as predict_stage:
+        predict_stage.count(rows=sum(len(interval) for interval in test_data))
+        return predict(model, test_data)
 
 
-def train_model(train_data):
-    """Train the model with the specified parsed train data"""
+def make_default_model():
+    """The (unfitted) model trained by default, see model_search for alternatives"""
+    return linear_model.RidgeClassifierCV(fit_intercept=False)
 
-    dataset, users = build_sets(train_data)
 
-    lin_model = linear_model.RidgeClassifierCV(fit_intercept=False)
-    lin_model.fit(dataset, users)
-
-    return lin_model
-
-
-def predict(model, test_data):
-    """ Create the predictions for the linear model with this test data"""
-    print "starting predictions"
-    predicts = []
-    for interval in test_data:
-        prediction = []
-        original_predictions = list(model.predict(interval))
-        for subject in range(1, NR_SUBJECTS + 1):
-            prediction.append(original_predictions.count(subject) / (len(original_predictions) * 1.0))
-
-        predicts.append(prediction)
-
-    return predicts
+def train_model(train_data, streaming=False, model=None, sets=None):
+    """
+   Train the model with the specified parsed train data.
+   :param train_data: iterable over the parsed train intervals
+   :param streaming: train a streaming_ridge.StreamingRidgeClassifier in one
+      pass over the intervals, without building the design matrix
+   :param model: optional unfitted model to train instead of the default one,
+      e.g. the winner of model_search
+   :param sets: optional design matrix and labels of train_data, as returned
+      by build_sets, for callers that need them again after training
+   """
 
+    if streaming:
+        return streaming_ridge.StreamingRidgeClassifier().fit_intervals(train_data)
 
-def k_fold_cv(model, train_data, train_labels, k):
-    """Run kfold cross validation and print the scores"""
+    dataset, users = build_sets(train_data) if sets is None else sets
 
-    scores = [0] * k
-    split_indexes = [0] * (k - 1)
-
-    for temp in range(1, k):
-        split_indexes[temp - 1] = int(temp * (len(train_data) / (1.0 * k)))
-
-    print(split_indexes)
-
-    train_folds = np.split(train_data, split_indexes)
-    train_label_folds = np.split(train_labels, split_indexes)
-    for iteration in range(0, len(train_folds)):
-        test_subset = train_folds[iteration]
-        test_labels = train_label_folds[iteration]
-
-        temp_set = np.delete(train_folds, iteration, axis=0)
-        temp_labels_set = np.delete(train_label_folds, iteration, axis=0)
+    lin_model = make_default_model() if model is None else base.clone(model)
+    lin_model.fit(dataset, users)
 
-        train_subset = temp_set[0]
-        train_labels_set = temp_labels_set[0]
+    return lin_model
 
-        for i in range(1, len(temp_set)):
-            train_subset = np.append(train_subset, temp_set[i], axis=0)
-            train_labels_set = np.append(train_labels_set, temp_labels_set[i], axis=0)
 
-        model.fit(train_subset, train_labels_set)
-        score = model.score(test_subset, test_labels)
-        scores[iteration] = score
+def predict(model, test_data, chunk_size=None):
+    """
+   Create the predictions for the linear model with this test data.
+   All test intervals are stacked into one matrix, so the model predicts all of
+   their samples in a single call, and the votes for each subject are counted
+   for all intervals at once.
+   :param model: the fitted model
+   :param test_data: list with the samples of each test interval
+   :param chunk_size: optional maximum number of samples predicted at once
+
+   :return: array with, for each interval, the fraction of its samples
+      predicted to belong to each of the subjects
+   """
+    lengths = np.array([len(interval) for interval in test_data], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    predicts = np.zeros((len(test_data), NR_SUBJECTS))
+    if not len(test_data):
+        return predicts
+
+    # Group whole intervals into chunks of about chunk_size samples
+    if chunk_size is None:
+        boundaries = [0, len(test_data)]
+    else:
+        boundaries = np.unique(np.concatenate([
+            np.searchsorted(offsets, np.arange(0, offsets[-1], chunk_size), side='right') - 1,
+            [len(test_data)]]))
+
+    for first, last in zip(boundaries[:-1], boundaries[1:]):
+        samples = np.concatenate(test_data[first:last])
+        subjects = model.predict(samples).astype(np.int64)
+        predicts[first:last] = count_votes(subjects, lengths[first:last])
+
+    predicts /= np.maximum(lengths, 1)[:, np.newaxis]
+    return predicts
 
-        print("Score for iteration = {} was: {:.2f} %".format(iteration, score * 100))
 
-    print("Average score: {:.2f} %".format((sum(scores) * 100) / (1.0 * len(scores))))
+def count_votes(subjects, lengths):
+    """
+   Counts the votes for each subject of the samples of consecutive intervals.
+   :param subjects: the predicted subject of every sample of all the intervals
+   :param lengths: the number of samples of each interval
+
+   :return: array with, for each interval, the number of its samples predicted
+      to belong to each of the subjects
+   """
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+    votes = np.bincount(segments * NR_SUBJECTS + subjects - 1, minlength=len(lengths) * NR_SUBJECTS)
+    return votes.reshape(len(lengths), NR_SUBJECTS)
+
+
+def make_folds(nr_samples, k, groups=None):
+    """
+   Splits the sample indexes into k folds.
+   :param nr_samples: number of samples
+   :param k: number of folds
+   :param groups: optional group of each sample. All samples of a group end up
+      in the same fold, which keeps the overlapping intervals of a session from
+      being both trained and tested on. Groups are spread over the folds,
+      largest first, always adding to the smallest fold.
+
+   :return: list with the sorted sample indexes of each fold
+   """
+    if groups is None:
+        return np.array_split(np.arange(nr_samples), k)
+
+    _, group_indexes = np.unique(groups, return_inverse=True)
+    group_sizes = np.bincount(group_indexes)
+    if len(group_sizes) < k:
+        raise ValueError('Can not split {} groups into {} folds, use fewer folds or the data of more '
+                         'sessions'.format(len(group_sizes), k))
+    fold_sizes = np.zeros(k, dtype=np.int64)
+    group_folds = np.zeros(len(group_sizes), dtype=np.int64)
+    for group in np.argsort(-group_sizes, kind='mergesort'):
+        fold = np.argmin(fold_sizes)
+        group_folds[group] = fold
+        fold_sizes[fold] += group_sizes[group]
+    sample_folds = group_folds[group_indexes]
+    return [np.flatnonzero(sample_folds == fold) for fold in range(k)]
+
+
+def fold_train_set(train_data, train_labels, folds, fold):
+    """
+   Gathers the samples outside of a fold, to train on. Instead of allocating a
+   copy of almost the whole design matrix for every fold, the samples are
+   taken into a buffer that is allocated once per process, and reused by all
+   the folds it runs, so the model of a fold must be done with them before
+   the next fold is gathered.
+   :param train_data: the design matrix
+   :param train_labels: the label of each sample
+   :param folds: the sample indexes of each fold, as returned by make_folds
+   :param fold: the index of the fold
+
+   :return: the train samples, a view on the buffer, and their labels
+   """
+    global _fold_buffer
+    train_indexes = np.concatenate([indexes for other_fold, indexes in enumerate(folds) if other_fold != fold])
+    shape = (len(train_labels) - min(len(indexes) for indexes in folds),) + train_data.shape[1:]
+    if (_fold_buffer is None or _fold_buffer.shape[1:] != shape[1:] or _fold_buffer.dtype != train_data.dtype
+            or len(_fold_buffer) < shape[0]):
+        # Free the old buffer before allocating the new one
+        _fold_buffer = None
+        _fold_buffer = np.empty(shape, dtype=train_data.dtype)
+    samples = _fold_buffer[:len(train_indexes)]
+    np.take(train_data, train_indexes, axis=0, out=samples)
+    return samples, np.asarray(train_labels)[train_indexes]
+
+
+def _run_fold(fold):
+    """Fits and scores a fresh copy of the model on one fold of the shared data"""
+    model, train_data, train_labels, folds = _cv_data
+    test_indexes = folds[fold]
+    fold_data, fold_labels = fold_train_set(train_data, train_labels, folds, fold)
+
+    fold_model = base.clone(model)
+    start = time.time()
+    fold_model.fit(fold_data, fold_labels)
+    fit_time = time.time() - start
+
+    start = time.time()
+    score = fold_model.score(train_data[test_indexes], train_labels[test_indexes])
+    score_time = time.time() - start
+
+    return FoldResult(fold, score, len(fold_labels), len(test_indexes), fit_time, score_time)
+
+
+def _streaming_folds(model, train_data, train_labels, folds):
+    """
+   Cross validates a streaming_ridge.StreamingRidgeClassifier from the
+   statistics of every fold, which are accumulated in one pass over the design
+   matrix. Every fold subtracts its own statistics from the total and solves
+   again, so no train set is gathered at all. The regularization strength of
+   a fold is chosen by leaving out each of the other folds in turn.
+   """
+    fold_model = base.clone(model)
+    start = time.time()
+    for fold, indexes in enumerate(folds):
+        fold_model.partial_fit(train_data[indexes], train_labels[indexes], fold)
+    accumulate_time = (time.time() - start) / len(folds)
+
+    results = []
+    for fold, test_indexes in enumerate(folds):
+        start = time.time()
+        statistics = fold_model.remove_group(fold)
+        fold_model.solve()
+        fit_time = accumulate_time + time.time() - start
+
+        start = time.time()
+        score = fold_model.score(train_data[test_indexes], train_labels[test_indexes])
+        score_time = time.time() - start
+        fold_model.add_group(fold, statistics)
+
+        results.append(FoldResult(fold, score, len(train_labels) - len(test_indexes), len(test_indexes), fit_time,
+                                  score_time))
+    return results
+
+
+def k_fold_cv(model, train_data, train_labels, k, groups=None, n_jobs=1):
+    """
+   Run kfold cross validation and print the scores.
+   The folds only hold indexes into the design matrix. A streaming ridge model
+   is cross validated from the statistics of the folds. Any other model is
+   trained on the samples outside of each fold, gathered into a buffer reused
+   by all folds, see fold_train_set. With n_jobs, those folds run in parallel
+   worker processes, which share the design matrix with this process.
+   :param model: the (unfitted) model, which is cloned for every fold
+   :param train_data: the design matrix
+   :param train_labels: the label of each sample
+   :param k: number of folds
+   :param groups: optional group of each sample, e.g. from build_groups
+   :param n_jobs: number of worker processes, None for all cores
+
+   :return: list with a FoldResult for each fold
+   """
+    global _cv_data, _fold_buffer
+    train_data = np.asarray(train_data)
+    train_labels = np.asarray(train_labels)
+    folds = make_folds(len(train_labels), k, groups)
+
+    _cv_data = model, train_data, train_labels, folds
+    try:
+        if isinstance(model, streaming_ridge.StreamingRidgeClassifier):
+            results = _streaming_folds(model, train_data, train_labels, folds)
+        elif n_jobs == 1:
+            results = map(_run_fold, range(k))
+        else:
+            pool = multiprocessing.Pool(n_jobs)
+            try:
+                results = pool.map(_run_fold, range(k), chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _cv_data = None
+        _fold_buffer = None
+
+    for result in results:
+        print("Score for iteration = {} was: {:.2f} % (fit {:.2f} s, score {:.2f} s)".format(
+            result.fold, result.score * 100, result.fit_time, result.score_time))
+    print("Average score: {:.2f} %".format(np.mean([result.score for result in results]) * 100))
+
+    return results
+
+
+def build_groups(training_data):
+    """The session of each sample, in the order of build_sets"""
+    if any(interval.session is None for interval in training_data):
+        raise ValueError('The intervals do not know their session, so they can not be grouped. They were parsed '
+                         'before intervals kept their session: rebuild the parsed and processed pickles with '
+                         'data_pickle.py and feature_extraction.py')
+    return np.repeat([interval.session for interval in training_data],
+                     [len(interval.samples) for interval in training_data])
 
 
 def build_sets(training_data):
-    x = []
-    y = []
-
-    for session in training_data:
-        for sample in session.samples:
-            x.append(sample)
-            y.append(int(session.subject))
-
+    """
+   Builds the design matrix and the labels of the training data.
+   The total number of samples is known from the interval lengths, so all
+   samples are concatenated into one preallocated array, and the labels are
+   repeated per interval. Callers needing the matrix more than once should
+   build it once and pass it along, e.g. to train_model.
+   :param training_data: list of parsed intervals
+
+   :return: the design matrix and the array of labels
+   """
+    lengths = [len(interval.samples) for interval in training_data]
+    nr_columns = training_data[0].samples.shape[1] if training_data else 0
+    dtype = training_data[0].samples.dtype if training_data else float
+    x = np.empty((sum(lengths), nr_columns), dtype=dtype)
+    if training_data:
+        np.concatenate([interval.samples for interval in training_data], out=x)
+    y = np.repeat(np.array([int(interval.subject) for interval in training_data], dtype=int), lengths)
     return x, y
 
 
@@ -116,6 +327,9 @@ def main():
     utils.dump_npy(predictions_linear, pred_file_name)
     print 'Dumped predictions to %s' % pred_file_name
 
+    instrumentation.print_report()
+    print "Saved run report to %s" % instrumentation.write_report()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,96 @@
+"""Load generator measuring the latency and throughput of the scoring service.
+
+A number of concurrent clients each post .dat files to the service, one after
+the other, over a kept-alive connection. The latency of every request is
+recorded, and the p50 and p99 latency and the throughput are reported.
+
+Usage: python load_generator.py <file.dat> [<file.dat> ...] [--url <url>]
+           [--requests <n>] [--concurrency <n>]
+"""
+import argparse
+import httplib
+import json
+import threading
+import time
+import urlparse
+
+import numpy as np
+
+import scoring_service
+
+DEFAULT_URL = 'http://%s:%d%s' % (scoring_service.DEFAULT_HOST, scoring_service.DEFAULT_PORT,
+                                  scoring_service.SCORE_PATH)
+
+
+def _run_client(url, contents, nr_requests, latencies, errors):
+    """Posts nr_requests of the contents in turn, appending their latencies"""
+    parsed_url = urlparse.urlparse(url)
+    connection = httplib.HTTPConnection(parsed_url.hostname, parsed_url.port)
+    try:
+        for request_nr in xrange(nr_requests):
+            start = time.time()
+            connection.request('POST', parsed_url.path, contents[request_nr % len(contents)])
+            response = connection.getresponse()
+            body = response.read()
+            latencies.append(time.time() - start)
+            if response.status != 200:
+                errors.append(json.loads(body).get('error'))
+    finally:
+        connection.close()
+
+
+def generate_load(url, contents, nr_requests=1000, concurrency=16):
+    """
+   Sends requests to the scoring service from concurrent clients.
+   :param url: the url of the score path of the service
+   :param contents: list with the .dat contents to post, used in turn
+   :param nr_requests: total number of requests
+   :param concurrency: number of concurrent clients
+
+   :return: dict with the latency percentiles in ms, the throughput in requests
+      per second and the number of failed requests
+   """
+    latencies = []
+    errors = []
+    requests_per_client = [nr_requests // concurrency + (client < nr_requests % concurrency)
+                           for client in range(concurrency)]
+    clients = [threading.Thread(target=_run_client, args=(url, contents, nr_client_requests, latencies, errors))
+               for nr_client_requests in requests_per_client]
+    start = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    wall_time = time.time() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return dict(
+        nr_requests=len(latencies),
+        nr_errors=len(errors),
+        concurrency=concurrency,
+        p50_ms=float(np.percentile(latencies_ms, 50)),
+        p99_ms=float(np.percentile(latencies_ms, 99)),
+        max_ms=float(latencies_ms.max()),
+        requests_per_second=len(latencies) / wall_time)
+
+
+def main(dat_paths, url=DEFAULT_URL, nr_requests=1000, concurrency=16):
+    contents = []
+    for dat_path in dat_paths:
+        with open(dat_path, 'rb') as dat_file:
+            contents.append(dat_file.read())
+    results = generate_load(url, contents, nr_requests, concurrency)
+    print "%d requests from %d clients, %d failed" % (
+        results['nr_requests'], results['concurrency'], results['nr_errors'])
+    print "p50 %.2f ms, p99 %.2f ms, max %.2f ms, %.1f requests/s" % (
+        results['p50_ms'], results['p99_ms'], results['max_ms'], results['requests_per_second'])
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description='Measures the latency of the scoring service.')
+    argument_parser.add_argument('dat_paths', nargs='+')
+    argument_parser.add_argument('--url', default=DEFAULT_URL)
+    argument_parser.add_argument('--requests', dest='nr_requests', type=int, default=1000)
+    argument_parser.add_argument('--concurrency', type=int, default=16)
+    arguments = argument_parser.parse_args()
+    main(**vars(arguments))
@@ -0,0 +1,190 @@
+"""Searches a grid of linear models for the one with the best cross validation score.
+
+The candidates, ridge classifiers with different regularizations, linear SVMs
+and a one-vs-rest classifier per subject, are fitted and scored with session
+grouped cross validation in a pool of worker processes. The design matrix is
+written to .npy files once, and every worker memory-maps them, so the
+training data is shared between the workers instead of being pickled to each
+of them. Every fold of every candidate is a separate task, which keeps all
+the cores busy until the end. A leaderboard with the score and the time spent
+on every candidate is printed at the end.
+
+Usage: python model_search.py [--folds <k>] [--jobs <number_of_processes>]
+"""
+import argparse
+import collections
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from sklearn import base
+from sklearn import linear_model as sk_linear_model
+from sklearn import multiclass
+from sklearn import svm
+
+from individual.src import utils, data
+import linear_model
+
+DEFAULT_NR_FOLDS = 5
+
+CandidateResult = collections.namedtuple(
+    'CandidateResult',
+    [
+        'name',  # The name of the candidate
+        'mean_score',  # The mean accuracy over the folds
+        'std_score',  # The standard deviation of the accuracy over the folds
+        'fit_time',  # Seconds spent fitting, summed over the folds
+        'score_time',  # Seconds spent scoring, summed over the folds
+    ])
+
+# Memory-mapped design matrix, labels and folds of a worker process, loaded
+# once by _init_worker
+_search_data = None
+
+
+def default_candidates():
+    """
+   The grid of candidate models.
+   :return: list of (name, unfitted model) pairs
+   """
+    candidates = [('ridge_cv', linear_model.make_default_model())]
+    for alpha in (0.1, 1., 10., 100.):
+        candidates.append(('ridge_alpha_%g' % alpha,
+                           sk_linear_model.RidgeClassifier(alpha=alpha, fit_intercept=False)))
+    candidates.append(('ridge_intercept', sk_linear_model.RidgeClassifier(alpha=1.)))
+    for c in (0.01, 1.):
+        # The primal problem is a lot faster with many more samples than features
+        candidates.append(('linear_svc_C_%g' % c, svm.LinearSVC(C=c, dual=False)))
+    candidates.append(('ovr_logistic', multiclass.OneVsRestClassifier(
+        sk_linear_model.LogisticRegression(solver='lbfgs'))))
+    return candidates
+
+
+def _share_arrays(folder, **arrays):
+    """Writes the arrays to .npy files in folder, returning their paths"""
+    paths = {}
+    for name, array in arrays.iteritems():
+        paths[name] = os.path.join(folder, name + '.npy')
+        utils.dump_npy(array, paths[name])
+    return paths
+
+
+def _init_worker(paths, k):
+    """Memory-maps the shared design matrix and labels, and splits the folds"""
+    global _search_data
+    train_data = utils.load_npy(paths['train_data'], mmap_mode='r')
+    train_labels = utils.load_npy(paths['train_labels'], mmap_mode='r')
+    groups = utils.load_npy(paths['groups'], mmap_mode='r') if 'groups' in paths else None
+    _search_data = train_data, train_labels, linear_model.make_folds(len(train_labels), k, groups)
+
+
+def _run_task(task):
+    """Fits and scores one candidate on one fold of the shared data"""
+    candidate_index, model, fold = task
+    train_data, train_labels, folds = _search_data
+    test_indexes = folds[fold]
+    fold_data, fold_labels = linear_model.fold_train_set(train_data, train_labels, folds, fold)
+
+    fold_model = base.clone(model)
+    start = time.time()
+    fold_model.fit(fold_data, fold_labels)
+    fit_time = time.time() - start
+
+    start = time.time()
+    score = fold_model.score(train_data[test_indexes], train_labels[test_indexes])
+    score_time = time.time() - start
+
+    return candidate_index, linear_model.FoldResult(
+        fold, score, len(fold_labels), len(test_indexes), fit_time, score_time)
+
+
+def search(train_data, train_labels, groups=None, candidates=None, k=DEFAULT_NR_FOLDS, n_jobs=None):
+    """
+   Cross validates every candidate model, in parallel.
+   :param train_data: the design matrix, e.g. from linear_model.build_sets
+   :param train_labels: the label of each sample
+   :param groups: optional group of each sample, e.g. from linear_model.build_groups
+   :param candidates: list of (name, unfitted model) pairs, defaults to default_candidates
+   :param k: number of folds
+   :param n_jobs: number of worker processes, None for all cores
+
+   :return: list with a CandidateResult for each candidate, best first
+   """
+    global _search_data
+    if candidates is None:
+        candidates = default_candidates()
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+    tasks = [(index, model, fold) for index, (_, model) in enumerate(candidates) for fold in range(k)]
+
+    folder = tempfile.mkdtemp()
+    try:
+        arrays = dict(train_data=np.asarray(train_data), train_labels=np.asarray(train_labels))
+        if groups is not None:
+            # Small integer codes can be memory-mapped, unlike e.g. session ids
+            arrays['groups'] = np.unique(groups, return_inverse=True)[1]
+        paths = _share_arrays(folder, **arrays)
+        if n_jobs == 1:
+            _init_worker(paths, k)
+            task_results = map(_run_task, tasks)
+        else:
+            pool = multiprocessing.Pool(n_jobs, _init_worker, (paths, k))
+            try:
+                task_results = pool.map(_run_task, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        shutil.rmtree(folder)
+        # Releases the memory maps of the removed folder held by a search in this process
+        _search_data = None
+        linear_model._fold_buffer = None
+
+    fold_results = collections.defaultdict(list)
+    for candidate_index, fold_result in task_results:
+        fold_results[candidate_index].append(fold_result)
+    results = []
+    for index, (name, _) in enumerate(candidates):
+        scores = [result.score for result in fold_results[index]]
+        results.append(CandidateResult(
+            name, np.mean(scores), np.std(scores),
+            sum(result.fit_time for result in fold_results[index]),
+            sum(result.score_time for result in fold_results[index])))
+    return sorted(results, key=lambda result: -result.mean_score)
+
+
+def print_leaderboard(results, wall_time=None):
+    """Prints the candidates, best first, with the time spent on each of them"""
+    print "%-4s %-20s %10s %8s %10s %10s" % ('rank', 'candidate', 'score (%)', 'std', 'fit (s)', 'score (s)')
+    for rank, result in enumerate(results, 1):
+        print "%-4d %-20s %10.2f %8.2f %10.2f %10.2f" % (
+            rank, result.name, result.mean_score * 100, result.std_score * 100, result.fit_time, result.score_time)
+    if wall_time is not None:
+        total_time = sum(result.fit_time + result.score_time for result in results)
+        print "Searched %d candidates in %.2f s wall time, %.2f s of work (%.1fx)" % (
+            len(results), wall_time, total_time, total_time / max(wall_time, 1e-9))
+
+
+def main(k=DEFAULT_NR_FOLDS, n_jobs=None):
+    dataset = data.load_pickled_data(data.PROCESSED_PICKLE_PATH)
+    train_data = dataset['train']
+
+    x, y = linear_model.build_sets(train_data)
+    groups = None
+    if all(interval.session is not None for interval in train_data):
+        groups = linear_model.build_groups(train_data)
+
+    start = time.time()
+    results = search(x, y, groups, k=k, n_jobs=n_jobs)
+    print_leaderboard(results, time.time() - start)
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description='Searches a grid of linear models.')
+    argument_parser.add_argument('--folds', dest='k', type=int, default=DEFAULT_NR_FOLDS)
+    argument_parser.add_argument('--jobs', dest='n_jobs', type=int)
+    arguments = argument_parser.parse_args()
+    main(arguments.k, arguments.n_jobs)
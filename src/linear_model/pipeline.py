@@ -0,0 +1,455 @@
+"""Streaming pipeline chaining parsing, pre-processing, feature extraction,
+scaling and model training in one process.
+
+Instead of writing the full data set to a pickle file after every step, the
+intervals are streamed through all the stages in bounded-size chunks. Each
+stage only keeps its fitted state (e.g. the ICA decomposer or the scaler).
+Fitting a stage takes one pass over the train data through all the stages
+before it, so intermediate results never need to be stored. A stage can be
+asked to checkpoint its train output to disk, after which the later stages
+read from that file instead of recomputing everything before it. With a
+StageCache, every fitted stage and its train output are cached on disk, keyed by
+their input, parameters and code, so refitting with other parameters only
+recomputes the stages that changed.
+"""
+import hashlib
+import itertools
+import os
+
+import numpy as np
+
+from individual.src import utils, data, instrumentation, channel_stats
+import data_parser as parser
+import data_preprocessing
+import linear_model
+import feature_extraction
+import stage_cache
+import streaming_ridge
+
+DEFAULT_CHUNK_SIZE = 256
+PIPELINE_PREDICTIONS_BASENAME = os.path.join('Predictions', 'pipeline')
+FITTED_PIPELINE_PATH = os.path.join('Models', 'pipeline.pkl')
+
+
+def _chunk_sessions(sessions, chunk_size):
+    """Groups the intervals of a stream of sessions into chunks of sessions.
+
+    Sessions with more intervals than fit in a chunk are split over multiple
+    chunks, each holding a copy of the session with part of its intervals.
+    """
+    chunk = []
+    nr_intervals = 0
+    for session in sessions:
+        start = 0
+        while start < len(session.intervals):
+            end = start + chunk_size - nr_intervals
+            chunk.append(session._replace(intervals=session.intervals[start:end]))
+            nr_intervals += len(chunk[-1].intervals)
+            start = end
+            if nr_intervals == chunk_size:
+                yield chunk
+                chunk = []
+                nr_intervals = 0
+    if chunk:
+        yield chunk
+
+
+def _chunk_intervals(intervals, chunk_size):
+    """Groups a stream of intervals into lists of at most chunk_size."""
+    intervals = iter(intervals)
+    while True:
+        chunk = list(itertools.islice(intervals, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_samples(chunks):
+    """Iterates over the samples of all train intervals in a stream of chunks."""
+    return (interval.samples for chunk in chunks for interval in chunk)
+
+
+class Stage(object):
+    """A step of the pipeline, transforming chunks of train and test intervals.
+
+    Stages that need to be fitted override fit, which gets an iterable over
+    the train chunks as transformed by all the previous stages. Stages with
+    parameters that change their output return them from params, and list the
+    modules doing their work in dependencies, so the stage cache can tell
+    their outputs apart. Stages whose uses_train_sessions is true get the ids
+    of the raw train sessions as train_sessions before they are fitted.
+    """
+    name = None
+    dependencies = ()
+    uses_train_sessions = False
+
+    def __init__(self, checkpoint=None):
+        """
+       :param checkpoint: optional .pkl path to which the transformed train
+          chunks of this stage are written, so later stages can read them back
+       """
+        self.checkpoint = checkpoint
+
+    def params(self):
+        return {}
+
+    def get_state(self):
+        """The fitted state of the stage"""
+        return dict((name, value) for name, value in self.__dict__.iteritems() if name != 'checkpoint')
+
+    def set_state(self, state):
+        self.__dict__.update(state)
+
+    def fit(self, train_chunks):
+        pass
+
+    def transform_train(self, chunk):
+        return chunk
+
+    def transform_test(self, chunk):
+        return chunk
+
+
+class ParseStage(Stage):
+    """Parses the raw sessions and test intervals, see data_parser"""
+    name = 'parse'
+    dependencies = (parser,)
+
+    def __init__(self, remove_overlap=True, checkpoint=None, dtype=None):
+        super(ParseStage, self).__init__(checkpoint)
+        self.remove_overlap = remove_overlap
+        self.dtype = dtype
+
+    def params(self):
+        return dict(remove_overlap=self.remove_overlap,
+                    dtype=None if self.dtype is None else np.dtype(self.dtype).str)
+
+    def transform_train(self, chunk):
+        return parser.parse_train_data(chunk, self.remove_overlap, self.dtype)
+
+    def transform_test(self, chunk):
+        return parser.parse_test_data(chunk, self.dtype)
+
+
+class ImputeStage(Stage):
+    """Imputes the missing values of each interval, see data_preprocessing.
+    Fitting records the number of channels of the samples, and the mean of
+    every channel, which imputes the channels missing in a whole interval."""
+    name = 'impute'
+    dependencies = (data_preprocessing,)
+    nr_channels = None
+    column_means = None
+
+    def fit(self, train_chunks):
+        self.column_means = data_preprocessing.fit_column_means(_iter_samples(train_chunks))
+        if self.column_means is not None:
+            self.nr_channels = len(self.column_means)
+
+    def transform_train(self, chunk):
+        return data_preprocessing.impute_train_data(chunk, self.column_means)
+
+    def transform_test(self, chunk):
+        return data_preprocessing.impute_test_data(chunk, self.column_means)
+
+
+class OutlierStage(Stage):
+    """Clips the outliers of each channel, see data_preprocessing.
+    The clipping bounds are fitted on a reservoir sample of at most
+    max_fit_rows train samples, which is exact when there are fewer samples.
+    When the channel statistics of the raw data are given, the bounds are
+    taken from the merged quantile sketches of the train sessions instead,
+    without a pass over the data."""
+    name = 'outliers'
+    dependencies = (data_preprocessing, feature_extraction, channel_stats)
+
+    def __init__(self, outlier_percentiles=data_preprocessing.DEFAULT_OUTLIER_PERCENTILES, max_fit_rows=1000000,
+                 checkpoint=None, channel_stats=None, random_state=0):
+        """
+       :param channel_stats: optional statistics of the raw data, as returned
+          by data.load_channel_stats, holding at least every train session
+       :param random_state: seed of the reservoir sample, so the bounds are
+          the same in every run
+       """
+        super(OutlierStage, self).__init__(checkpoint)
+        self.outlier_percentiles = outlier_percentiles
+        self.max_fit_rows = max_fit_rows
+        self.random_state = random_state
+        self.channel_stats = channel_stats
+        self.train_sessions = None
+        self.bounds = None
+
+    @property
+    def uses_train_sessions(self):
+        # Only the channel statistics are merged per train session
+        return self.channel_stats is not None
+
+    def params(self):
+        params = dict(outlier_percentiles=self.outlier_percentiles, max_fit_rows=self.max_fit_rows,
+                      random_state=self.random_state, from_channel_stats=self.channel_stats is not None)
+        if self.channel_stats is not None:
+            # The bounds only depend on which sessions are merged
+            params['train_sessions'] = hashlib.sha1(repr(self.train_sessions)).hexdigest()
+        return params
+
+    def get_state(self):
+        state = super(OutlierStage, self).get_state()
+        # The statistics of all the sessions are an input, not fitted state
+        del state['channel_stats']
+        return state
+
+    def fit(self, train_chunks):
+        if self.outlier_percentiles is None:
+            return
+        if self.channel_stats is not None:
+            if self.train_sessions is None:
+                raise ValueError('The train sessions are needed to merge their channel statistics')
+            train_stats = data.merge_session_stats(self.channel_stats, self.train_sessions)
+            self.bounds = data_preprocessing.outlier_bounds_from_stats(train_stats, self.outlier_percentiles)
+            return
+        sample_chunks = feature_extraction.iter_sample_chunks(_iter_samples(train_chunks))
+        train_samples = feature_extraction.reservoir_sample(sample_chunks, self.max_fit_rows, self.random_state)
+        self.bounds = data_preprocessing.fit_outlier_bounds([train_samples], self.outlier_percentiles)
+
+    def transform_train(self, chunk):
+        if self.bounds is None:
+            return chunk
+        clipped_samples = data_preprocessing.clip_outliers([interval.samples for interval in chunk], self.bounds)
+        return [interval._replace(samples=samples) for interval, samples in zip(chunk, clipped_samples)]
+
+    def transform_test(self, chunk):
+        if self.bounds is None:
+            return chunk
+        return data_preprocessing.clip_outliers(chunk, self.bounds)
+
+
+class DecompositionStage(Stage):
+    """Projects the samples on their independent components, see feature_extraction"""
+    name = 'decompose'
+    dependencies = (feature_extraction,)
+
+    def __init__(self, number_components=5, max_fit_rows=None, checkpoint=None, random_state=0):
+        super(DecompositionStage, self).__init__(checkpoint)
+        self.number_components = number_components
+        self.max_fit_rows = max_fit_rows
+        self.random_state = random_state
+        self.decomposer = None
+
+    def params(self):
+        return dict(number_components=self.number_components, max_fit_rows=self.max_fit_rows,
+                    random_state=self.random_state)
+
+    def fit(self, train_chunks):
+        self.decomposer = feature_extraction.fit_decomposer(
+            _iter_samples(train_chunks), self.number_components, self.max_fit_rows, self.random_state)
+
+    def transform_train(self, chunk):
+        return [interval._replace(samples=feature_extraction.transform_samples(self.decomposer, interval.samples))
+                for interval in chunk]
+
+    def transform_test(self, chunk):
+        return [feature_extraction.transform_samples(self.decomposer, interval) for interval in chunk]
+
+
+class ScaleStage(Stage):
+    """Scales the features to zero mean and unit variance, fitted chunk by chunk"""
+    name = 'scale'
+    dependencies = (feature_extraction,)
+
+    def __init__(self, checkpoint=None):
+        super(ScaleStage, self).__init__(checkpoint)
+        self.scaler = None
+
+    def fit(self, train_chunks):
+        self.scaler = feature_extraction.fit_scaler(_iter_samples(train_chunks), incremental=True)
+
+    def transform_train(self, chunk):
+        return [interval._replace(samples=feature_extraction.transform_samples(self.scaler, interval.samples))
+                for interval in chunk]
+
+    def transform_test(self, chunk):
+        return [feature_extraction.transform_samples(self.scaler, interval) for interval in chunk]
+
+
+class ModelStage(Stage):
+    """Trains the linear model, and turns test intervals into predictions"""
+    name = 'model'
+    dependencies = (linear_model, streaming_ridge)
+
+    def __init__(self, streaming=False):
+        super(ModelStage, self).__init__()
+        self.streaming = streaming
+        self.model = None
+
+    def params(self):
+        return dict(streaming=self.streaming)
+
+    def fit(self, train_chunks):
+        if self.streaming:
+            train_data = (interval for chunk in train_chunks for interval in chunk)
+        else:
+            train_data = [interval for chunk in train_chunks for interval in chunk]
+        self.model = linear_model.train_model(train_data, self.streaming)
+
+    def transform_test(self, chunk):
+        return linear_model.predict(self.model, chunk)
+
+
+class Pipeline(object):
+    """Chains stages, streaming the data through them in chunks."""
+
+    def __init__(self, stages, chunk_size=DEFAULT_CHUNK_SIZE, cache=None):
+        """
+       :param stages: list of stages, the last one producing the predictions
+       :param chunk_size: maximum number of intervals in a chunk
+       :param cache: optional StageCache storing the fitted stages
+       """
+        self.stages = stages
+        self.chunk_size = chunk_size
+        self.cache = cache
+        # Paths of the stored train outputs of the stages, by stage index
+        self._train_outputs = {}
+
+    @property
+    def nr_channels(self):
+        """The number of channels of the raw data, as recorded by the impute stage, or None"""
+        for stage in self.stages:
+            if isinstance(stage, ImputeStage):
+                return stage.nr_channels
+        return None
+
+    def _train_chunks(self, train_source, nr_stages):
+        """Streams the train chunks through the first nr_stages stages.
+
+        Starts from the stored train output of the last of those stages that
+        has one, either a checkpoint or a cache entry.
+        """
+        first_stage = 0
+        chunks = None
+        for index in reversed(range(nr_stages)):
+            if index in self._train_outputs:
+                chunks = utils.load_pickle_stream(self._train_outputs[index])
+                first_stage = index + 1
+                break
+        if chunks is None:
+            chunks = _chunk_sessions(train_source(), self.chunk_size)
+        for stage in self.stages[first_stage:nr_stages]:
+            chunks = itertools.imap(stage.transform_train, chunks)
+        return chunks
+
+    def fit(self, train_source, source_key=None):
+        """
+       Fits all the stages, one after the other.
+       :param train_source: callable returning a new iterable over the raw
+          train sessions, it is called once for every pass over the data
+       :param source_key: key identifying the train data, see
+          stage_cache.file_source_key, required to use the cache
+
+       :return: the fitted pipeline
+       """
+        if self.cache is not None and source_key is None:
+            raise ValueError('A source_key is required to use the stage cache')
+        self._train_outputs = {}
+        upstream_key = source_key
+        for index, stage in enumerate(self.stages):
+            is_last = index == len(self.stages) - 1
+            if stage.uses_train_sessions:
+                stage.train_sessions = sorted(session.id for session in train_source() if session.intervals)
+            key = None
+            if self.cache is not None:
+                key = self.cache.key(upstream_key, stage)
+                entry = self.cache.get(key)
+                if entry is not None:
+                    print "Loading stage %s from the cache" % stage.name
+                    state, train_path = entry
+                    stage.set_state(state)
+                    if train_path:
+                        self._train_outputs[index] = train_path
+                    upstream_key = key
+                    continue
+
+            with instrumentation.stage("Fitting stage %s" % stage.name):
+                stage.fit(self._train_chunks(train_source, index))
+            if key is not None:
+                train_chunks = None if is_last else self._train_chunks(train_source, index + 1)
+                train_path = self.cache.put(key, stage, stage.get_state(), train_chunks, keep=[upstream_key])
+                if train_path:
+                    self._train_outputs[index] = train_path
+            elif stage.checkpoint:
+                print "Checkpointing stage %s to %s" % (stage.name, stage.checkpoint)
+                utils.dump_pickle_stream(self._train_chunks(train_source, index + 1), stage.checkpoint)
+                self._train_outputs[index] = stage.checkpoint
+            upstream_key = key
+
+        if self.cache is not None:
+            self.cache.report()
+        return self
+
+    def save(self, path=FITTED_PIPELINE_PATH):
+        """Pickles the fitted stages, without the cache and the stored train outputs"""
+        utils.dump_pickle(Pipeline(self.stages, self.chunk_size), path)
+
+    def predict(self, test_intervals):
+        """
+       Streams the raw test intervals through all the stages.
+       :param test_intervals: iterable over the raw test intervals
+
+       :return: array with the predictions of the last stage, in order
+       """
+        predictions = []
+        with instrumentation.stage("Predicting test data") as predict_stage:
+            for chunk in _chunk_intervals(test_intervals, self.chunk_size):
+                for stage in self.stages:
+                    chunk = stage.transform_test(chunk)
+                predictions.extend(chunk)
+            predict_stage.count(intervals=len(predictions))
+        return np.array(predictions)
+
+
+def load_pipeline(path=FITTED_PIPELINE_PATH):
+    """Loads a pipeline stored with Pipeline.save"""
+    return utils.load_pickle(path)
+
+
+def default_pipeline(number_components=5, chunk_size=DEFAULT_CHUNK_SIZE, cache=None, max_fit_rows=None, dtype=None,
+                     channel_stats=None):
+    """The pipeline doing what data_pickle, feature_extraction and linear_model do.
+    With the channel_stats of the raw data, as returned by data.load_channel_stats,
+    the outlier bounds are taken from the statistics of the train sessions."""
+    return Pipeline([
+        ParseStage(dtype=dtype),
+        ImputeStage(),
+        OutlierStage(channel_stats=channel_stats),
+        DecompositionStage(number_components, max_fit_rows),
+        ScaleStage(),
+        ModelStage(),
+    ], chunk_size, cache)
+
+
+def main():
+    print "Loading columnar data"
+    data.create_columnar_data(overwrite_old=False)
+    data_set = data.load_columnar_data()
+    train_set = data_set['train']
+    test_set = data_set['test']
+
+    stats = data.load_channel_stats(data.DEFAULT_COLUMNAR_PATH)
+    pipeline = default_pipeline(cache=stage_cache.StageCache(), channel_stats=stats)
+    source_key = stage_cache.file_source_key(
+        os.path.join(data.DEFAULT_COLUMNAR_PATH, 'samples.npy'),
+        os.path.join(data.DEFAULT_COLUMNAR_PATH, 'row_offsets.npy'))
+    pipeline.fit(lambda: iter(train_set), source_key)
+    pipeline.save()
+    print 'Saved the fitted pipeline to %s' % FITTED_PIPELINE_PATH
+    predictions_pipeline = pipeline.predict(test_set)
+
+    pred_file_name = utils.generate_unqiue_file_name(
+        PIPELINE_PREDICTIONS_BASENAME, 'npy')
+    utils.dump_npy(predictions_pipeline, pred_file_name)
+    print 'Dumped predictions to %s' % pred_file_name
+
+    instrumentation.print_report()
+    print "Saved run report to %s" % instrumentation.write_report()
+
+
+if __name__ == '__main__':
+    main()
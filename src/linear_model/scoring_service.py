@@ -0,0 +1,240 @@
+"""Local HTTP service scoring raw intervals with a fitted pipeline.
+
+The fitted artifact, as exported by fitted_artifact.py, or the fitted pipeline
+stored by pipeline.py, is loaded once. Every POST to
+/score carries the raw data of one interval in the .dat text format, and is
+answered with a JSON object holding the probability of each of the subjects,
+subject_1 to subject_8. Requests are handled by concurrent threads, which hand
+their interval to one batching thread. That thread waits at most max_wait
+seconds for more intervals to arrive, and then scores the whole batch with a
+single call of the artifact, so the model runs vectorized over all of them.
+
+Usage: python scoring_service.py [--artifact <folder> | --pipeline <pipeline.pkl>]
+           [--port <port>] [--max-batch-size <n>] [--max-wait-ms <ms>]
+"""
+import argparse
+import BaseHTTPServer
+import json
+import Queue
+import SocketServer
+import threading
+import time
+
+from individual.src import data, instrumentation
+import fitted_artifact
+import pipeline as pipeline_module
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8642
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT = 0.002
+SCORE_PATH = '/score'
+HEALTH_PATH = '/health'
+
+
+class _ScoringRequest(object):
+    """An interval waiting to be scored, and its result once it is"""
+
+    def __init__(self, interval_data):
+        self.interval_data = interval_data
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher(object):
+    """Scores the intervals submitted by concurrent threads in batches."""
+
+    def __init__(self, predict, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+        """
+       :param predict: function mapping a list of raw test intervals on an array
+          with the probabilities of every subject, e.g. FittedArtifact.predict
+       :param max_batch_size: maximum number of intervals in a batch
+       :param max_wait: maximum number of seconds to wait for a batch to fill up
+       """
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.nr_batches = 0
+        self.nr_intervals = 0
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def score(self, interval_data):
+        """
+       Scores one interval, blocking until its batch is done.
+       :param interval_data: the raw data of the interval
+
+       :return: array with the probability of every subject
+       """
+        request = _ScoringRequest(interval_data)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self):
+        """Blocks until a request arrives, then collects more until the batch is full or max_wait passed"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except Queue.Empty:
+                break
+            if request is None:
+                # Finish this batch first, and stop after it
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _score(self, batch):
+        predictions = self.predict([data.Interval(None, None, None, request.interval_data) for request in batch])
+        for request, prediction in zip(batch, predictions):
+            request.result = prediction
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._score(batch)
+            except Exception:
+                # Scores every request on its own, so that only the ones which
+                # cannot be scored fail, and not the whole batch
+                for request in batch:
+                    try:
+                        self._score([request])
+                    except Exception as error:
+                        request.error = error
+            self.nr_batches += 1
+            self.nr_intervals += len(batch)
+            for request in batch:
+                request.done.set()
+
+
+def _format_prediction(prediction):
+    return dict(('subject_%d' % (subject + 1), float(probability))
+                for subject, probability in enumerate(prediction))
+
+
+class _ScoringHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keeps the connection open between requests of the same client
+    protocol_version = 'HTTP/1.1'
+    # Buffers every response, which is flushed at once after each request, and
+    # sends it without waiting for the acknowledgement of the previous packet
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, body):
+        content = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path != HEALTH_PATH:
+            return self._reply(404, dict(error='Unknown path %s' % self.path))
+        batcher = self.server.batcher
+        self._reply(200, dict(status='ok', nr_batches=batcher.nr_batches, nr_intervals=batcher.nr_intervals))
+
+    def do_POST(self):
+        content = self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        if self.path != SCORE_PATH:
+            return self._reply(404, dict(error='Unknown path %s' % self.path))
+        try:
+            interval_data = data.parse_dat_text(content)
+        except ValueError as error:
+            return self._reply(400, dict(error='Invalid .dat content: %s' % error))
+        if interval_data.ndim != 2:
+            return self._reply(400, dict(error='Expected multiple rows of channels'))
+        nr_channels = self.server.nr_channels
+        if nr_channels is not None and interval_data.shape[1] != nr_channels:
+            return self._reply(400, dict(error='Expected %d channels, but got %d' % (
+                nr_channels, interval_data.shape[1])))
+        try:
+            prediction = self.server.batcher.score(interval_data)
+        except Exception as error:
+            return self._reply(500, dict(error=str(error)))
+        self._reply(200, _format_prediction(prediction))
+
+    def log_message(self, format, *args):
+        # Logging every request would dominate the latency
+        pass
+
+
+class ScoringServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server handling every connection in its own thread"""
+    daemon_threads = True
+    # Many load generator clients connect at once
+    request_queue_size = 128
+
+    def __init__(self, address, batcher, nr_channels=None):
+        """
+       :param nr_channels: the number of channels of the intervals to accept,
+          None to accept any
+       """
+        BaseHTTPServer.HTTPServer.__init__(self, address, _ScoringHandler)
+        self.batcher = batcher
+        self.nr_channels = nr_channels
+
+
+def serve(scorer, host=DEFAULT_HOST, port=DEFAULT_PORT, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+          max_wait=DEFAULT_MAX_WAIT):
+    """
+   Creates the scoring server, without starting it.
+   :param scorer: the fitted_artifact.FittedArtifact or fitted pipeline.Pipeline
+
+   :return: the ScoringServer, call serve_forever to start it
+   """
+    # Pipeline stages run for every batch, which should not print or pile up records
+    instrumentation.set_enabled(False)
+    batcher = MicroBatcher(scorer.predict, max_batch_size, max_wait)
+    return ScoringServer((host, port), batcher, scorer.nr_channels)
+
+
+def main(artifact_folder, pipeline_path, host, port, max_batch_size, max_wait_ms):
+    if pipeline_path is not None:
+        print "Loading the fitted pipeline from %s" % pipeline_path
+        scorer = pipeline_module.load_pipeline(pipeline_path)
+    else:
+        print "Loading the fitted artifact from %s" % artifact_folder
+        scorer = fitted_artifact.load_artifact(artifact_folder)
+    server = serve(scorer, host, port, max_batch_size, max_wait_ms / 1000.)
+    print "Scoring intervals posted to http://%s:%d%s" % (host, port, SCORE_PATH)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+
+
+if __name__ == '__main__':
+    argument_parser = argparse.ArgumentParser(description='Serves the predictions of a fitted pipeline.')
+    argument_parser.add_argument('--artifact', dest='artifact_folder', default=fitted_artifact.DEFAULT_ARTIFACT_FOLDER)
+    argument_parser.add_argument('--pipeline', dest='pipeline_path')
+    argument_parser.add_argument('--host', default=DEFAULT_HOST)
+    argument_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    argument_parser.add_argument('--max-batch-size', dest='max_batch_size', type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    argument_parser.add_argument('--max-wait-ms', dest='max_wait_ms', type=float, default=DEFAULT_MAX_WAIT * 1000)
+    arguments = argument_parser.parse_args()
+    main(**vars(arguments))
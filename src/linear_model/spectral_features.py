@@ -0,0 +1,190 @@
+"""Sliding-window spectral features of the intervals.
+
+Instead of classifying every sample on its own, every interval is cut into
+overlapping windows, and each window is described by the mean, standard
+deviation, minimum and maximum of every channel, and the log power of every
+channel in a number of frequency bands. The windows are strided views on the
+samples of the intervals, so they are never copied, and the features of all
+windows of all equally long intervals are computed by one batched FFT.
+
+Every interval keeps its place in the data, with one row of features per
+window as its samples, so the scaler of feature_extraction and the trainer of
+linear_model work on the output unchanged. The features are saved next to,
+not over, the processed data of feature_extraction.
+"""
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from individual.src import utils, data, instrumentation
+import feature_extraction
+
+DEFAULT_WINDOW_SIZE = 32
+DEFAULT_WINDOW_STEP = 16
+DEFAULT_NR_BANDS = 4
+# Maximum number of windows whose features are computed in one batch, bounding
+# the memory used by the FFT
+DEFAULT_MAX_BATCH_WINDOWS = 50000
+# Mean, standard deviation, minimum and maximum of every channel
+_NR_STATISTICS = 4
+
+
+def nr_windows(nr_rows, window_size=DEFAULT_WINDOW_SIZE, step=DEFAULT_WINDOW_STEP):
+    """The number of whole windows in an interval of nr_rows samples"""
+    if nr_rows < window_size:
+        return 0
+    return 1 + (nr_rows - window_size) // step
+
+
+def nr_features(nr_channels, nr_bands=DEFAULT_NR_BANDS):
+    """The number of features of every window"""
+    return (_NR_STATISTICS + nr_bands) * nr_channels
+
+
+def sliding_windows(samples, window_size=DEFAULT_WINDOW_SIZE, step=DEFAULT_WINDOW_STEP):
+    """
+   Cuts samples into overlapping windows, without copying them.
+   :param samples: array of shape (..., rows, channels), e.g. one interval or a
+      batch of equally long intervals
+   :param window_size: number of rows in a window
+   :param step: number of rows between the starts of two windows
+
+   :return: read-only view of shape (..., windows, window_size, channels)
+   """
+    samples = np.asarray(samples)
+    row_stride = samples.strides[-2]
+    shape = samples.shape[:-2] + (nr_windows(samples.shape[-2], window_size, step), window_size, samples.shape[-1])
+    strides = samples.strides[:-2] + (row_stride * step, row_stride, samples.strides[-1])
+    return as_strided(samples, shape=shape, strides=strides, writeable=False)
+
+
+def band_edges(window_size=DEFAULT_WINDOW_SIZE, nr_bands=DEFAULT_NR_BANDS):
+    """The first FFT bin of every band, splitting all bins above DC into equally wide bands"""
+    nr_bins = window_size // 2 + 1
+    if not 0 < nr_bands < nr_bins:
+        raise ValueError('Expected between 1 and %d bands for windows of %d rows, but got %d' % (
+            nr_bins - 1, window_size, nr_bands))
+    return np.linspace(1, nr_bins, nr_bands + 1).astype(np.int64)[:-1]
+
+
+def window_features(windows, nr_bands=DEFAULT_NR_BANDS):
+    """
+   Computes the features of a batch of windows at once.
+   :param windows: array of shape (..., window_size, channels)
+   :param nr_bands: number of frequency bands
+
+   :return: array of shape (..., nr_features) with, for every channel, the
+      mean, standard deviation, minimum, maximum and the log power in every band
+   """
+    window_size, nr_channels = windows.shape[-2:]
+    means = windows.mean(axis=-2)
+    centered = windows - means[..., np.newaxis, :]
+    deviations = np.sqrt((centered ** 2).mean(axis=-2))
+
+    # The windows are tapered, so the power does not leak between the bands
+    centered *= np.hanning(window_size)[:, np.newaxis]
+    power = np.abs(np.fft.rfft(centered, axis=-2)) ** 2 / window_size
+    band_power = np.add.reduceat(power, band_edges(window_size, nr_bands), axis=-2)
+
+    leading_shape = windows.shape[:-2]
+    # The FFT computes in float64, the features keep the type of the windows
+    return np.concatenate([
+        means,
+        deviations,
+        windows.min(axis=-2),
+        windows.max(axis=-2),
+        np.log1p(band_power).reshape(leading_shape + (nr_bands * nr_channels,)).astype(windows.dtype),
+    ], axis=-1)
+
+
+def interval_features(samples, window_size=DEFAULT_WINDOW_SIZE, step=DEFAULT_WINDOW_STEP, nr_bands=DEFAULT_NR_BANDS,
+                      max_batch_windows=DEFAULT_MAX_BATCH_WINDOWS):
+    """
+   Computes the window features of many intervals. Intervals of the same shape
+   are stacked, and the features of all their windows are computed by one call
+   of window_features, in batches of at most max_batch_windows windows.
+   :param samples: list with the (imputed) samples of each interval
+   :param window_size: number of rows in a window
+   :param step: number of rows between the starts of two windows
+   :param nr_bands: number of frequency bands
+   :param max_batch_windows: maximum number of windows in one batch
+
+   :return: list with, for each interval, an array with one row of features per window
+   """
+    features = [None] * len(samples)
+    by_shape = {}
+    for index, interval_samples in enumerate(samples):
+        by_shape.setdefault(np.shape(interval_samples), []).append(index)
+
+    for (nr_rows, nr_channels), indices in by_shape.iteritems():
+        windows_per_interval = nr_windows(nr_rows, window_size, step)
+        if not windows_per_interval:
+            for index in indices:
+                features[index] = np.empty((0, nr_features(nr_channels, nr_bands)))
+            continue
+        batch_size = max(1, max_batch_windows // windows_per_interval)
+        for start in xrange(0, len(indices), batch_size):
+            batch_indices = indices[start:start + batch_size]
+            batch = np.array([samples[index] for index in batch_indices])
+            if batch.dtype.kind != 'f':
+                batch = batch.astype(float)
+            batch_features = window_features(sliding_windows(batch, window_size, step), nr_bands)
+            for index, window_rows in zip(batch_indices, batch_features):
+                features[index] = window_rows
+    return features
+
+
+def _timed_interval_features(intervals, window_size, step, nr_bands):
+    """interval_features, printing the number of windows and how many were computed per second"""
+    start = time.time()
+    features = interval_features(intervals, window_size, step, nr_bands)
+    wall_time = time.time() - start
+    windows = sum(len(samples) for samples in features)
+    print "%d windows of %d intervals, %.0f windows/s" % (windows, len(intervals), windows / max(wall_time, 1e-9))
+    return features, windows
+
+
+def extract_spectral_features(train_data, test_data, window_size=DEFAULT_WINDOW_SIZE, step=DEFAULT_WINDOW_STEP,
+                              nr_bands=DEFAULT_NR_BANDS):
+    """
+   Replaces the samples of every train and test interval by its window features.
+   :param train_data: list with the pre-processed train intervals
+   :param test_data: list with the samples of the pre-processed test intervals
+
+   :return: the train intervals and test samples, with one row per window
+   """
+    with instrumentation.stage("Extracting spectral train features", intervals=len(train_data)) as train_stage:
+        train_features, windows = _timed_interval_features(
+            [interval.samples for interval in train_data], window_size, step, nr_bands)
+        train_data = [interval._replace(samples=samples) for interval, samples in zip(train_data, train_features)]
+        train_stage.count(rows=windows)
+
+    with instrumentation.stage("Extracting spectral test features", intervals=len(test_data)) as test_stage:
+        test_data, windows = _timed_interval_features(list(test_data), window_size, step, nr_bands)
+        test_stage.count(rows=windows)
+
+    return train_data, test_data
+
+
+def main():
+    print "Loading parsed data"
+    data_set = data.load_pickled_data(pickled_data_file_path=data.PARSED_PICKLE_PATH)
+    train_set = data_set['train']
+    test_set = data_set['test']
+
+    train_data, test_data = extract_spectral_features(train_set, test_set)
+    train_data, test_data = feature_extraction.scale_features(train_data, test_data)
+
+    print "Saving spectral features of the parsed data"
+    utils.dump_pickle(
+        dict(train=train_data, test=test_data), data.SPECTRAL_PICKLE_PATH)
+
+    print "Saved to %s" % data.SPECTRAL_PICKLE_PATH
+
+    instrumentation.print_report()
+    print "Saved run report to %s" % instrumentation.write_report()
+
+
+if __name__ == '__main__':
+    main()
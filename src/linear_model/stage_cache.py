@@ -0,0 +1,146 @@
+"""Content-addressed on-disk cache for the outputs of pipeline stages.
+
+Every cache entry holds the fitted state of a stage, together with its
+transformed train chunks. An entry is keyed by a hash of the key of its
+upstream input, the stage's parameters and the stage's code version, so a
+different setting of e.g. number_components is stored next to, instead of over,
+earlier settings. Parameter sweeps reuse every stage before the one that
+changed. When the total size of the cache exceeds its budget, the least
+recently used entries are evicted.
+"""
+import hashlib
+import inspect
+import os
+import shutil
+import time
+
+from individual.src import utils, data
+
+DEFAULT_CACHE_FOLDER = os.path.join(data.DEFAULT_DATA_LOCATION, 'stage_cache')
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+_INDEX_FILE_NAME = 'index.pkl'
+_STATE_FILE_NAME = 'state.pkl'
+_TRAIN_FILE_NAME = 'train.pkl'
+
+
+def file_source_key(*paths):
+    """Key of an input read from files, changing whenever one of them changes."""
+    signature = hashlib.sha1()
+    for path in paths:
+        file_stat = os.stat(path)
+        signature.update(repr((os.path.abspath(path), file_stat.st_size, file_stat.st_mtime)))
+    return signature.hexdigest()
+
+
+def code_version(stage):
+    """Hash of the source code of a stage, and of the modules it depends on."""
+    version = hashlib.sha1(inspect.getsource(type(stage)))
+    for module in stage.dependencies:
+        version.update(inspect.getsource(module))
+    return version.hexdigest()
+
+
+def _folder_size(folder):
+    return sum(os.path.getsize(os.path.join(folder, fname)) for fname in os.listdir(folder))
+
+
+class StageCache(object):
+    """Stores fitted stages and their train output, keyed by content."""
+
+    def __init__(self, cache_folder=DEFAULT_CACHE_FOLDER, max_bytes=DEFAULT_MAX_BYTES):
+        """
+       :param cache_folder: folder holding one sub folder per cache entry
+       :param max_bytes: size budget, above which entries are evicted
+       """
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _index_path(self):
+        return os.path.join(self.cache_folder, _INDEX_FILE_NAME)
+
+    def _entry_folder(self, key):
+        return os.path.join(self.cache_folder, key)
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path()):
+            return {}
+        return utils.load_pickle(self._index_path())
+
+    def _dump_index(self, index):
+        utils.dump_pickle(index, self._index_path())
+
+    def key(self, upstream_key, stage):
+        """Key of the output of a stage, fitted on the given upstream input."""
+        params = sorted(stage.params().items())
+        return hashlib.sha1(repr((upstream_key, stage.name, params, code_version(stage)))).hexdigest()
+
+    def get(self, key):
+        """
+       Looks up an entry, and marks it as most recently used.
+       :param key: key of the entry
+
+       :return: the (fitted stage state, train output path) or None on a miss
+       """
+        index = self._load_index()
+        if key not in index or not os.path.exists(self._entry_folder(key)):
+            self.misses += 1
+            return None
+        self.hits += 1
+        index[key]['last_access'] = time.time()
+        self._dump_index(index)
+        entry_folder = self._entry_folder(key)
+        train_path = os.path.join(entry_folder, _TRAIN_FILE_NAME)
+        state = utils.load_pickle(os.path.join(entry_folder, _STATE_FILE_NAME))
+        return state, train_path if os.path.exists(train_path) else None
+
+    def put(self, key, stage, state, train_chunks=None, keep=()):
+        """
+       Stores an entry, and evicts least recently used entries if needed.
+       :param key: key of the entry
+       :param stage: the fitted stage
+       :param state: the fitted state of the stage
+       :param train_chunks: optional iterable over the transformed train chunks
+       :param keep: keys of entries that should not be evicted
+
+       :return: the train output path, or None without train_chunks
+       """
+        entry_folder = self._entry_folder(key)
+        if os.path.exists(entry_folder):
+            shutil.rmtree(entry_folder)
+        utils.dump_pickle(state, os.path.join(entry_folder, _STATE_FILE_NAME))
+        train_path = None
+        if train_chunks is not None:
+            train_path = os.path.join(entry_folder, _TRAIN_FILE_NAME)
+            utils.dump_pickle_stream(train_chunks, train_path)
+
+        index = self._load_index()
+        index[key] = dict(
+            stage=stage.name, params=stage.params(),
+            size=_folder_size(entry_folder), last_access=time.time())
+        self._evict(index, keep=set(keep) | set([key]))
+        self._dump_index(index)
+        return train_path
+
+    def _evict(self, index, keep):
+        """Removes the least recently used entries until within budget."""
+        total_size = sum(entry['size'] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]['last_access']):
+            if total_size <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            total_size -= index[key]['size']
+            shutil.rmtree(self._entry_folder(key), ignore_errors=True)
+            del index[key]
+            self.evictions += 1
+
+    def report(self):
+        """Prints the hits, misses and size of the cache"""
+        index = self._load_index()
+        print "Stage cache: %d hits, %d misses, %d evictions, %.1f MB in %d entries" % (
+            self.hits, self.misses, self.evictions,
+            sum(entry['size'] for entry in index.values()) / 1024. ** 2, len(index))
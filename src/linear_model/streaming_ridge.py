@@ -0,0 +1,212 @@
+"""Ridge classifier trained from streamed sufficient statistics.
+
+Without an intercept, a ridge model only depends on the data through X^T X and
+X^T Y, which are accumulated interval by interval, so memory only depends on
+the number of features. One eigendecomposition of X^T X gives the solution for
+any number of regularization strengths. The statistics are also kept per
+session, so a session can be removed again for leave-one-session-out cross
+validation without refitting on all the other sessions.
+"""
+import warnings
+
+import numpy as np
+from sklearn import base
+from sklearn import exceptions
+from sklearn.utils import validation
+
+from individual.src import data
+
+DEFAULT_ALPHAS = (0.1, 1.0, 10.0)
+
+
+class _Statistics(object):
+    """The sufficient statistics of a set of samples"""
+
+    def __init__(self, nr_features, nr_classes):
+        self.nr_samples = 0
+        self.xtx = np.zeros((nr_features, nr_features))
+        self.xty = np.zeros((nr_features, nr_classes))
+        self.yty = np.zeros(nr_classes)
+
+    def add(self, other, sign=1):
+        self.nr_samples += sign * other.nr_samples
+        self.xtx += sign * other.xtx
+        self.xty += sign * other.xty
+        self.yty += sign * other.yty
+
+
+def _solve(statistics, alphas):
+    """
+   Solves the ridge problem for all alphas from one eigendecomposition.
+
+   :return: array with the coefficients for each alpha, of shape
+      (alphas, features, classes)
+   """
+    eigenvalues, eigenvectors = np.linalg.eigh(statistics.xtx)
+    rotated_xty = eigenvectors.T.dot(statistics.xty)
+    shrinkage = 1. / (eigenvalues[np.newaxis, :] + np.asarray(alphas, dtype=float)[:, np.newaxis])
+    return np.einsum('fe,ae,ec->afc', eigenvectors, shrinkage, rotated_xty)
+
+
+def _squared_errors(statistics, coefs):
+    """The squared error of each of the coefficients on a set of samples,
+    computed from its statistics: Y^T Y - 2 tr(W^T X^T Y) + tr(W^T X^T X W)"""
+    return (statistics.yty.sum()
+            - 2 * np.einsum('afc,fc->a', coefs, statistics.xty)
+            + np.einsum('afc,fg,agc->a', coefs, statistics.xtx, coefs))
+
+
+class StreamingRidgeClassifier(base.BaseEstimator, base.ClassifierMixin):
+    """
+   Ridge classifier without intercept, like linear_model.RidgeClassifierCV
+   (fit_intercept=False), fitted from streamed sufficient statistics.
+   The regularization strength is chosen from alphas by leave-one-session-out
+   squared error when there are multiple sessions.
+   """
+
+    def __init__(self, alphas=DEFAULT_ALPHAS, classes=None):
+        """
+       :param alphas: the regularization strengths to choose from
+       :param classes: the sorted classes, defaults to the subjects 1 to data.NR_SUBJECTS
+       """
+        self.alphas = alphas
+        self.classes = classes
+
+    def _reset(self):
+        """Forgets the statistics and the fitted model"""
+        for attribute in ('classes_', 'alpha_', 'coef_', '_total', '_groups'):
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+
+    def _init_statistics(self, nr_features):
+        """Creates the fitted state, at the first batch of samples"""
+        self.classes_ = np.arange(1, data.NR_SUBJECTS + 1) if self.classes is None else np.asarray(self.classes)
+        self._total = _Statistics(nr_features, len(self.classes_))
+        self._groups = {}
+
+    def _targets(self, labels):
+        """The labels as -1/1 coded targets, one column per class"""
+        labels = np.asarray(labels)
+        # searchsorted maps a label that is not a class on a neighbouring class
+        indexes = np.minimum(np.searchsorted(self.classes_, labels), len(self.classes_) - 1)
+        unknown = self.classes_[indexes] != labels
+        if np.any(unknown):
+            raise ValueError('Labels %s are not in the classes %s' % (
+                np.unique(labels[unknown]).tolist(), self.classes_.tolist()))
+        targets = -np.ones((len(labels), len(self.classes_)))
+        targets[np.arange(len(labels)), indexes] = 1
+        return targets
+
+    def partial_fit(self, samples, labels, group=None):
+        """
+       Adds the contribution of a batch of samples to the statistics.
+       :param samples: 2-D array of samples
+       :param labels: the class of each sample
+       :param group: the session of the samples, to be able to remove them again
+
+       :return: the classifier, which is not solved until solve is called
+       """
+        samples = np.asarray(samples, dtype=float)
+        if getattr(self, '_total', None) is None:
+            self._init_statistics(samples.shape[1])
+        targets = self._targets(labels)
+        batch = _Statistics(samples.shape[1], len(self.classes_))
+        batch.nr_samples = len(samples)
+        batch.xtx = samples.T.dot(samples)
+        batch.xty = samples.T.dot(targets)
+        batch.yty = (targets * targets).sum(axis=0)
+
+        self._total.add(batch)
+        if group not in self._groups:
+            self._groups[group] = _Statistics(samples.shape[1], len(self.classes_))
+        self._groups[group].add(batch)
+        return self
+
+    def remove_group(self, group):
+        """
+       Removes the contribution of a session from the statistics.
+       :param group: the session to remove
+
+       :return: the statistics of the removed session
+       """
+        statistics = self._groups.pop(group)
+        self._total.add(statistics, sign=-1)
+        return statistics
+
+    def add_group(self, group, statistics):
+        """Adds the statistics of a session back, see remove_group"""
+        self._groups[group] = statistics
+        self._total.add(statistics)
+
+    def leave_one_session_out_errors(self, alphas=None):
+        """
+       The squared error on each session, of the models trained on all other
+       sessions, for all alphas. Every fold only subtracts the statistics of
+       its session from the total and solves again, instead of refitting.
+
+       :return: dict mapping every session on an array of errors per alpha
+       """
+        alphas = self.alphas if alphas is None else alphas
+        errors = {}
+        for group, statistics in self._groups.items():
+            rest = _Statistics(*self._total.xty.shape)
+            rest.add(self._total)
+            rest.add(statistics, sign=-1)
+            errors[group] = _squared_errors(statistics, _solve(rest, alphas))
+        return errors
+
+    def solve(self, alpha=None):
+        """
+       Solves the model from the accumulated statistics.
+       :param alpha: the regularization strength, when not given it is chosen
+          from alphas by leave-one-session-out cross validation
+
+       :return: the fitted classifier
+       """
+        if getattr(self, '_total', None) is None:
+            raise exceptions.NotFittedError(
+                'This %s has no statistics yet, call partial_fit, fit or fit_intervals first' % type(self).__name__)
+        if alpha is None:
+            alpha = self.alphas[0]
+            if len(self.alphas) > 1:
+                if len(self._groups) > 1:
+                    errors = np.sum(self.leave_one_session_out_errors().values(), axis=0)
+                    alpha = self.alphas[int(np.argmin(errors))]
+                else:
+                    warnings.warn(
+                        'Choosing alpha needs the samples of at least two sessions, but got %d, so alpha=%g is used '
+                        'without cross validation. Pass groups, or rebuild the processed pickle so the intervals '
+                        'keep their session.' % (len(self._groups), alpha))
+        self.alpha_ = alpha
+        self.coef_ = _solve(self._total, [alpha])[0].T
+        return self
+
+    def fit(self, samples, labels, groups=None):
+        """Fits the classifier on a design matrix at once, grouped by session"""
+        self._reset()
+        if groups is None:
+            self.partial_fit(samples, labels)
+        else:
+            groups = np.asarray(groups)
+            for group in np.unique(groups):
+                self.partial_fit(samples[groups == group], np.asarray(labels)[groups == group], group)
+        return self.solve()
+
+    def fit_intervals(self, intervals):
+        """
+       Fits the classifier in a single streaming pass over parsed intervals.
+       :param intervals: iterable over parsed intervals, with their session
+       """
+        self._reset()
+        for interval in intervals:
+            self.partial_fit(interval.samples, np.repeat(int(interval.subject), len(interval.samples)),
+                             interval.session)
+        return self.solve()
+
+    def decision_function(self, samples):
+        validation.check_is_fitted(self, 'coef_')
+        return np.asarray(samples).dot(self.coef_.T)
+
+    def predict(self, samples):
+        decisions = self.decision_function(samples)
+        return self.classes_[np.argmax(decisions, axis=1)]
@@ -0,0 +1,49 @@
+"""Module with the metrics predictions of the subjects are scored with.
+
+Every prediction file holds, for each interval, the probability of each of the
+subjects 1 to data.NR_SUBJECTS. The log-loss is computed the way Kaggle
+scores submissions, so local scores, blend weights and the leaderboard all
+optimize the same objective.
+"""
+import numpy as np
+
+import data
+
+# Probabilities are clipped to avoid taking the log of zero
+EPSILON = 1e-15
+
+
+def log_loss(predictions, labels):
+    """The multiclass log-loss, the way Kaggle computes it.
+
+    The probabilities are clipped away from zero and one, and every row is
+    normalized to sum to one again before taking the log.
+
+    Args:
+      predictions: array with the probability of each of the subjects 1 to
+          data.NR_SUBJECTS, one row per interval.
+      labels: the subject of every interval.
+    """
+    predictions = np.clip(predictions, EPSILON, 1 - EPSILON)
+    rows = np.arange(len(labels))
+    probabilities = (predictions[rows, np.asarray(labels) - 1] /
+                     predictions.sum(axis=1))
+    return -np.mean(np.log(probabilities))
+
+
+def predicted_subjects(predictions):
+    """The most probable subject of every row of predictions."""
+    return np.argmax(predictions, axis=1) + 1
+
+
+def accuracy(predictions, labels):
+    """The fraction of rows whose most probable subject is the label."""
+    return np.mean(predicted_subjects(predictions) == np.asarray(labels))
+
+
+def confusion_matrix(predictions, labels):
+    """Counts every pair of true subject (rows) and predicted subject (columns)."""
+    pairs = ((np.asarray(labels) - 1) * data.NR_SUBJECTS +
+             predicted_subjects(predictions) - 1)
+    return np.bincount(pairs, minlength=data.NR_SUBJECTS ** 2).reshape(
+        data.NR_SUBJECTS, data.NR_SUBJECTS)
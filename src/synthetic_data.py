@@ -0,0 +1,136 @@
+"""Script generating a synthetic data set in the layout of the real data.
+
+This makes it possible to measure the performance of the whole pipeline
+without the competition data. The generated folder holds a Train folder with
+an activities.csv file and subject_XX/session_XX_XXX/NNNNN_NNN.dat interval
+files, and a Test folder with NNNNNN.dat interval files, just like data.py
+expects. Every subject has its own channel offsets and oscillations, so the
+models have something to learn, and NaN and Inf values are injected at random.
+The subject of every test interval is stored in test_labels.npy.
+
+Usage: python synthetic_data.py <path_to_output_folder> [<scale>]
+where scale is one of small, medium or large.
+"""
+import os
+import sys
+
+import numpy as np
+
+import data
+import utils
+
+# Configurations of the synthetic data set at different scales
+SCALES = {
+    'small': dict(nr_subjects=8, nr_sessions=2, nr_intervals=20,
+                  nr_test_intervals=100),
+    'medium': dict(nr_subjects=8, nr_sessions=4, nr_intervals=60,
+                   nr_test_intervals=400),
+    'large': dict(nr_subjects=8, nr_sessions=8, nr_intervals=150,
+                  nr_test_intervals=1500),
+}
+TEST_LABELS_FILE_NAME = 'test_labels.npy'
+NR_ACTIVITIES = 4
+
+
+def _subject_profiles(nr_subjects, nr_columns, random_state):
+    """The channel offsets and oscillation frequencies of every subject."""
+    offsets = random_state.randn(nr_subjects, nr_columns)
+    frequencies = random_state.uniform(0.5, 20, size=(nr_subjects, nr_columns))
+    return offsets, frequencies
+
+
+def _signal(subject, nr_rows, profiles, sample_rate, random_state):
+    """A continuous recording of a subject, with noise, NaN and Inf values."""
+    offsets, frequencies = profiles
+    times = np.arange(nr_rows)[:, np.newaxis] / float(sample_rate)
+    phases = random_state.uniform(0, 2 * np.pi, size=offsets.shape[1])
+    signal = (offsets[subject - 1] +
+              np.sin(2 * np.pi * frequencies[subject - 1] * times + phases) +
+              random_state.randn(nr_rows, offsets.shape[1]))
+    return signal
+
+
+def _inject_invalid_values(signal, nan_fraction, inf_fraction, random_state):
+    signal[random_state.rand(*signal.shape) < nan_fraction] = np.nan
+    invalid = random_state.rand(*signal.shape) < inf_fraction
+    signal[invalid] = np.inf * np.sign(random_state.randn(invalid.sum()))
+    return signal
+
+
+def _write_dat_file(path, interval_data):
+    np.savetxt(path, interval_data, fmt='%.6g')
+
+
+def create_synthetic_data(data_folder, nr_subjects=8, nr_sessions=2,
+                          nr_intervals=20, nr_test_intervals=100, nr_rows=100,
+                          nr_columns=12, nan_fraction=0.01, inf_fraction=0.002,
+                          random_state=0):
+    """Writes a synthetic data set.
+
+    Every session is one continuous recording, cut into 2 second intervals
+    starting every second, so consecutive intervals overlap by half, just like
+    the real data.
+
+    Args:
+      data_folder: folder in which the Train and Test folders are created.
+      nr_subjects: number of subjects.
+      nr_sessions: number of sessions of every subject.
+      nr_intervals: number of intervals in every session.
+      nr_test_intervals: number of test intervals.
+      nr_rows: number of samples in every 2 second interval.
+      nr_columns: number of channels.
+      nan_fraction: fraction of the values replaced by NaN.
+      inf_fraction: fraction of the values replaced by Inf or -Inf.
+      random_state: seed of the generated data.
+    """
+    random_state = np.random.RandomState(random_state)
+    profiles = _subject_profiles(nr_subjects, nr_columns, random_state)
+    sample_rate = nr_rows / 2.
+    step = nr_rows // 2
+    train_folder = os.path.join(data_folder, 'Train')
+    test_folder = os.path.join(data_folder, 'Test')
+
+    activities = []
+    for subject in range(1, nr_subjects + 1):
+        for session_nr in range(1, nr_sessions + 1):
+            session_id = 'session_%02d_%03d' % (subject, session_nr)
+            activities.append((session_id, random_state.randint(1, NR_ACTIVITIES + 1)))
+            session_folder = os.path.join(
+                train_folder, 'subject_%02d' % subject, session_id)
+            os.makedirs(session_folder)
+            signal = _inject_invalid_values(
+                _signal(subject, (nr_intervals + 1) * step, profiles,
+                        sample_rate, random_state),
+                nan_fraction, inf_fraction, random_state)
+            for interval_nr in range(nr_intervals):
+                _write_dat_file(
+                    os.path.join(session_folder, '%05d_000.dat' % interval_nr),
+                    signal[interval_nr * step:interval_nr * step + nr_rows])
+
+    with open(os.path.join(train_folder, data.ACTIVITIES_FILE_NAME), 'wb') as activities_file:
+        activities_file.write('Id,Activity\n')
+        for session_id, activity in activities:
+            activities_file.write('%s,%d\n' % (session_id, activity))
+
+    os.makedirs(test_folder)
+    test_labels = random_state.randint(1, nr_subjects + 1, size=nr_test_intervals)
+    for test_nr, subject in enumerate(test_labels):
+        interval_data = _inject_invalid_values(
+            _signal(subject, nr_rows, profiles, sample_rate, random_state),
+            nan_fraction, inf_fraction, random_state)
+        _write_dat_file(
+            os.path.join(test_folder, '%06d.dat' % test_nr), interval_data)
+    utils.dump_npy(test_labels, os.path.join(data_folder, TEST_LABELS_FILE_NAME))
+
+
+def main(data_folder, scale='small'):
+    create_synthetic_data(data_folder, **SCALES[scale])
+    print 'Created %s synthetic data set in %s' % (scale, data_folder)
+
+
+if __name__ == '__main__':
+    if not len(sys.argv) in (2, 3) or sys.argv[2:] and sys.argv[2] not in SCALES:
+        print ('Usage: python synthetic_data.py <path_to_output_folder> '
+               '[%s]' % '|'.join(sorted(SCALES)))
+    else:
+        main(*sys.argv[1:])
@@ -31,6 +31,45 @@ def load_pickle(path_to_pickle):
     return pickle.load(pkl_file)
 
 
+def dump_pickle_stream(items, path):
+  """Dumps the items of an iterable one after the other to a pkl file.
+
+  Only one item is held in memory at a time. Returns the number of items.
+  """
+  if not path.endswith('.pkl'):
+    raise ValueError(
+        'Pickle files should end with .pkl, but got %s instead' % path)
+  _make_dir(path)
+  nr_items = 0
+  with open(path, 'wb') as pkl_file:
+    for item in items:
+      pickle.dump(item, pkl_file, pickle.HIGHEST_PROTOCOL)
+      nr_items += 1
+  return nr_items
+
+
+def load_pickle_stream(path_to_pickle):
+  """Generator over the items dumped to a pkl file by dump_pickle_stream."""
+  with open(path_to_pickle, 'rb') as pkl_file:
+    while True:
+      try:
+        yield pickle.load(pkl_file)
+      except EOFError:
+        return
+
+
+def batches(items, batch_size):
+  """Generator over lists of up to batch_size consecutive items of an iterable."""
+  batch = []
+  for item in items:
+    batch.append(item)
+    if len(batch) == batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
 def dump_npy(array, path):
   """Dumps a single numpy array to a npy file."""
   if not path.endswith('.npy'):
@@ -41,8 +80,12 @@ def dump_npy(array, path):
     np.save(npy_file, array)
 
 
-def load_npy(path):
-  return np.load(path)
+def load_npy(path, mmap_mode=None):
+  """Loads a single numpy array from a npy file.
+
+  With a mmap_mode (e.g. 'r'), the file is memory-mapped instead of read.
+  """
+  return np.load(path, mmap_mode=mmap_mode)
 
 
 def timestamp():
@@ -0,0 +1,43 @@
+"""Makes the modules importable the way the scripts import them.
+
+The scripts in src import each other by module name, and the ones in
+src/linear_model import the modules in src through the individual package,
+which is the root of this repository.
+"""
+import imp
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'individual' not in sys.modules:
+    imp.load_module('individual', None, ROOT, ('', '', imp.PKG_DIRECTORY))
+# Before src, where linear_model is the package instead of the module
+sys.path[:0] = [os.path.join(ROOT, 'src', 'linear_model'),
+                os.path.join(ROOT, 'src')]
+
+
+@pytest.fixture(scope='session')
+def synthetic_folder(tmpdir_factory):
+    """A small synthetic data set, see synthetic_data."""
+    import synthetic_data
+    folder = str(tmpdir_factory.mktemp('synthetic'))
+    synthetic_data.create_synthetic_data(
+        folder, nr_subjects=3, nr_sessions=2, nr_intervals=6,
+        nr_test_intervals=12, nr_rows=40, nr_columns=4)
+    return folder
+
+
+@pytest.fixture(scope='module')
+def raw_dataset(synthetic_folder):
+    """The raw train and test data of synthetic_folder, for the pipeline.
+
+    The instrumentation is turned off, as the pipeline stages run many times.
+    """
+    from individual.src import data, instrumentation
+    instrumentation.set_enabled(False)
+    yield dict(train=data.load_train(os.path.join(synthetic_folder, 'Train'), 1),
+               test=data.load_test(os.path.join(synthetic_folder, 'Test'), 1))
+    instrumentation.set_enabled(True)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import channel_stats
+import data
+
+PERCENTILES = (0.1, 1, 5, 25, 50, 75, 95, 99, 99.9)
+# Largest distance, in percentiles, of the rank of a merged sketch percentile
+# from the percentile that was asked for
+MAX_RANK_ERROR = 0.05
+
+
+def _chunks(distribution, random_state):
+    """Chunks of unequal sizes and distributions, like the sessions."""
+    chunks = []
+    for index in range(64):
+        nr_rows = random_state.randint(200, 3000)
+        if distribution == 'normal':
+            chunks.append(random_state.randn(nr_rows, 3) + random_state.randn(3))
+        elif distribution == 'cauchy':
+            chunks.append(random_state.standard_cauchy((nr_rows, 3)))
+        else:
+            chunks.append(random_state.exponential(size=(nr_rows, 3)) * (index % 5 + 1))
+    return chunks
+
+
+@pytest.mark.parametrize('distribution', ['normal', 'cauchy', 'exponential'])
+def test_merge_error_bound(distribution):
+    chunks = _chunks(distribution, np.random.RandomState(0))
+    samples = np.concatenate(chunks)
+    stats = channel_stats.merge(channel_stats.compute(chunk) for chunk in chunks)
+
+    assert stats.nr_rows == len(samples)
+    np.testing.assert_array_equal(stats.count, len(samples))
+    np.testing.assert_allclose(stats.sum, samples.sum(axis=0))
+    np.testing.assert_allclose(channel_stats.mean(stats), samples.mean(axis=0))
+    np.testing.assert_allclose(channel_stats.variance(stats), samples.var(axis=0))
+    np.testing.assert_array_equal(stats.min, samples.min(axis=0))
+    np.testing.assert_array_equal(stats.max, samples.max(axis=0))
+
+    approximations = channel_stats.percentiles(stats, PERCENTILES)
+    for channel in range(samples.shape[1]):
+        ranks = 100. * np.searchsorted(np.sort(samples[:, channel]), approximations[:, channel],
+                                       side='right') / len(samples)
+        assert np.abs(ranks - PERCENTILES).max() <= MAX_RANK_ERROR
+
+
+def test_non_finite_values():
+    samples = np.array([[1., np.nan], [np.inf, 2.], [3., -np.inf], [5., np.nan]])
+    stats = channel_stats.merge([channel_stats.compute(samples[:2]), channel_stats.compute(samples[2:])])
+    np.testing.assert_array_equal(stats.count, [3, 1])
+    np.testing.assert_array_equal(stats.nan_count, [0, 2])
+    np.testing.assert_array_equal(stats.inf_count, [1, 1])
+    np.testing.assert_array_equal(stats.min, [1., 2.])
+    np.testing.assert_array_equal(stats.max, [5., 2.])
+    np.testing.assert_allclose(channel_stats.mean(stats), [3., 2.])
+
+
+def test_merge_nothing():
+    assert channel_stats.merge([]) is None
+
+
+def test_merge_session_stats():
+    random_state = np.random.RandomState(0)
+    sessions = dict(('session_%d' % index, channel_stats.compute(random_state.randn(100, 2)))
+                    for index in range(3))
+    stats = dict(sessions=sessions, train=channel_stats.merge(sessions.values()))
+
+    assert data.merge_session_stats(stats, sorted(sessions)) is stats['train']
+    subset = data.merge_session_stats(stats, ['session_0', 'session_2'])
+    assert subset.nr_rows == 200
+    np.testing.assert_allclose(subset.sum, sessions['session_0'].sum + sessions['session_2'].sum)
+    with pytest.raises(ValueError):
+        data.merge_session_stats(stats, ['session_0', 'session_3'])
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+
+import data
+
+
+def _create(folder, **kwargs):
+    data.create_columnar_data(columnar_data_folder=folder, num_workers=1,
+                              **kwargs)
+    return data.load_columnar_data(folder)
+
+
+def test_round_trip(synthetic_folder, tmpdir):
+    train = data.load_train(os.path.join(synthetic_folder, 'Train'), 1)
+    test = data.load_test(os.path.join(synthetic_folder, 'Test'), 1)
+    dataset = _create(str(tmpdir), train_data_folder=os.path.join(synthetic_folder, 'Train'),
+                      test_data_folder=os.path.join(synthetic_folder, 'Test'))
+
+    assert len(dataset['train']) == len(train)
+    for session, expected in zip(dataset['train'], train):
+        assert session[:4] == expected[:4]
+        assert len(session.intervals) == len(expected.intervals)
+        for interval, expected_interval in zip(session.intervals, expected.intervals):
+            assert interval.id == expected_interval.id
+            assert interval.time == expected_interval.time
+            assert interval.session is session
+            assert data._equal_rows(interval.data, expected_interval.data)
+    assert [interval.id for interval in dataset['test']] == [interval.id for interval in test]
+    for interval, expected in zip(dataset['test'], test):
+        assert interval.session is None
+        assert data._equal_rows(interval.data, expected.data)
+
+    stats = data.load_channel_stats(str(tmpdir))
+    assert stats['test'].nr_rows == sum(len(interval.data) for interval in test)
+
+
+def test_squeezed_intervals(tmpdir):
+    # np.loadtxt squeezes single column and single row files
+    single_column = [data.Interval('%d.dat' % index, None, None, np.arange(5.) + index)
+                     for index in range(3)]
+    dataset = _create(str(tmpdir.join('column')), dataset=dict(train=[], test=single_column))
+    for interval, expected in zip(dataset['test'], single_column):
+        assert interval.data.shape == (5, 1)
+        np.testing.assert_array_equal(interval.data[:, 0], expected.data)
+
+    mixed = [data.Interval('0.dat', None, None, np.ones((4, 3))),
+             data.Interval('1.dat', None, None, np.arange(3.))]
+    dataset = _create(str(tmpdir.join('mixed')), dataset=dict(train=[], test=mixed))
+    assert [interval.data.shape for interval in dataset['test']] == [(4, 3), (1, 3)]
+    np.testing.assert_array_equal(dataset['test'][1].data[0], mixed[1].data)
+    assert data.load_channel_stats(str(tmpdir.join('mixed')))['test'].nr_rows == 5
@@ -0,0 +1,94 @@
+import os
+import shutil
+import time
+
+import numpy as np
+import pytest
+
+import data
+
+
+def _touch_later(path):
+    """Moves the modification time ahead, as the test runs within a second."""
+    later = time.time() + 60
+    os.utime(path, (later, later))
+
+
+def _rewrite_dat_file(path, offset):
+    np.savetxt(path, np.loadtxt(path) + offset, fmt='%.6g')
+    _touch_later(path)
+
+
+def _assert_same_data(dataset, expected):
+    assert ([session.id for session in dataset['train']] ==
+            [session.id for session in expected['train']])
+    for session, expected_session in zip(dataset['train'], expected['train']):
+        assert session[:4] == expected_session[:4]
+        assert ([(interval.id, interval.time) for interval in session.intervals] ==
+                [(interval.id, interval.time) for interval in expected_session.intervals])
+        for interval, expected_interval in zip(session.intervals, expected_session.intervals):
+            assert interval.session.activity == session.activity
+            assert data._equal_rows(interval.data, expected_interval.data)
+    assert ([interval.id for interval in dataset['test']] ==
+            [interval.id for interval in expected['test']])
+    for interval, expected_interval in zip(dataset['test'], expected['test']):
+        assert data._equal_rows(interval.data, expected_interval.data)
+
+
+def _assert_same_stats(stats, expected):
+    assert sorted(stats['sessions']) == sorted(expected['sessions'])
+    for name in ('train', 'test'):
+        for field, value in expected[name]._asdict().iteritems():
+            np.testing.assert_allclose(getattr(stats[name], field), value)
+
+
+@pytest.fixture
+def data_folder(synthetic_folder, tmpdir):
+    folder = str(tmpdir.join('data'))
+    shutil.copytree(synthetic_folder, folder)
+    return folder
+
+
+def _create(folder, name, **kwargs):
+    path = os.path.join(folder, name)
+    data.create_pickled_data(
+        os.path.join(folder, 'Train'), os.path.join(folder, 'Test'), path,
+        num_workers=1, **kwargs)
+    return path
+
+
+def test_incremental_rebuild_matches_full_rebuild(data_folder):
+    path = _create(data_folder, 'incremental.pkl')
+
+    train_folder = os.path.join(data_folder, 'Train')
+    session_folder = data._get_all_session_folders(train_folder)[0]
+    _rewrite_dat_file(data._get_session_data_files(session_folder)[1], 1.)
+    test_files = sorted(data._get_all_test_filenames(os.path.join(data_folder, 'Test')))
+    _rewrite_dat_file(test_files[0], -1.)
+    os.remove(test_files[1])
+    activities_path = os.path.join(train_folder, data.ACTIVITIES_FILE_NAME)
+    with open(activities_path) as activities_file:
+        lines = activities_file.readlines()
+    session_id, activity = lines[-1].strip().split(',')
+    lines[-1] = '%s,%d\n' % (session_id, int(activity) % 4 + 1)
+    with open(activities_path, 'w') as activities_file:
+        activities_file.writelines(lines)
+    _touch_later(activities_path)
+
+    _create(data_folder, 'incremental.pkl')
+    full_path = _create(data_folder, 'full.pkl', incremental=False)
+
+    _assert_same_data(data.load_pickled_data(path), data.load_pickled_data(full_path))
+    _assert_same_stats(data.load_channel_stats(path), data.load_channel_stats(full_path))
+
+
+def test_keeping_the_old_pickle_reads_no_files(data_folder, monkeypatch):
+    path = _create(data_folder, 'data.pkl')
+    modified = os.path.getmtime(path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('The data files were read')
+    monkeypatch.setattr(data, '_build_manifest', fail)
+    monkeypatch.setattr(data, 'load_train', fail)
+    _create(data_folder, 'data.pkl', overwrite_old=False)
+    assert os.path.getmtime(path) == modified
@@ -0,0 +1,88 @@
+import warnings
+
+import numpy as np
+import pytest
+from sklearn import preprocessing
+
+import channel_stats
+
+import data_parser
+import data_preprocessing
+import pipeline as pipeline_module
+
+
+def _intervals(random_state, nr_intervals=6, nr_columns=4):
+    intervals = []
+    for _ in range(nr_intervals):
+        samples = random_state.randn(random_state.randint(5, 30), nr_columns)
+        samples[random_state.rand(*samples.shape) < 0.2] = np.nan
+        # Every column keeps at least one value
+        samples[0] = random_state.randn(nr_columns)
+        intervals.append(samples)
+    return intervals
+
+
+def test_same_as_imputer_per_interval():
+    intervals = _intervals(np.random.RandomState(0))
+    column_means = data_preprocessing.fit_column_means(intervals)
+    imputed = data_preprocessing.impute_samples([samples.copy() for samples in intervals], column_means)
+    with warnings.catch_warnings():
+        # The Imputer is deprecated in favour of impute.SimpleImputer
+        warnings.simplefilter('ignore', DeprecationWarning)
+        expected = [preprocessing.Imputer().fit_transform(samples) for samples in intervals]
+    for samples, expected_samples in zip(imputed, expected):
+        np.testing.assert_allclose(samples, expected_samples)
+
+
+def test_fit_column_means():
+    intervals = [np.array([[1., np.nan, np.nan], [3., 2., np.nan]]), np.array([[5., np.nan, np.nan]])]
+    np.testing.assert_allclose(data_preprocessing.fit_column_means(intervals), [3., 2., 0.])
+    assert data_preprocessing.fit_column_means([]) is None
+
+
+def test_missing_columns_do_not_depend_on_the_batch():
+    intervals = _intervals(np.random.RandomState(0))
+    column_means = data_preprocessing.fit_column_means(intervals)
+    missing = np.random.RandomState(1).randn(10, 4)
+    missing[:, 1] = np.nan
+
+    alone = data_preprocessing.impute_samples([missing.copy()], column_means)[0]
+    batched = data_preprocessing.impute_samples([samples.copy() for samples in intervals] + [missing.copy()],
+                                                column_means)[-1]
+    np.testing.assert_array_equal(alone[:, 1], column_means[1])
+    np.testing.assert_array_equal(alone, batched)
+
+
+def test_pipeline_does_not_depend_on_the_chunk_size(raw_dataset):
+    pipeline = pipeline_module.default_pipeline(number_components=3, chunk_size=16)
+    pipeline.fit(lambda: iter(raw_dataset['train']))
+    test = list(raw_dataset['test'])
+    missing = test[0].data.copy()
+    missing[:, 0] = np.nan
+    test[0] = test[0]._replace(data=missing)
+
+    expected = pipeline.predict(test)
+    for chunk_size in (1, 5):
+        pipeline.chunk_size = chunk_size
+        np.testing.assert_array_equal(pipeline.predict(test), expected)
+
+
+def test_handle_outliers_from_train_stats():
+    random_state = np.random.RandomState(0)
+    train_data = [data_parser.Interval(1, 1, random_state.randn(100, 4)) for _ in range(5)]
+    test_data = [random_state.randn(50, 4) * 3]
+    train_stats = channel_stats.merge(channel_stats.compute(interval.samples) for interval in train_data)
+    bounds = data_preprocessing.outlier_bounds_from_stats(train_stats)
+
+    clipped_train, clipped_test = data_preprocessing.handle_outliers(
+        train_data, [samples.copy() for samples in test_data], train_stats=train_stats)
+    for interval, clipped in zip(train_data, clipped_train):
+        np.testing.assert_array_equal(clipped.samples, np.clip(interval.samples, bounds[0], bounds[1]))
+    np.testing.assert_array_equal(clipped_test[0], np.clip(test_data[0], bounds[0], bounds[1]))
+
+
+@pytest.mark.parametrize('with_stats', [True, False])
+def test_train_sessions_only_with_channel_stats(with_stats):
+    stage = pipeline_module.OutlierStage(channel_stats={} if with_stats else None)
+    assert stage.uses_train_sessions == with_stats
+    assert 'uses_train_sessions' not in stage.get_state()
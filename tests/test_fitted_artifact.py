@@ -0,0 +1,56 @@
+
+import numpy as np
+import pytest
+
+import fitted_artifact
+import pipeline as pipeline_module
+
+
+def _fit(raw_dataset, clip=True):
+    pipeline = pipeline_module.default_pipeline(number_components=3, chunk_size=16)
+    if not clip:
+        pipeline.stages = [stage for stage in pipeline.stages
+                           if not isinstance(stage, pipeline_module.OutlierStage)]
+    return pipeline.fit(lambda: iter(raw_dataset['train']))
+
+
+@pytest.mark.parametrize('clip', [True, False])
+def test_predictions_match_the_pipeline(raw_dataset, clip):
+    pipeline = _fit(raw_dataset, clip)
+    artifact = fitted_artifact.from_pipeline(pipeline)
+    assert artifact.meta['nr_channels'] == 4
+    assert (artifact.bounds is not None) == clip
+    np.testing.assert_allclose(artifact.predict(raw_dataset['test']), pipeline.predict(raw_dataset['test']))
+
+
+def test_saved_artifact(raw_dataset, tmpdir):
+    pipeline = _fit(raw_dataset)
+    fitted_artifact.from_pipeline(pipeline).save(str(tmpdir))
+    artifact = fitted_artifact.load_artifact(str(tmpdir))
+    expected = pipeline.predict(raw_dataset['test'])
+    np.testing.assert_allclose(artifact.predict(raw_dataset['test']), expected)
+    np.testing.assert_allclose(
+        fitted_artifact.predict_stream(artifact, iter(raw_dataset['test']), batch_size=5), expected)
+
+
+def test_squeezed_intervals(raw_dataset):
+    artifact = fitted_artifact.from_pipeline(_fit(raw_dataset))
+    single_row = raw_dataset['test'][0].data[0]
+    np.testing.assert_allclose(artifact.predict([single_row]), artifact.predict([single_row[np.newaxis]]))
+
+
+@pytest.mark.parametrize('shape', [(40, 2), (40, 5), (3,), (40, 4, 1)])
+def test_wrong_number_of_channels(raw_dataset, shape):
+    artifact = fitted_artifact.from_pipeline(_fit(raw_dataset))
+    with pytest.raises(ValueError, match='Expected intervals of 4 channels'):
+        artifact.predict([raw_dataset['test'][0].data, np.zeros(shape)])
+
+
+def test_missing_channels_do_not_depend_on_the_batch(raw_dataset):
+    pipeline = _fit(raw_dataset)
+    artifact = fitted_artifact.from_pipeline(pipeline)
+    np.testing.assert_allclose(artifact.column_means, pipeline.stages[1].column_means)
+    missing = raw_dataset['test'][0].data.copy()
+    missing[:, 0] = np.nan
+    test = [missing] + [interval.data for interval in raw_dataset['test'][1:]]
+    np.testing.assert_array_equal(artifact.predict(test)[:1], artifact.predict([missing]))
@@ -0,0 +1,60 @@
+import collections
+
+import numpy as np
+import pytest
+from sklearn import linear_model as sk_linear_model
+
+import linear_model
+import streaming_ridge
+
+NR_FOLDS = 5
+
+
+@pytest.fixture
+def samples():
+    random_state = np.random.RandomState(0)
+    x = random_state.randn(3000, 6)
+    y = np.argmax(x[:, :3] + random_state.randn(3000, 3) * .5, axis=1) + 1
+    groups = np.repeat(np.arange(30), 100)
+    return x, y, groups
+
+
+def _expected_scores(x, y, groups):
+    scores = []
+    for test_indexes in linear_model.make_folds(len(y), NR_FOLDS, groups):
+        train = np.ones(len(y), dtype=bool)
+        train[test_indexes] = False
+        model = sk_linear_model.RidgeClassifier(alpha=1., fit_intercept=False).fit(x[train], y[train])
+        scores.append(model.score(x[test_indexes], y[test_indexes]))
+    return scores
+
+
+def test_folds_keep_groups_together(samples):
+    _, y, groups = samples
+    folds = linear_model.make_folds(len(y), NR_FOLDS, groups)
+    assert sorted(np.concatenate(folds)) == range(len(y))
+    for fold in folds:
+        assert not set(groups[fold]) & set(groups[np.setdiff1d(np.arange(len(y)), fold)])
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_k_fold_cv(samples, n_jobs):
+    x, y, groups = samples
+    results = linear_model.k_fold_cv(
+        sk_linear_model.RidgeClassifier(alpha=1., fit_intercept=False), x, y, NR_FOLDS, groups, n_jobs)
+    np.testing.assert_allclose([result.score for result in results], _expected_scores(x, y, groups))
+    assert [result.nr_train + result.nr_test for result in results] == [len(y)] * NR_FOLDS
+    assert linear_model._fold_buffer is None
+
+
+def test_streaming_k_fold_cv(samples):
+    x, y, groups = samples
+    model = streaming_ridge.StreamingRidgeClassifier(alphas=(1.,), classes=(1, 2, 3))
+    results = linear_model.k_fold_cv(model, x, y, NR_FOLDS, groups)
+    np.testing.assert_allclose([result.score for result in results], _expected_scores(x, y, groups))
+
+
+def test_intervals_without_session():
+    Interval = collections.namedtuple('Interval', ['subject', 'activity', 'samples', 'session'])
+    with pytest.raises(ValueError, match='rebuild the parsed and processed pickles'):
+        linear_model.build_groups([Interval(1, 1, np.zeros((3, 2)), None)])
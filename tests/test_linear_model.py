@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import data_parser
+import linear_model
+
+
+def _per_interval_predict(model, test_data):
+    """The prediction of every interval on its own, as before the intervals were stacked"""
+    predicts = []
+    for interval in test_data:
+        subjects = list(model.predict(interval))
+        predicts.append([subjects.count(subject) / (len(subjects) * 1.0)
+                         for subject in range(1, linear_model.NR_SUBJECTS + 1)])
+    return np.array(predicts)
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1, 50])
+def test_predict_matches_the_per_interval_votes(raw_dataset, chunk_size):
+    train_data, test_data = data_parser.parse_data(raw_dataset['train'], raw_dataset['test'])
+    model = linear_model.train_model(train_data)
+    expected = _per_interval_predict(model, test_data)
+    np.testing.assert_allclose(linear_model.predict(model, test_data, chunk_size), expected)
+    np.testing.assert_allclose(expected.sum(axis=1), 1.)
@@ -0,0 +1,18 @@
+import numpy as np
+from sklearn import linear_model as sk_linear_model
+
+import linear_model
+import model_search
+
+
+def test_search_releases_the_shared_data():
+    random_state = np.random.RandomState(0)
+    x = random_state.randn(300, 4)
+    y = np.argmax(x[:, :3], axis=1) + 1
+    groups = np.repeat(np.arange(10), 30)
+    candidates = [('ridge_alpha_%g' % alpha, sk_linear_model.RidgeClassifier(alpha=alpha, fit_intercept=False))
+                  for alpha in (1., 100.)]
+    results = model_search.search(x, y, groups, candidates, k=3, n_jobs=1)
+    assert sorted(result.name for result in results) == sorted(name for name, _ in candidates)
+    assert model_search._search_data is None
+    assert linear_model._fold_buffer is None
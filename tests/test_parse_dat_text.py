@@ -0,0 +1,62 @@
+import glob
+import os
+import StringIO
+import warnings
+
+import numpy as np
+import pytest
+
+import data
+
+
+def _loadtxt(content):
+    return np.loadtxt(StringIO.StringIO(content))
+
+
+@pytest.mark.parametrize('content', [
+    '1 2 3\n4 5 6\n',
+    '1 2\r\n3 4\r\n',
+    '  1\t2\n 3 4',
+    '1 2\n\n3 4\n',
+    '1 nan\ninf -inf\n',
+    '1 2 3',
+    '5\n6\n7\n',
+    '7',
+    '1 2\n# comment\n3 4\n',
+    '1 2 # comment\n3 4\n',
+])
+def test_same_as_loadtxt(content):
+    with warnings.catch_warnings():
+        # np.fromstring warns about the content it can not parse
+        warnings.simplefilter('ignore', DeprecationWarning)
+        parsed = data.parse_dat_text(content)
+    expected = _loadtxt(content)
+    assert parsed.shape == expected.shape
+    assert data._equal_rows(parsed, expected)
+
+
+@pytest.mark.parametrize('content', [
+    # As many values as a rectangle of the first line's width
+    '1 2 3\n4 5 6 7 8\n9\n',
+    '1 2\n3 4 5 6\n7 8\n',
+    '1 2\n3\n',
+])
+def test_ragged_lines_are_rejected(content):
+    with pytest.raises(ValueError):
+        _loadtxt(content)
+    with pytest.raises(ValueError):
+        data.parse_dat_text(content)
+
+
+def test_dtype():
+    assert data.parse_dat_text('1 2\n3 4\n', np.float32).dtype == np.float32
+
+
+def test_synthetic_files(synthetic_folder):
+    paths = sorted(glob.glob(os.path.join(synthetic_folder, 'Test', '*.dat')))
+    assert paths
+    for path in paths:
+        parsed = data._read_dat_file(path)
+        expected = np.loadtxt(path)
+        assert parsed.shape == expected.shape
+        assert data._equal_rows(parsed, expected)
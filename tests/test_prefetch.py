@@ -0,0 +1,65 @@
+import itertools
+import os
+import threading
+import time
+
+import pytest
+
+import data
+
+
+def test_order_and_read_ahead():
+    produced = []
+
+    def function(argument):
+        produced.append(argument)
+        return argument * 2
+
+    results = []
+    for result in data._prefetch(function, range(20), 2):
+        # Give the thread the time to run ahead as far as it can
+        time.sleep(0.01)
+        # This result, a full queue, and one result waiting to be queued
+        assert len(produced) - len(results) <= 1 + 2 + 1
+        results.append(result)
+    assert results == [argument * 2 for argument in range(20)]
+
+
+def test_early_close_stops_the_thread():
+    threads = threading.active_count()
+    calls = []
+    results = data._prefetch(calls.append, itertools.count(), 2)
+    next(results)
+    next(results)
+    results.close()
+    assert threading.active_count() == threads
+    nr_calls = len(calls)
+    time.sleep(0.05)
+    # The two results, a full queue, and one result waiting to be queued
+    assert len(calls) == nr_calls <= 2 + 2 + 1
+
+
+def test_errors_are_raised_in_order():
+    def function(argument):
+        if argument == 3:
+            raise ValueError('argument %d' % argument)
+        return argument
+
+    threads = threading.active_count()
+    results = []
+    with pytest.raises(ValueError, match='argument 3'):
+        for result in data._prefetch(function, range(10), 2):
+            results.append(result)
+    assert results == [0, 1, 2]
+    assert threading.active_count() == threads
+
+
+def test_iter_train_sessions(synthetic_folder):
+    train_folder = os.path.join(synthetic_folder, 'Train')
+    sessions = list(data.iter_train_sessions(train_folder, prefetch=1))
+    expected = sorted(data.load_train(train_folder, 1), key=lambda session: session.id)
+    assert [session.id for session in sessions] == [session.id for session in expected]
+    for session, expected_session in zip(sessions, expected):
+        assert session.activity == expected_session.activity
+        for interval, expected_interval in zip(session.intervals, expected_session.intervals):
+            assert data._equal_rows(interval.data, expected_interval.data)
@@ -0,0 +1,77 @@
+import httplib
+import json
+import threading
+
+import numpy as np
+import pytest
+
+import fitted_artifact
+import pipeline as pipeline_module
+import scoring_service
+
+
+@pytest.fixture(scope='module')
+def artifact(raw_dataset):
+    pipeline = pipeline_module.default_pipeline(number_components=3, chunk_size=16)
+    return fitted_artifact.from_pipeline(pipeline.fit(lambda: iter(raw_dataset['train'])))
+
+
+@pytest.fixture
+def server(artifact):
+    server = scoring_service.serve(artifact, port=0, max_wait=0.05)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.batcher.close()
+
+
+def _post(server, interval_data):
+    connection = httplib.HTTPConnection(*server.server_address)
+    content = '\n'.join(' '.join('%r' % value for value in row) for row in interval_data)
+    connection.request('POST', scoring_service.SCORE_PATH, content)
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    connection.close()
+    return response.status, body
+
+
+def test_score(server, artifact, raw_dataset):
+    interval_data = raw_dataset['test'][0].data
+    status, body = _post(server, interval_data)
+    assert status == 200
+    expected = artifact.predict([interval_data])[0]
+    np.testing.assert_allclose([body['subject_%d' % (subject + 1)] for subject in range(len(expected))],
+                               expected, atol=1e-6)
+
+
+def test_wrong_number_of_channels(server):
+    status, body = _post(server, np.zeros((40, 3)))
+    assert status == 400
+    assert body['error'] == 'Expected 4 channels, but got 3'
+
+
+def test_bad_interval_fails_alone(artifact, raw_dataset):
+    batcher = scoring_service.MicroBatcher(artifact.predict, max_wait=0.2)
+    intervals = [interval.data for interval in raw_dataset['test'][:4]]
+    intervals.insert(2, np.zeros((40, 3)))
+    results = [None] * len(intervals)
+
+    def score(index):
+        try:
+            results[index] = batcher.score(intervals[index])
+        except ValueError as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=score, args=(index,)) for index in range(len(intervals))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+    assert batcher.nr_batches == 1
+    assert isinstance(results[2], ValueError)
+    expected = artifact.predict(intervals[:2] + intervals[3:])
+    np.testing.assert_allclose(results[:2] + results[3:], expected)
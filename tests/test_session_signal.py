@@ -0,0 +1,37 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import data
+
+
+@pytest.fixture(scope='module')
+def sessions(synthetic_folder):
+    return data.load_train(os.path.join(synthetic_folder, 'Train'), 1)
+
+
+def _session_folder(synthetic_folder, session):
+    return glob.glob(os.path.join(synthetic_folder, 'Train', '*', session.id))[0]
+
+
+def test_signal_matches_the_interval_files(synthetic_folder, sessions):
+    for session in sessions:
+        assert session.signal is not None
+        data_files = data._get_session_data_files(_session_folder(synthetic_folder, session))
+        assert [interval.id for interval in session.intervals] == [os.path.basename(path) for path in data_files]
+        for interval, (start, stop), data_file in zip(session.intervals, session.offsets, data_files):
+            assert data._equal_rows(interval.data, data._read_dat_file(data_file))
+            assert np.shares_memory(interval.data, session.signal)
+            assert data._equal_rows(interval.data, session.signal[start:stop])
+        # Every overlap is stored only once
+        assert len(session.signal) < sum(len(interval.data) for interval in session.intervals)
+        assert len(session.signal) == session.offsets[-1, 1]
+
+
+def test_session_window(sessions):
+    session = sessions[0]
+    for interval in session.intervals:
+        window = data.session_window(session, interval.time, interval.time + data.INTERVAL_DURATION)
+        assert data._equal_rows(window, interval.data)
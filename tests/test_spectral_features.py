@@ -0,0 +1,28 @@
+import collections
+
+import numpy as np
+import pytest
+
+from individual.src import instrumentation
+import spectral_features
+
+Interval = collections.namedtuple('Interval', ['subject', 'activity', 'samples', 'session'])
+
+
+@pytest.mark.parametrize('enabled', [True, False])
+def test_extract_spectral_features(enabled, capsys):
+    random_state = np.random.RandomState(0)
+    train_data = [Interval(1, 1, random_state.randn(nr_rows, 3), 1) for nr_rows in (64, 100, 64)]
+    test_data = [random_state.randn(80, 3)]
+    instrumentation.set_enabled(enabled)
+    try:
+        train_features, test_features = spectral_features.extract_spectral_features(train_data, test_data)
+    finally:
+        instrumentation.set_enabled(True)
+
+    expected = spectral_features.interval_features([interval.samples for interval in train_data])
+    for interval, samples in zip(train_features, expected):
+        np.testing.assert_array_equal(interval.samples, samples)
+    lines = [line for line in capsys.readouterr().out.splitlines() if 'windows/s' in line]
+    assert lines[0].startswith('%d windows of 3 intervals' % sum(len(samples) for samples in expected))
+    assert lines[1].startswith('%d windows of 1 intervals' % len(test_features[0]))
@@ -0,0 +1,84 @@
+import warnings
+
+import numpy as np
+import pytest
+from sklearn import exceptions
+from sklearn import linear_model
+
+import streaming_ridge
+
+CLASSES = (1, 2, 3)
+
+
+@pytest.fixture
+def samples():
+    random_state = np.random.RandomState(0)
+    x = random_state.randn(600, 5)
+    y = np.argmax(x[:, :3] + random_state.randn(600, 3), axis=1) + 1
+    groups = np.repeat(np.arange(6), 100)
+    return x, y, groups
+
+
+@pytest.mark.parametrize('alpha', [0.1, 1., 10.])
+def test_matches_ridge_classifier_cv(samples, alpha):
+    x, y, groups = samples
+    expected = linear_model.RidgeClassifierCV(alphas=(alpha,), fit_intercept=False).fit(x, y)
+    model = streaming_ridge.StreamingRidgeClassifier(alphas=(alpha,), classes=CLASSES).fit(x, y, groups)
+    np.testing.assert_allclose(model.coef_, expected.coef_, atol=1e-10)
+    np.testing.assert_allclose(model.decision_function(x), expected.decision_function(x), atol=1e-10)
+    np.testing.assert_array_equal(model.predict(x), expected.predict(x))
+
+
+def test_streaming_matches_fit(samples):
+    x, y, groups = samples
+    model = streaming_ridge.StreamingRidgeClassifier(classes=CLASSES)
+    for start in range(0, len(x), 50):
+        model.partial_fit(x[start:start + 50], y[start:start + 50], groups[start])
+    model.solve()
+    expected = streaming_ridge.StreamingRidgeClassifier(classes=CLASSES).fit(x, y, groups)
+    assert model.alpha_ == expected.alpha_
+    np.testing.assert_allclose(model.coef_, expected.coef_)
+
+
+def test_leave_one_session_out_errors(samples):
+    x, y, groups = samples
+    alphas = (0.1, 10.)
+    model = streaming_ridge.StreamingRidgeClassifier(alphas=alphas, classes=CLASSES).fit(x, y, groups)
+    errors = model.leave_one_session_out_errors()
+    for group in np.unique(groups):
+        train = groups != group
+        targets = -np.ones((len(y), len(CLASSES)))
+        targets[np.arange(len(y)), y - 1] = 1
+        for alpha, error in zip(alphas, errors[group]):
+            ridge = linear_model.Ridge(alpha=alpha, fit_intercept=False).fit(x[train], targets[train])
+            expected = np.square(ridge.predict(x[~train]) - targets[~train]).sum()
+            np.testing.assert_allclose(error, expected)
+    assert model.alpha_ == alphas[int(np.argmin(np.sum(errors.values(), axis=0)))]
+
+
+def test_not_fitted():
+    model = streaming_ridge.StreamingRidgeClassifier()
+    assert not hasattr(model, 'classes_')
+    with pytest.raises(exceptions.NotFittedError):
+        model.solve()
+    with pytest.raises(exceptions.NotFittedError):
+        model.predict(np.zeros((1, 5)))
+
+
+def test_warns_without_sessions(samples):
+    x, y, _ = samples
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        model = streaming_ridge.StreamingRidgeClassifier(alphas=(1., 10.), classes=CLASSES).fit(x, y)
+    assert model.alpha_ == 1.
+    assert any('at least two sessions' in str(warning.message) for warning in caught)
+
+
+@pytest.mark.parametrize('label', [0., 4., 2.5])
+def test_unknown_labels(samples, label):
+    x, y, _ = samples
+    y = y.astype(float)
+    y[0] = label
+    model = streaming_ridge.StreamingRidgeClassifier(classes=CLASSES)
+    with pytest.raises(ValueError, match=r'Labels \[%r\] are not in the classes \[1, 2, 3\]' % label):
+        model.partial_fit(x, y)